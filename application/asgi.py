@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings')
+os.environ.setdefault('MUSICSHOP_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+if getattr(settings, 'TEMPLATE_WARMUP', False):
+    from utils.templates import warm_templates
+
+    warm_templates()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'musicshop.perf.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,7 +56,7 @@ ROOT_URLCONF = 'application.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'musicshop.perf.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -62,13 +66,20 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'musicshop.context_processors.fragment_cache',
             ],
         },
     },
 ]
 
+# Компиляция всех шаблонов при запуске wsgi/asgi (utils.templates)
+TEMPLATE_WARMUP = False
+
 WSGI_APPLICATION = 'application.wsgi.application'
 
+# Асинхронные представления (musicshop.async_views) - включаются в asgi.py
+ASYNC_VIEWS = os.environ.get('MUSICSHOP_ASYNC_VIEWS') == '1'
+
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
@@ -79,24 +90,83 @@ DATABASES = {
     }
 }
 
+# PRAGMA для каждого нового соединения SQLite (musicshop.signals)
+SQLITE_PRAGMAS = {}
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Кэш общий для всех процессов: версии страниц каталога, снимок
+# витрины, поколения поиска и фасетов, замеры perf меняются в одном
+# процессе (админка, runworkers), а читаются в других. Кэш в памяти
+# процесса (LocMemCache) для них не поддерживается - изменения не
+# дошли бы до веб-воркеров (проверка musicshop.W001)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'MUSICSHOP_CACHE_LOCATION', BASE_DIR / 'var' / 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Кэш страниц каталога: инвалидация по версиям объектов (musicshop.cache)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Фоновые задачи (musicshop.jobs): True - выполнять сразу, без воркеров
+JOBS_EAGER = False
+
+# Резерв товара под неподтверждённый заказ (musicshop.checkout), секунды
+STOCK_RESERVATION_TIMEOUT = 60 * 15
+
+# Корзина без входа в подписанной cookie (musicshop.anonymous_cart)
+ANONYMOUS_CART_MAX_AGE = 60 * 60 * 24 * 30
+
+# Наибольшее количество одного альбома в позиции корзины (musicshop.cart)
+CART_MAX_QTY = 99
+
+# Замеры запросов (musicshop.perf): доля замеряемых запросов, заголовок
+# Server-Timing, сброс гистограмм в кэш (секунды) и срок их хранения
+PERF_SAMPLE_RATE = 1.0
+PERF_SERVER_TIMING = True
+PERF_CACHE_ALIAS = 'default'
+PERF_FLUSH_INTERVAL = 10
+PERF_RETENTION = 60 * 60
+
+# Админка (musicshop.admin): кэш числа строк changelist (секунды), порог
+# оценки COUNT по статистике PostgreSQL и предел запросов к БД на страницу
+ADMIN_COUNT_CACHE_ALIAS = 'default'
+ADMIN_COUNT_CACHE_TIMEOUT = 60
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100_000
+ADMIN_QUERY_BUDGET = 15
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
 AUTH_PASSWORD_VALIDATORS = [
     {
-        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'UserAttributeSimilarityValidator'),
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'MinimumLengthValidator'),
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'CommonPasswordValidator'),
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'NumericPasswordValidator'),
     },
 ]
 
+LOGIN_URL = 'login'
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -123,6 +193,96 @@ STATICFILES_DIRS = (
     (BASE_DIR / 'static_dev'),
 )
 
+# Раздача STATIC_ROOT (после collectstatic) и MEDIA_ROOT самим
+# приложением (utils.staticfiles); за nginx или CDN - False. Срок кэша
+# для файлов без хэша в имени, секунды
+SERVE_FILES = True
+STATIC_MAX_AGE = 60 * 60
+MEDIA_MAX_AGE = 60 * 60 * 24
+
+# Загруженные изображения (utils.media_storage): по хэшу содержимого,
+# одинаковые файлы хранятся один раз (blobs/ab/cd/<sha256>.<ext>).
+# MEDIA_CONTENT_ADDRESSED = False - прежние пути по слагу объекта.
+# Файл без ссылок gc_media удаляет через MEDIA_GC_GRACE секунд
+DEFAULT_FILE_STORAGE = 'utils.media_storage.ContentAddressedStorage'
+MEDIA_CONTENT_ADDRESSED = True
+MEDIA_GC_GRACE = 60 * 60 * 24
+
+# Варианты загруженных изображений (utils.images): ширины, px, и форматы
+IMAGE_VARIANT_WIDTHS = (200, 400, 800)
+IMAGE_VARIANT_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+# Профиль окружения: MUSICSHOP_PROFILE=production - боевые настройки,
+# параметры сервера и БД - из переменных окружения MUSICSHOP_*
+PROFILE = os.environ.get('MUSICSHOP_PROFILE', 'development')
+
+if PROFILE == 'production':
+    DEBUG = False
+    # ключ из репозитория известен всем: подписи cookie корзины и сессий
+    # с ним можно подделать, поэтому без своего ключа сервер не стартует
+    SECRET_KEY = os.environ.get('MUSICSHOP_SECRET_KEY')
+    if not SECRET_KEY:
+        raise ImproperlyConfigured(
+            'MUSICSHOP_SECRET_KEY не задан: в профиле production ключ '
+            'из репозитория не используется')
+    ALLOWED_HOSTS = os.environ.get(
+        'MUSICSHOP_ALLOWED_HOSTS', ','.join(ALLOWED_HOSTS)).split(',')
+
+    # Постоянные соединения: одно на поток на CONN_MAX_AGE секунд,
+    # перед запросом проверяется, живо ли оно (CONN_HEALTH_CHECKS).
+    # Для пула между потоками - ENGINE utils.db_backends.*_pooled
+    DATABASES['default'].update({
+        'ENGINE': os.environ.get(
+            'MUSICSHOP_DB_ENGINE', DATABASES['default']['ENGINE']),
+        'NAME': os.environ.get(
+            'MUSICSHOP_DB_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('MUSICSHOP_DB_USER', ''),
+        'PASSWORD': os.environ.get('MUSICSHOP_DB_PASSWORD', ''),
+        'HOST': os.environ.get('MUSICSHOP_DB_HOST', ''),
+        'PORT': os.environ.get('MUSICSHOP_DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('MUSICSHOP_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {'MAX_IDLE': 10, 'MAX_LIFETIME': 60 * 60},
+    })
+
+    # Несколько серверов - общий memcached, например
+    # MUSICSHOP_CACHE_BACKEND=\
+    #     django.core.cache.backends.memcached.PyMemcacheCache
+    # MUSICSHOP_CACHE_LOCATION=127.0.0.1:11211
+    if os.environ.get('MUSICSHOP_CACHE_BACKEND'):
+        CACHES['default'] = {
+            'BACKEND': os.environ['MUSICSHOP_CACHE_BACKEND'],
+            'LOCATION': os.environ.get('MUSICSHOP_CACHE_LOCATION', ''),
+        }
+
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'busy_timeout': 5000,
+    }
+
+    # Шаблоны разбираются один раз на процесс (cached loader) и
+    # компилируются заранее при запуске, а не первыми запросами
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS'].update({
+        'debug': False,
+        'loaders': [('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ])],
+    })
+    TEMPLATE_WARMUP = True
+
+    # Хэш содержимого в именах статики и сжатые заранее .gz/.br варианты
+    STATICFILES_STORAGE = (
+        'utils.staticfiles.CompressedManifestStaticFilesStorage')
+
+    # Замеряется 1% запросов, время ответа наружу не отдаётся
+    PERF_SAMPLE_RATE = float(
+        os.environ.get('MUSICSHOP_PERF_SAMPLE_RATE', 0.01))
+    PERF_SERVER_TIMING = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -14,17 +14,17 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
 
-urlpatterns = [
+from utils.staticfiles import file_urlpatterns
+
+# Файлы - раньше магазина: его url со слагами перехватывают почти всё
+urlpatterns = file_urlpatterns() + [
     path('admin/', admin.site.urls),
     path('', include('musicshop.urls'))
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(
-        settings.STATIC_URL, document_root=settings.STATICFILES_DIRS)
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns = staticfiles_urlpatterns() + urlpatterns
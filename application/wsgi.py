@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings')
 
 application = get_wsgi_application()
+
+if getattr(settings, 'TEMPLATE_WARMUP', False):
+    from utils.templates import warm_templates
+
+    warm_templates()
@@ -0,0 +1,81 @@
+"""Подготовка окружения Django для скриптов бенчмарков"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup(async_views=None):
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    # свой пустой кэш на прогон: страницы и снимок из кэша разработки
+    # или прошлого прогона на другой БД не должны попасть в замеры
+    if 'MUSICSHOP_CACHE_LOCATION' not in os.environ:
+        cache_dir = tempfile.mkdtemp(prefix='musicshop-bench-cache-')
+        atexit.register(shutil.rmtree, cache_dir, ignore_errors=True)
+        os.environ['MUSICSHOP_CACHE_LOCATION'] = cache_dir
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings')
+    if async_views is not None:
+        os.environ['MUSICSHOP_ASYNC_VIEWS'] = '1' if async_views else '0'
+    import django
+    django.setup()
+
+
+@contextmanager
+def temporary_database(wal=False):
+    """
+    Отдельная временная БД SQLite с применёнными миграциями, чтобы
+    бенчмарк не менял рабочие данные (wal - режим журнала WAL)
+    """
+    from django.conf import settings
+    from django.db import connection
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = settings.DATABASES['default']
+        database['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        database.setdefault('OPTIONS', {})['timeout'] = 30
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        if wal:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+        try:
+            yield
+        finally:
+            connection.close()
+
+
+@contextmanager
+def persistent_database(path):
+    """
+    БД SQLite в файле path, которая переживает запуск (сгенерированные
+    данные большого объёма не создаются заново). Возвращает True, если
+    БД создана сейчас и её нужно заполнить
+    """
+    from django.conf import settings
+    from django.db import connection
+
+    path = os.path.abspath(path)
+    created = not os.path.exists(path)
+    database = settings.DATABASES['default']
+    database['TEST']['NAME'] = path
+    database.setdefault('OPTIONS', {})['timeout'] = 30
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=True)
+    try:
+        yield created
+    finally:
+        connection.close()
+
+
+def percentile(values, pct):
+    """Перцентиль по отсортированной копии (pct - от 0 до 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
@@ -0,0 +1,135 @@
+"""
+Число запросов к БД на страницах админки: список (changelist) и форма
+объекта каждой зарегистрированной модели на данных benchmarks.datagen.
+Предел - query_budget админки (ShopModelAdmin, ADMIN_QUERY_BUDGET);
+прогон завершается с кодом 1, если какая-то страница его превысила,
+то есть число запросов растёт с числом строк на странице.
+
+    python -m benchmarks.admin_pages --scale small --database /tmp/small.sqlite3
+
+Заказов, уведомлений и изображений галереи генератор не создаёт - их
+немного (PAGE_ROWS) добавляется в ту же БД при первом запуске.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+from benchmarks import datagen
+from benchmarks._django import persistent_database, setup
+
+ADMIN_USERNAME = 'bench-admin'
+
+# Строк на страницу списка: больше, чем list_per_page не нужно
+PAGE_ROWS = 100
+
+
+def ensure_rows():
+    """Заказы, уведомления и изображения, которых нет в данных генератора"""
+    from musicshop.models import (
+        Album, Cart, Customer, ImageGallery, Notification, Order)
+    from django.contrib.contenttypes.models import ContentType
+
+    if not Order.objects.exists():
+        Order.objects.bulk_create([
+            Order(customer_id=cart.owner_id, cart=cart, first_name='Имя',
+                  last_name='Фамилия', phone='0', address='Адрес',
+                  order_date=date.today())
+            for cart in Cart.objects.order_by('id')[:PAGE_ROWS]])
+    if not Notification.objects.exists():
+        Notification.objects.bulk_create([
+            Notification(recipient_id=customer_id, text='Уведомление')
+            for customer_id in Customer.objects.order_by('id').values_list(
+                'id', flat=True)[:PAGE_ROWS]])
+    if not ImageGallery.objects.exists():
+        content_type = ContentType.objects.get_for_model(Album)
+        ImageGallery.objects.bulk_create([
+            ImageGallery(content_type=content_type, object_id=album_id,
+                         image=f'gallery/{album_id}.jpg')
+            for album_id in Album.objects.order_by('id').values_list(
+                'id', flat=True)[:PAGE_ROWS]])
+
+
+def admin_pages():
+    """(название, путь, админка) для списка и формы каждой модели"""
+    from django.contrib import admin
+    from django.urls import reverse
+
+    for model, model_admin in admin.site._registry.items():
+        if not hasattr(model_admin, 'get_query_budget'):
+            continue
+        opts = model._meta
+        name = f'{opts.app_label}_{opts.model_name}'
+        yield (f'{opts.model_name} список',
+               reverse(f'admin:{name}_changelist'), model_admin)
+        pk = model._default_manager.order_by('pk').values_list(
+            'pk', flat=True).first()
+        if pk is not None:
+            yield (f'{opts.model_name} форма',
+                   reverse(f'admin:{name}_change', args=[pk]), model_admin)
+
+
+def run(requests):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    user, _ = get_user_model().objects.get_or_create(
+        username=ADMIN_USERNAME,
+        defaults={'is_staff': True, 'is_superuser': True})
+    client = Client()
+    client.force_login(user)
+    over_budget = 0
+    for title, path, model_admin in admin_pages():
+        timings, queries = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(path)
+            timings.append(time.perf_counter() - started)
+            queries = max(queries, len(context.captured_queries))
+            assert response.status_code == 200, (path, response.status_code)
+        budget = model_admin.get_query_budget()
+        line = (f'{title:32} запросов {queries:3} (предел {budget})  '
+                f'{min(timings) * 1000:8.2f} мс')
+        if queries > budget:
+            over_budget += 1
+            line += '  ПРЕВЫШЕН ПРЕДЕЛ'
+        print(line)
+    return over_budget
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--database', required=True,
+                        help='Файл SQLite со сгенерированными данными')
+    parser.add_argument('--scale', choices=datagen.SCALES, default='small')
+    parser.add_argument('--requests', type=int, default=3,
+                        help='Запросов на страницу (время - лучшее из них)')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+
+    settings.DEBUG = False
+    settings.PERF_SAMPLE_RATE = 0
+    settings.ALLOWED_HOSTS += ['testserver']
+
+    with persistent_database(args.database) as created:
+        if created:
+            try:
+                datagen.generate(args.scale, stdout=sys.stdout)
+            except BaseException:
+                os.unlink(args.database)
+                raise
+        ensure_rows()
+        over_budget = run(args.requests)
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Пропускная способность WSGI и ASGI при большом числе медленных клиентов.
+
+Оба приложения вызываются в процессе, без сетевого сервера. Медленный
+клиент моделируется задержкой при отправке тела ответа:
+- WSGI: ответ пишет поток-воркер, пока клиент не примет данные, поток
+  занят (пул из --workers потоков, как у gunicorn --threads);
+- ASGI: send() ждёт в цикле событий и не держит поток.
+
+    python -m benchmarks.asgi_vs_wsgi --path /some-artist/ --clients 200
+"""
+import argparse
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._django import percentile, setup
+
+HOST = 'localhost'
+
+
+def wsgi_run(path, clients, workers, client_delay):
+    setup(async_views=False)
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+
+    def request():
+        started = time.perf_counter()
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST,
+            'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        }
+        status = []
+        body = application(environ, lambda s, h, e=None: status.append(s))
+        for _ in body:
+            time.sleep(client_delay)  # клиент медленно принимает ответ
+        body.close()
+        return time.perf_counter() - started, int(status[0].split()[0])
+
+    return _run_threads(request, clients, workers)
+
+
+def _run_threads(request, clients, workers):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: request(), range(clients)))
+    return time.perf_counter() - started, results
+
+
+def asgi_run(path, clients, client_delay):
+    setup(async_views=True)
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+
+    async def request():
+        started = time.perf_counter()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'headers': [(b'host', HOST.encode())],
+            'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+        }
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            else:
+                await asyncio.sleep(client_delay)
+
+        await application(scope, receive, send)
+        return time.perf_counter() - started, status[0]
+
+    async def run_all():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(request() for _ in range(clients)))
+        return time.perf_counter() - started, results
+
+    return asyncio.run(run_all())
+
+
+def report(name, elapsed, results, clients):
+    latencies = [latency for latency, _ in results]
+    statuses = sorted({str(status) for _, status in results})
+    print(f'{name}: {clients / elapsed:8.1f} req/s, '
+          f'p50 {percentile(latencies, 50) * 1000:7.1f} ms, '
+          f'p95 {percentile(latencies, 95) * 1000:7.1f} ms, '
+          f'статусы: {", ".join(statuses)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='потоков WSGI-сервера')
+    parser.add_argument('--client-delay', type=float, default=0.2,
+                        help='задержка медленного клиента, с')
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'),
+                        help='только один режим (настройки читаются один '
+                             'раз на процесс, поэтому для чистого сравнения '
+                             'режимы лучше запускать отдельно)')
+    args = parser.parse_args()
+
+    if args.mode in (None, 'wsgi'):
+        elapsed, results = wsgi_run(
+            args.path, args.clients, args.workers, args.client_delay)
+        report('WSGI', elapsed, results, args.clients)
+    if args.mode in (None, 'asgi'):
+        elapsed, results = asgi_run(args.path, args.clients, args.client_delay)
+        report('ASGI', elapsed, results, args.clients)
+
+
+if __name__ == '__main__':
+    main()
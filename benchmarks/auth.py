@@ -0,0 +1,128 @@
+"""
+Вход и регистрация: сколько хэшей пароля и запросов на одну операцию
+и сколько операций в секунду выдерживает одно ядро.
+
+"было" - прежний путь: LoginForm.clean() проверял пароль, затем
+authenticate() искал пользователя и считал хэш повторно; регистрация
+сохраняла пользователя дважды и снова вызывала authenticate().
+"стало" - текущие формы musicshop.forms. Хэшер - из настроек (PBKDF2
+с рабочим числом итераций), БД - временная.
+
+    python -m benchmarks.auth --repeat 20
+"""
+import argparse
+import time
+
+from benchmarks._django import setup, temporary_database
+
+PASSWORD = 'correct horse battery staple'
+
+
+class HashCounter:
+    """Подсчёт вычислений хэша пароля (encode у всех хэшеров)"""
+
+    def __init__(self):
+        from django.contrib.auth.hashers import get_hashers
+        self.count = 0
+        for hasher in get_hashers():
+            self._wrap(hasher)
+
+    def _wrap(self, hasher):
+        encode = hasher.encode
+
+        def counted(*args, **kwargs):
+            self.count += 1
+            return encode(*args, **kwargs)
+
+        hasher.encode = counted
+
+
+def legacy_login(username):
+    from django.contrib.auth import authenticate, get_user_model
+    User = get_user_model()
+    user = User.objects.filter(username=username).first()
+    assert user.check_password(PASSWORD)
+    assert authenticate(username=username, password=PASSWORD)
+
+
+def current_login(username):
+    from musicshop.forms import LoginForm
+    form = LoginForm({'username': username, 'password': PASSWORD})
+    assert form.is_valid() and form.user
+
+
+def registration_data(username):
+    return {
+        'username': username, 'password': PASSWORD,
+        'confirm_password': PASSWORD, 'first_name': 'Имя',
+        'last_name': 'Фамилия', 'email': f'{username}@example.com',
+        'phone': '', 'address': '',
+    }
+
+
+def legacy_registration(username):
+    from django.contrib.auth import authenticate
+
+    from musicshop.forms import RegistrationsForm
+    form = RegistrationsForm(registration_data(username))
+    assert form.is_valid(), form.errors
+    # прежняя версия формы не переопределяла save()
+    user = super(RegistrationsForm, form).save(commit=False)
+    user.save()
+    user.set_password(PASSWORD)
+    user.save()
+    assert authenticate(username=username, password=PASSWORD)
+
+
+def current_registration(username):
+    from django.db import transaction
+
+    from musicshop.forms import RegistrationsForm
+    form = RegistrationsForm(registration_data(username))
+    assert form.is_valid(), form.errors
+    with transaction.atomic():
+        form.save()
+
+
+def measure(func, names, hashes):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    hashes.count = 0
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as context:
+        for name in names:
+            func(name)
+    elapsed = time.perf_counter() - started
+    return (len(names) / elapsed, hashes.count / len(names),
+            len(context.captured_queries) / len(names))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup()
+    from django.contrib.auth import get_user_model
+
+    with temporary_database():
+        User = get_user_model()
+        User.objects.create_user('buyer', password=PASSWORD)
+        hashes = HashCounter()
+        logins = ['buyer'] * args.repeat
+        cases = (
+            ('вход', 'было', legacy_login, logins),
+            ('вход', 'стало', current_login, logins),
+            ('регистрация', 'было', legacy_registration,
+             [f'legacy{number}' for number in range(args.repeat)]),
+            ('регистрация', 'стало', current_registration,
+             [f'current{number}' for number in range(args.repeat)]),
+        )
+        for operation, label, func, names in cases:
+            rate, per_hashes, per_queries = measure(func, names, hashes)
+            print(f'{operation:12} {label:6} {rate:8.1f} оп/с на ядро, '
+                  f'хэшей {per_hashes:.0f}, запросов {per_queries:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Параллельное оформление заказов на товар с ограниченным остатком.
+
+Запускается на отдельной временной БД SQLite в режиме WAL: N покупателей
+в T потоках одновременно оформляют корзины с одним и тем же альбомом.
+Проверяется, что продано не больше остатка и что остаток сходится
+с резервами; выводится число заказов в секунду.
+
+SQLite допускает одного пишущего: при конфликте транзакция получает
+"database is locked" и повторяется (как сделал бы клиент), число
+повторов выводится отдельно.
+
+    python -m benchmarks.checkout_concurrency --buyers 200 --threads 16 \
+        --stock 50
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._django import percentile, setup, temporary_database
+
+MAX_RETRIES = 50
+
+
+def prepare(buyers, stock, qty):
+    from datetime import date
+
+    from django.contrib.auth import get_user_model
+
+    from musicshop.cart import CartService
+    from musicshop.models import Album, Artist, Customer, Genre, MediaType
+
+    genre = Genre.objects.create(name='Genre', slug='genre')
+    media_type = MediaType.objects.create(name='CD')
+    artist = Artist.objects.create(name='Artist', slug='artist', genre=genre)
+    album = Album.objects.create(
+        artist=artist, name='Flash sale', slug='flash-sale',
+        media_type=media_type, songs_list='', release_date=date.today(),
+        price=10, stock=stock)
+    User = get_user_model()
+    carts = []
+    for number in range(buyers):
+        user = User.objects.create(username=f'buyer{number}')
+        service = CartService.for_customer(
+            Customer.objects.create(user=user, phone=''))
+        service.add(album, qty)
+        carts.append(service.cart)
+    return album, carts
+
+
+def run(carts, threads):
+    from django.db import OperationalError, connection
+
+    from musicshop.checkout import OutOfStock, checkout
+
+    lock = threading.Lock()
+    stats = {'orders': 0, 'out_of_stock': 0, 'retries': 0}
+    timings = []
+
+    def buy(cart):
+        started = time.perf_counter()
+        try:
+            for attempt in range(MAX_RETRIES):
+                try:
+                    checkout(cart, first_name='A', last_name='B', phone='1',
+                             buying_type='self')
+                    result = 'orders'
+                    break
+                except OutOfStock:
+                    result = 'out_of_stock'
+                    break
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    with lock:
+                        stats['retries'] += 1
+                    time.sleep(random.uniform(0, 0.005 * (attempt + 1)))
+            else:
+                raise RuntimeError('Превышено число повторов')
+            with lock:
+                stats[result] += 1
+                timings.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(buy, carts))
+    return time.perf_counter() - started, stats, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buyers', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=50)
+    parser.add_argument('--qty', type=int, default=1)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.db.models import Sum
+
+    from musicshop.models import Order, StockReservation
+
+    # фоновые задачи (снятие резервов, уведомления) не выполняются
+    settings.JOBS_EAGER = False
+    with temporary_database(wal=True):
+        album, carts = prepare(args.buyers, args.stock, args.qty)
+        elapsed, stats, timings = run(carts, args.threads)
+        album.refresh_from_db()
+        reserved = StockReservation.objects.aggregate(
+            total=Sum('qty'))['total']
+        orders = Order.objects.count()
+    sold = stats['orders'] * args.qty
+    print(f'покупателей {args.buyers}, потоков {args.threads}, '
+          f'остаток {args.stock}, по {args.qty} шт.')
+    print(f'заказов {stats["orders"]}, отказов (нет товара) '
+          f'{stats["out_of_stock"]}, повторов "database is locked" '
+          f'{stats["retries"]}')
+    print(f'{stats["orders"] / elapsed:.1f} заказов/с, p50 '
+          f'{percentile(timings, 50) * 1000:.1f} мс, p95 '
+          f'{percentile(timings, 95) * 1000:.1f} мс')
+    print(f'остаток после распродажи {album.stock}, в резервах '
+          f'{reserved or 0}, заказов в БД {orders}')
+    oversold = sold > args.stock or album.stock + sold != args.stock
+    if oversold or (reserved or 0) != sold:
+        raise SystemExit('ОШИБКА: остаток не сходится с проданным')
+    print('перепродажи нет')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Цена установки соединения с БД на запрос: закрытие после каждого
+запроса, постоянные соединения и пул (utils.db_backends.sqlite3_pooled).
+
+Каждый режим запускается в отдельном процессе с профилем production
+(MUSICSHOP_PROFILE=production, PRAGMA SQLite из настроек) на временной
+БД. Запросы идут через WSGI-обработчик Django, как под gunicorn
+с потоками, поэтому соединения закрываются и открываются так же,
+как в бою.
+
+    python -m benchmarks.connections --requests 2000 --threads 8
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._django import BASE_DIR, percentile, setup, temporary_database
+
+MODES = {
+    'close': {'MUSICSHOP_CONN_MAX_AGE': '0'},
+    'persistent': {'MUSICSHOP_CONN_MAX_AGE': '600'},
+    'pooled': {'MUSICSHOP_CONN_MAX_AGE': '0',
+               'MUSICSHOP_DB_ENGINE': 'utils.db_backends.sqlite3_pooled'},
+}
+
+
+def seed():
+    from datetime import date
+
+    from musicshop.models import Album, Artist, Genre, MediaType
+
+    genre = Genre.objects.create(name='Genre', slug='genre')
+    media_type = MediaType.objects.create(name='CD')
+    artist = Artist.objects.create(name='Artist', slug='artist', genre=genre)
+    Album.objects.bulk_create([
+        Album(artist=artist, name=f'Album {number}', slug=f'album-{number}',
+              media_type=media_type, songs_list='', price=number % 50,
+              release_date=date(2000 + number % 20, 1, 1), stock=1)
+        for number in range(100)
+    ])
+    return f'/catalog/artist/{artist.slug}/'
+
+
+class ConnectTimer:
+    """Время, проведённое в установке соединений (connect())"""
+
+    def __init__(self):
+        from django.db.backends.base.base import BaseDatabaseWrapper
+        self.count = 0
+        self.seconds = 0.0
+        connect = BaseDatabaseWrapper.connect
+
+        def timed(wrapper):
+            started = time.perf_counter()
+            try:
+                return connect(wrapper)
+            finally:
+                self.count += 1
+                self.seconds += time.perf_counter() - started
+
+        BaseDatabaseWrapper.connect = timed
+
+
+def run_mode(requests, threads):
+    setup()
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection
+
+    from utils.db_backends.pool import pool_stats
+
+    with temporary_database():
+        path = seed()
+        connection.close()
+        settings.ALLOWED_HOSTS.append('localhost')
+        application = get_wsgi_application()
+        timer = ConnectTimer()
+
+        def request(_):
+            started = time.perf_counter()
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path,
+                'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            }
+            status = []
+            body = application(
+                environ, lambda s, h, e=None: status.append(s))
+            b''.join(body)
+            body.close()
+            assert status[0].startswith('200'), status
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            timings = list(pool.map(request, range(requests)))
+        elapsed = time.perf_counter() - started
+    return {
+        'rps': requests / elapsed,
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'connects': timer.count,
+        'connect_seconds': timer.seconds,
+        'pool': pool_stats().get('default'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.requests, args.threads)))
+        return
+
+    for mode, env in MODES.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.connections', '--mode', mode,
+             '--requests', str(args.requests),
+             '--threads', str(args.threads)],
+            cwd=BASE_DIR, check=True, capture_output=True, text=True,
+            # ключ только для временной БД замера
+            env={'MUSICSHOP_SECRET_KEY': 'benchmark', **os.environ,
+                 'MUSICSHOP_PROFILE': 'production', **env},
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        per_connect = (result['connect_seconds'] / result['connects'] * 1000
+                       if result['connects'] else 0)
+        print(f'{mode:11} {result["rps"]:8.1f} req/s  '
+              f'p50 {result["p50"] * 1000:6.2f} мс  '
+              f'p95 {result["p95"] * 1000:6.2f} мс  '
+              f'connect() {result["connects"]:5} раз, '
+              f'{per_connect:.3f} мс каждый'
+              + (f', пул: {result["pool"]}' if result['pool'] else ''))
+
+
+if __name__ == '__main__':
+    main()
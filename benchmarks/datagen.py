@@ -0,0 +1,178 @@
+"""
+Генератор данных магазина для бенчмарков: жанры, носители, исполнители,
+альбомы, покупатели с корзинами. Данные воспроизводимы (фиксированный
+seed), объём задаётся масштабом:
+
+    small   100 исполнителей,   1 000 альбомов,    10 000 позиций корзин
+    medium  1 000,             10 000,            100 000
+    large   10 000,           100 000,          1 000 000
+
+Вставка - bulk_create пачками с заранее заданными id (SQLite не
+возвращает id из bulk_create), сигналы моделей не срабатывают, поэтому
+кэш каталога и индексы в памяти после генерации строятся с нуля.
+
+    python -m benchmarks.datagen --scale large --database /tmp/large.sqlite3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks._django import persistent_database, setup
+
+SCALES = {
+    'small': {'artists': 100, 'albums': 1000, 'customers': 200,
+              'cart_lines': 10_000},
+    'medium': {'artists': 1000, 'albums': 10_000, 'customers': 2000,
+               'cart_lines': 100_000},
+    'large': {'artists': 10_000, 'albums': 100_000, 'customers': 20_000,
+              'cart_lines': 1_000_000},
+}
+
+GENRES = (
+    'Рок', 'Поп', 'Джаз', 'Блюз', 'Классика', 'Метал', 'Панк', 'Фолк',
+    'Электроника', 'Хип-хоп', 'Регги', 'Соул', 'Кантри', 'Инди',
+    'Эмбиент', 'Фанк', 'Диско', 'Шансон', 'Гранж', 'Ска',
+)
+MEDIA_TYPES = ('CD', 'Винил', 'Кассета')
+
+# Покупатель с заведомо известным паролем - для сценариев со входом
+USERNAME = 'bench0'
+PASSWORD = 'bench-password'
+
+BATCH_SIZE = 5000
+
+
+def _bulk(model, objects):
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def generate(scale='small', seed=0, stdout=None):
+    """Заполнить пустую БД; возвращает число созданных строк по моделям"""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import transaction
+
+    from musicshop.models import (
+        Album, Artist, Cart, CartProduct, Customer, Genre, MediaType)
+
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    User = get_user_model()
+    counts = {}
+
+    def log(model, count, started):
+        counts[model.__name__] = count
+        if stdout:
+            stdout.write(f'{model.__name__:12} {count:>9} '
+                         f'{time.perf_counter() - started:6.1f} с\n')
+
+    with transaction.atomic():
+        started = time.perf_counter()
+        _bulk(Genre, [Genre(id=number, name=name, slug=f'genre-{number}')
+                      for number, name in enumerate(GENRES, 1)])
+        _bulk(MediaType, [MediaType(id=number, name=name)
+                          for number, name in enumerate(MEDIA_TYPES, 1)])
+        log(Genre, len(GENRES), started)
+
+        started = time.perf_counter()
+        _bulk(Artist, [
+            Artist(id=number, name=f'Исполнитель {number}',
+                   slug=f'artist-{number}',
+                   genre_id=rng.randint(1, len(GENRES)),
+                   image=f'bench/artist-{number}.jpg')
+            for number in range(1, sizes['artists'] + 1)
+        ])
+        log(Artist, sizes['artists'], started)
+
+        started = time.perf_counter()
+        first_release = date(1960, 1, 1)
+        prices = {}
+        albums = []
+        for number in range(1, sizes['albums'] + 1):
+            price = Decimal(rng.randint(500, 5000)) / 100
+            prices[number] = price
+            albums.append(Album(
+                id=number, name=f'Альбом {number}', slug=f'album-{number}',
+                artist_id=rng.randint(1, sizes['artists']),
+                media_type_id=rng.randint(1, len(MEDIA_TYPES)),
+                songs_list='\n'.join(
+                    f'{track}. Песня {track}' for track in range(1, 11)),
+                release_date=first_release + timedelta(
+                    days=rng.randint(0, 60 * 365)),
+                price=price,
+                stock=rng.choice((0, 0, 1, 2, 5, 10, 20)),
+                offer_of_the_week=number % 500 == 0,
+                image=f'bench/album-{number}.jpg'))
+        _bulk(Album, albums)
+        del albums
+        log(Album, sizes['albums'], started)
+
+        started = time.perf_counter()
+        # один хэш на всех: хэширование 20 000 паролей заняло бы минуты
+        password = make_password(PASSWORD)
+        _bulk(User, [
+            User(id=number, username=f'bench{number - 1}',
+                 password=password, email=f'bench{number - 1}@example.com')
+            for number in range(1, sizes['customers'] + 1)
+        ])
+        _bulk(Customer, [
+            Customer(id=number, user_id=number, phone='+375290000000')
+            for number in range(1, sizes['customers'] + 1)
+        ])
+        log(Customer, sizes['customers'], started)
+
+        started = time.perf_counter()
+        album_ct = ContentType.objects.get_for_model(Album)
+        per_cart = sizes['cart_lines'] // sizes['customers']
+        carts, lines, links = [], [], []
+        through = Cart.products.through
+        line_id = 0
+        for customer_id in range(1, sizes['customers'] + 1):
+            total = Decimal(0)
+            for album_id in rng.sample(range(1, sizes['albums'] + 1),
+                                       per_cart):
+                line_id += 1
+                qty = rng.randint(1, 3)
+                final_price = qty * prices[album_id]
+                total += final_price
+                lines.append(CartProduct(
+                    id=line_id, user_id=customer_id, cart_id=customer_id,
+                    content_type=album_ct, object_id=album_id, qty=qty,
+                    final_price=final_price))
+                links.append(through(
+                    id=line_id, cart_id=customer_id, cartproduct_id=line_id))
+            carts.append(Cart(id=customer_id, owner_id=customer_id,
+                              total_products=per_cart, final_price=total))
+            if len(lines) >= BATCH_SIZE * 10:
+                _bulk(Cart, carts)
+                _bulk(CartProduct, lines)
+                _bulk(through, links)
+                carts, lines, links = [], [], []
+        _bulk(Cart, carts)
+        _bulk(CartProduct, lines)
+        _bulk(through, links)
+        log(CartProduct, line_id, started)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', required=True,
+                        help='Файл SQLite; должен не существовать')
+    args = parser.parse_args()
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} уже существует')
+    setup()
+    with persistent_database(args.database):
+        generate(args.scale, args.seed, stdout=sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
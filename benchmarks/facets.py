@@ -0,0 +1,96 @@
+"""
+Фасетный фильтр: битовые маски в памяти против COUNT ... GROUP BY.
+
+Для каждого набора фильтров считаются результат и счётчики всех
+фасетов: в БД - отдельный агрегирующий запрос на каждый фасет,
+в индексе - операции над масками.
+
+    python -m benchmarks.facets --repeat 200
+"""
+import argparse
+import time
+
+from benchmarks._django import percentile, setup
+
+
+def sql_facets(filters):
+    from django.db.models import Count, Q
+
+    from musicshop.facets import PRICE_BANDS
+    from musicshop.models import Album
+
+    lookups = {
+        'genre': 'artist__genre_id__in',
+        'media': 'media_type_id__in',
+    }
+    conditions = {facet: Q(**{lookup: filters[facet]})
+                  for facet, lookup in lookups.items() if facet in filters}
+    if 'in_stock' in filters:
+        conditions['in_stock'] = Q(stock__gt=0)
+
+    def others(facet):
+        query = Q()
+        for other, condition in conditions.items():
+            if other != facet:
+                query &= condition
+        return Album.objects.filter(query)
+
+    counts = {
+        'genre': list(others('genre').values('artist__genre_id').annotate(
+            count=Count('id')).order_by()),
+        'media': list(others('media').values('media_type_id').annotate(
+            count=Count('id')).order_by()),
+        'price': [others('price').filter(
+            price__gte=low, **({'price__lt': high} if high else {})).count()
+            for key, label, low, high in PRICE_BANDS],
+        'in_stock': others('in_stock').filter(stock__gt=0).count(),
+    }
+    return others(None).count(), counts
+
+
+def index_facets(filters):
+    from musicshop.facets import count_bits, get_facet_index
+
+    mask, counts = get_facet_index().query(
+        {facet: set(values) for facet, values in filters.items()})
+    return count_bits(mask), counts
+
+
+def measure(func, filters, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(filters)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+    setup()
+    from musicshop.models import Genre, MediaType
+
+    genre_ids = list(Genre.objects.values_list('id', flat=True)[:2])
+    media_ids = list(MediaType.objects.values_list('id', flat=True)[:1])
+    cases = {
+        'без фильтров': {},
+        'жанр': {'genre': genre_ids[:1]},
+        'жанр+носитель+наличие': {
+            'genre': genre_ids, 'media': media_ids, 'in_stock': [True]},
+    }
+    index_facets({})  # построение индекса не входит в замер
+    for name, filters in cases.items():
+        sql_count, _ = sql_facets(filters)
+        index_count, _ = index_facets(filters)
+        assert sql_count == index_count, (name, sql_count, index_count)
+        for label, func in (('SQL', sql_facets), ('маски', index_facets)):
+            timings = measure(func, filters, args.repeat)
+            print(f'{name:25} {label:6} найдено {index_count:6} '
+                  f'p50 {percentile(timings, 50) * 1000:7.2f} мс  '
+                  f'p95 {percentile(timings, 95) * 1000:7.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
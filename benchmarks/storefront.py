@@ -0,0 +1,270 @@
+"""
+Нагрузочный прогон витрины по url из musicshop/urls.py на данных
+benchmarks.datagen: пропускная способность, перцентили задержки и число
+запросов к БД на страницу, сравнение с сохранённой базовой линией.
+
+Режимы:
+- client - django.test.Client в одном потоке, запросы к БД считаются
+  по каждой странице;
+- wsgi - локальный wsgiref-сервер с потоками и --threads клиентов
+  по HTTP, как за балансировщиком.
+
+Сгенерированная БД (--database) сохраняется между запусками; если файла
+нет, он создаётся и заполняется данными масштаба --scale.
+
+    python -m benchmarks.storefront --scale small \
+        --database /tmp/small.sqlite3
+    python -m benchmarks.storefront ... --save-baseline  # записать базу
+
+Прогон завершается с кодом 1, если p95 хуже базовой линии больше чем
+на --tolerance или на какой-то странице выросло число запросов к БД.
+Время зависит от машины: базовую линию снимают на той же машине, где
+потом сравнивают; число запросов переносимо.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from urllib.parse import quote
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from benchmarks import datagen
+from benchmarks._django import BASE_DIR, percentile, persistent_database, setup
+
+BASELINE = BASE_DIR / 'benchmarks' / 'baseline.json'
+
+# Сколько разных объектов перебирает сценарий (страницы вне кэша)
+TARGETS = 50
+
+# url name -> (путь по номеру запроса, нужен ли вход)
+SCENARIOS = {
+    'base': (lambda t, n: '/', False),
+    'artist_detail': (lambda t, n: f'/{t["artists"][n]}/', False),
+    'album_detail': (lambda t, n: '/{}/{}/'.format(*t['albums'][n]), False),
+    'artist_albums': (
+        lambda t, n: f'/catalog/artist/{t["artists"][n]}/', False),
+    'genre_albums': (
+        lambda t, n: f'/catalog/genre/{t["genres"][n]}/?order=price', False),
+    'media_type_albums': (
+        lambda t, n: f'/catalog/media/{t["media_types"][n]}/', False),
+    'catalog': (
+        lambda t, n: f'/catalog/?genre={t["genre_ids"][n]}&in_stock=1',
+        False),
+    'search': (lambda t, n: f'/search/?q=Альбом+{n + 1}', False),
+    'cart': (lambda t, n: '/cart/', True),
+    'login': (lambda t, n: '/login/', False),
+    'registration': (lambda t, n: '/registration/', False),
+}
+
+
+def load_targets():
+    from musicshop.models import Album, Artist, Genre, MediaType
+
+    def cycle(values):
+        values = list(values)
+        return [values[number % len(values)] for number in range(TARGETS)]
+
+    return {
+        'artists': cycle(Artist.objects.order_by('id').values_list(
+            'slug', flat=True)[:TARGETS]),
+        'albums': cycle(Album.objects.order_by('id').values_list(
+            'artist__slug', 'slug')[:TARGETS]),
+        'genres': cycle(Genre.objects.values_list('slug', flat=True)),
+        'genre_ids': cycle(Genre.objects.values_list('id', flat=True)),
+        'media_types': cycle(MediaType.objects.values_list('id', flat=True)),
+    }
+
+
+def summarize(timings, elapsed, queries=None):
+    result = {
+        'rps': round(len(timings) / elapsed, 1),
+        'p50': round(percentile(timings, 50) * 1000, 2),
+        'p95': round(percentile(timings, 95) * 1000, 2),
+        'p99': round(percentile(timings, 99) * 1000, 2),
+    }
+    if queries is not None:
+        result['queries'] = max(queries)
+    return result
+
+
+def run_client(scenarios, targets, requests):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    anonymous = Client()
+    customer = Client()
+    customer.force_login(
+        get_user_model().objects.get(username=datagen.USERNAME))
+    results = {}
+    for name in scenarios:
+        build, logged_in = SCENARIOS[name]
+        client = customer if logged_in else anonymous
+        timings, queries = [], []
+        started = time.perf_counter()
+        for number in range(requests):
+            path = build(targets, number % TARGETS)
+            request_started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(path)
+            timings.append(time.perf_counter() - request_started)
+            queries.append(len(context.captured_queries))
+            assert response.status_code == 200, (path, response.status_code)
+        results[name] = summarize(
+            timings, time.perf_counter() - started, queries)
+    return results
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def run_wsgi(scenarios, targets, requests, threads):
+    from django.contrib.auth import get_user_model
+    from django.core.wsgi import get_wsgi_application
+    from django.test import Client
+
+    customer = Client()
+    customer.force_login(
+        get_user_model().objects.get(username=datagen.USERNAME))
+    session = customer.cookies['sessionid'].value
+
+    server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                         server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    results = {}
+    try:
+        for name in scenarios:
+            build, logged_in = SCENARIOS[name]
+            headers = {'Cookie': f'sessionid={session}'} if logged_in else {}
+
+            def request(number):
+                path = build(targets, number % TARGETS)
+                started = time.perf_counter()
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request(
+                    'GET', quote(path, safe='/?=&+'), headers=headers)
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                assert response.status == 200, (path, response.status)
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                timings = list(pool.map(request, range(requests)))
+            results[name] = summarize(timings, time.perf_counter() - started)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Печать отличий от базовой линии; возвращает число регрессий"""
+    regressions = 0
+    for mode, scenarios in results.items():
+        for name, current in scenarios.items():
+            base = baseline.get(mode, {}).get(name)
+            line = (f'{mode:6} {name:18} {current["rps"]:8.1f} req/s  '
+                    f'p50 {current["p50"]:7.2f}  p95 {current["p95"]:7.2f}  '
+                    f'p99 {current["p99"]:7.2f} мс')
+            if 'queries' in current:
+                line += f'  запросов {current["queries"]}'
+            if base:
+                change = (current['p95'] - base['p95']) / base['p95']
+                line += f'  p95 {change:+.0%} к базе'
+                marks = []
+                if change > tolerance:
+                    marks.append('p95')
+                if current.get('queries', 0) > base.get('queries', 0):
+                    marks.append(f'запросов было {base["queries"]}')
+                if marks:
+                    regressions += 1
+                    line += '  РЕГРЕССИЯ: ' + ', '.join(marks)
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--database', required=True,
+                        help='Файл SQLite со сгенерированными данными')
+    parser.add_argument('--scale', choices=datagen.SCALES, default='small')
+    parser.add_argument('--mode', choices=('client', 'wsgi', 'both'),
+                        default='both')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Запросов на сценарий')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Только эти сценарии (можно несколько раз)')
+    parser.add_argument('--baseline', default=str(BASELINE))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Допустимый рост p95, доля')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+
+    # как в бою, без отладки; замеры PerformanceMiddleware выключены,
+    # чтобы не влиять на результат
+    settings.DEBUG = False
+    settings.PERF_SAMPLE_RATE = 0
+    settings.ALLOWED_HOSTS += ['testserver', '127.0.0.1']
+
+    scenarios = args.scenario or list(SCENARIOS)
+    with persistent_database(args.database) as created:
+        if created:
+            try:
+                datagen.generate(args.scale, stdout=sys.stdout)
+            except BaseException:
+                os.unlink(args.database)
+                raise
+        targets = load_targets()
+        results = {}
+        if args.mode in ('client', 'both'):
+            results['client'] = run_client(scenarios, targets, args.requests)
+        if args.mode in ('wsgi', 'both'):
+            results['wsgi'] = run_wsgi(
+                scenarios, targets, args.requests, args.threads)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            stored = json.load(file)
+        if stored.get('scale') == args.scale:
+            baseline = stored['results']
+        else:
+            print(f'база снята на масштабе {stored.get("scale")}, '
+                  f'сравнение пропущено')
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'scale': args.scale, 'requests': args.requests,
+                       'threads': args.threads, 'results': results},
+                      file, ensure_ascii=False, indent=2, sort_keys=True)
+            file.write('\n')
+    elif regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
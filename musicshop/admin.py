@@ -1,44 +1,251 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.contenttypes.admin import GenericTabularInline
+from django.db.models import Count
 
 from .models import (
     MediaType, Member, Genre, Artist, Album, CartProduct, Cart, Order,
-    Customer, Notification, ImageGallery)
+    Customer, Notification, ImageGallery, Job, StockReservation,
+    OrderDailyRollup, MediaBlob)
+from .checkout import confirm_order
+from .pagination import CachedCountPaginator
+
+
+class ShopModelAdmin(admin.ModelAdmin):
+    """
+    Общая база админок магазина: число строк changelist - через
+    CachedCountPaginator, без второго COUNT по всей таблице при фильтре.
+    query_budget (по умолчанию ADMIN_QUERY_BUDGET) - предел запросов к
+    БД на страницу; его проверяют тесты (AdminQueryBudgetTests) и
+    benchmarks.admin_pages, а не каждый запрос в бою
+    """
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    query_budget = None
+
+    def get_query_budget(self):
+        if self.query_budget is not None:
+            return self.query_budget
+        return getattr(settings, 'ADMIN_QUERY_BUDGET', 15)
+
+
+# Для __str__ объектов из content_object (Album -> artist, Artist -> genre)
+CONTENT_OBJECT_RELATED = {Album: ('artist',), Artist: ('genre',)}
 
 
 class MembersInline(admin.TabularInline):
-    """Выбор участника, для m2m"""
+    """
+    Выбор участника, для m2m: автодополнение вместо select со всеми
+    участниками в каждой строке
+    """
     model = Artist.members.through
+    autocomplete_fields = ('member',)
 
 
 class ImageGalleryInline(GenericTabularInline):
-    """Вывести само изображение"""
+    """
+    Вывести само изображение; content_object строк (их __str__ в
+    заголовке строки) - одной пачкой, а не запросом на строку
+    """
     model = ImageGallery
     readonly_fields = ('image_url',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_content_objects(
+            CONTENT_OBJECT_RELATED)
+
+
+@admin.register(Genre)
+class GenreAdmin(ShopModelAdmin):
+    list_display = ('name', 'slug', 'artists')
+    search_fields = ('name', 'slug')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            artist_count=Count('artist'))
+
+    @admin.display(description='Исполнителей', ordering='artist_count')
+    def artists(self, genre):
+        return genre.artist_count
+
+
+@admin.register(Member)
+class MemberAdmin(ShopModelAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
+
+
+@admin.register(MediaType)
+class MediaTypeAdmin(ShopModelAdmin):
+    search_fields = ('name',)
+
 
 @admin.register(Artist)
-class ArtistAdmin(admin.ModelAdmin):
+class ArtistAdmin(ShopModelAdmin):
+    list_display = ('name', 'genre', 'albums')
+    list_filter = ('genre',)
+    search_fields = ('name', 'slug')
+    autocomplete_fields = ('genre',)
     inlines = [MembersInline, ImageGalleryInline]
     exclude = ('members',)
 
+    def get_queryset(self, request):
+        # genre - и для автодополнения (Artist.__str__ выводит жанр)
+        return super().get_queryset(request).select_related(
+            'genre').annotate(album_count=Count('album'))
+
+    @admin.display(description='Альбомов', ordering='album_count')
+    def albums(self, artist):
+        return artist.album_count
+
 
 @admin.register(Album)
-class AlbumAdmin(admin.ModelAdmin):
+class AlbumAdmin(ShopModelAdmin):
+    list_display = ('__str__', 'media_type', 'price', 'stock',
+                    'offer_of_the_week')
+    list_filter = ('media_type', 'offer_of_the_week')
+    search_fields = ('name', 'slug', 'artist__name')
+    autocomplete_fields = ('artist',)
     inlines = [ImageGalleryInline]
 
+    def get_queryset(self, request):
+        # select_related здесь, а не в list_select_related: так он есть и
+        # у автодополнения (Album.__str__ выводит исполнителя), а при
+        # готовом select_related changelist list_select_related не смотрит
+        return super().get_queryset(request).select_related(
+            'artist', 'media_type')
+
+
+@admin.register(ImageGallery)
+class ImageGalleryAdmin(ShopModelAdmin):
+    """content_object всех строк страницы - пачкой по типам"""
+    list_display = ('__str__', 'content_type', 'object_id', 'use_in_slider')
+    list_filter = ('use_in_slider', 'content_type')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_content_objects(
+            CONTENT_OBJECT_RELATED)
+
+
+@admin.register(CartProduct)
+class CartProductAdmin(ShopModelAdmin):
+    list_display = ('__str__', 'user', 'cart', 'qty', 'final_price')
+    list_select_related = ('user__user', 'cart__owner__user')
+    raw_id_fields = ('user', 'cart')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_content_objects(
+            CONTENT_OBJECT_RELATED)
+
+
+@admin.register(Cart)
+class CartAdmin(ShopModelAdmin):
+    list_display = ('id', 'owner', 'total_products', 'final_price',
+                    'in_order', 'for_anonymous_user')
+    list_filter = ('in_order', 'for_anonymous_user')
+    list_select_related = ('owner__user',)
+    # select со всеми позициями всех корзин - по запросу на позицию
+    raw_id_fields = ('owner', 'products')
+
+
+@admin.register(Customer)
+class CustomerAdmin(ShopModelAdmin):
+    list_display = ('__str__', 'phone', 'is_active', 'orders',
+                    'unread_notifications')
+    list_filter = ('is_active',)
+    search_fields = ('user__username', 'user__first_name',
+                     'user__last_name', 'phone')
+    raw_id_fields = ('user', 'customer_orders')
+    autocomplete_fields = ('wishlist',)
+
+    def get_queryset(self, request):
+        # user - и для автодополнения (Customer.__str__ выводит имя)
+        return super().get_queryset(request).select_related(
+            'user').annotate(order_count=Count('orders'))
+
+    @admin.display(description='Заказов', ordering='order_count')
+    def orders(self, customer):
+        return customer.order_count
+
+
+@admin.register(Notification)
+class NotificationAdmin(ShopModelAdmin):
+    list_display = ('__str__', 'recipient', 'read')
+    list_filter = ('read',)
+    list_select_related = ('recipient__user',)
+    autocomplete_fields = ('recipient',)
+
+
+@admin.register(Job)
+class JobAdmin(ShopModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'duration', 'run_after',
+                    'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('started_at', 'finished_at', 'duration', 'last_error')
+
+
+class StockReservationInline(admin.TabularInline):
+    model = StockReservation
+    raw_id_fields = ('album',)
+    readonly_fields = ('status', 'expires_at')
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(ShopModelAdmin):
+    list_display = ('id', 'customer', 'status', 'buying_type', 'created_at',
+                    'order_date', 'total')
+    list_filter = ('status', 'buying_type', 'created_at')
+    list_select_related = ('customer__user', 'cart')
+    raw_id_fields = ('customer', 'cart')
+    date_hierarchy = 'created_at'
+    inlines = [StockReservationInline]
+    actions = ['confirm']
+
+    @admin.action(description='Подтвердить заказы (снять срок резерва)')
+    def confirm(self, request, queryset):
+        for order in queryset:
+            confirm_order(order)
+
+    @admin.display(description='Сумма', ordering='cart__final_price')
+    def total(self, order):
+        return order.cart.final_price if order.cart_id else None
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(ShopModelAdmin):
+    list_display = ('order', 'album', 'qty', 'status', 'expires_at')
+    list_filter = ('status',)
+    list_select_related = ('order__customer__user', 'album__artist')
+    raw_id_fields = ('order', 'album')
+
+
+@admin.register(OrderDailyRollup)
+class OrderDailyRollupAdmin(ShopModelAdmin):
+    """Итоги только для просмотра: их пересчитывает reports.rollup_day"""
+    list_display = ('day', 'dimension', 'key', 'orders', 'units', 'revenue')
+    list_filter = ('dimension',)
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(ShopModelAdmin):
+    """Только для просмотра: refs ведут сигналы и gc_media"""
+    list_display = ('name', 'size', 'refs', 'created_at', 'updated_at')
+    search_fields = ('name',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
-admin.site.register(MediaType)
-admin.site.register(Member)
-admin.site.register(Genre)
-# admin.site.register(Artist)
-# admin.site.register(Album)
-admin.site.register(CartProduct)
-admin.site.register(Cart)
-admin.site.register(Order)
-admin.site.register(Customer)
-admin.site.register(Notification)
-admin.site.register(ImageGallery)
 
 admin.site.site_header = 'Сайт "Музыкальный магазин"'
 admin.site.site_title = 'Сайт интернет магазина'
@@ -0,0 +1,140 @@
+"""
+Корзина анонимного покупателя в подписанной cookie.
+
+Содержимое - JSON-массив пар [album_id, qty], без записей в БД:
+просмотр каталога ботами и посетителями без входа не создаёт ни
+покупателей, ни корзин. Цены и наличие альбомов проверяются одним
+запросом при показе корзины, а при входе или регистрации позиции
+переносятся в корзину покупателя (CartService.add_many).
+"""
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+from .cart import CartService, clamp_qty
+from .models import Album
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'musicshop.anonymous_cart'
+
+# Ограничение размера cookie (браузеры хранят до ~4 КБ)
+MAX_LINES = 100
+
+
+class AnonymousCartLine:
+    """Позиция корзины с тем же интерфейсом, что и у CartProduct"""
+
+    def __init__(self, album, qty):
+        self.content_object = album
+        self.object_id = album.id
+        self.qty = qty
+        self.final_price = qty * album.price
+
+
+class AnonymousCart:
+    """Корзина без входа: тот же интерфейс изменения, что у CartService"""
+
+    def __init__(self, quantities=None):
+        self.quantities = dict(quantities or {})
+        self.modified = False
+        self._lines = None
+
+    @classmethod
+    def from_request(cls, request):
+        """Корзина из cookie; повреждённая или чужая cookie - пустая корзина"""
+        value = request.get_signed_cookie(
+            COOKIE_NAME, default=None, salt=COOKIE_SALT,
+            max_age=settings.ANONYMOUS_CART_MAX_AGE)
+        quantities = {}
+        try:
+            for album_id, qty in json.loads(value or '[]'):
+                if (isinstance(album_id, int) and isinstance(qty, int)
+                        and qty > 0):
+                    quantities[album_id] = clamp_qty(qty)
+        except (TypeError, ValueError):
+            quantities = {}
+        return cls(list(quantities.items())[:MAX_LINES])
+
+    @property
+    def cart(self):
+        return self
+
+    def _changed(self):
+        self.modified = True
+        self._lines = None
+
+    def add(self, album, qty=1):
+        self.add_many({album.pk: qty})
+
+    def add_many(self, quantities):
+        for album_id, qty in quantities.items():
+            if qty <= 0:
+                continue
+            if (album_id not in self.quantities
+                    and len(self.quantities) >= MAX_LINES):
+                continue
+            self.quantities[album_id] = clamp_qty(
+                self.quantities.get(album_id, 0) + qty)
+        self._changed()
+
+    def remove(self, album_id):
+        if self.quantities.pop(album_id, None) is not None:
+            self._changed()
+
+    def change_qty(self, album_id, qty):
+        if qty <= 0:
+            return self.remove(album_id)
+        if album_id in self.quantities:
+            self.quantities[album_id] = clamp_qty(qty)
+            self._changed()
+
+    def lines(self):
+        """Позиции с актуальными ценами - один запрос на всю корзину"""
+        if self._lines is None:
+            albums = Album.objects.only(
+                'id', 'name', 'slug', 'price').in_bulk(self.quantities)
+            self._lines = [
+                AnonymousCartLine(albums[album_id], qty)
+                for album_id, qty in self.quantities.items()
+                if album_id in albums
+            ]
+        return self._lines
+
+    @property
+    def total_products(self):
+        return len(self.lines())
+
+    @property
+    def final_price(self):
+        return sum((line.final_price for line in self.lines()), Decimal(0))
+
+    def save(self, response):
+        """Записать изменённую корзину в cookie ответа"""
+        if not self.modified:
+            return
+        if not self.quantities:
+            response.delete_cookie(COOKIE_NAME)
+            return
+        value = json.dumps(
+            [[album_id, qty] for album_id, qty in self.quantities.items()],
+            separators=(',', ':'))
+        response.set_signed_cookie(
+            COOKIE_NAME, value, salt=COOKIE_SALT,
+            max_age=settings.ANONYMOUS_CART_MAX_AGE, httponly=True,
+            samesite='Lax')
+
+
+def merge_anonymous_cart(request, response, customer):
+    """
+    Перенести корзину из cookie в корзину покупателя после входа
+    или регистрации и удалить cookie
+    """
+    if COOKIE_NAME not in request.COOKIES:
+        return
+    anonymous_cart = AnonymousCart.from_request(request)
+    if anonymous_cart.quantities:
+        # альбомы, удалённые из каталога, add_many пропустит сам
+        CartService.for_customer(customer).add_many(
+            anonymous_cart.quantities)
+    response.delete_cookie(COOKIE_NAME)
@@ -5,3 +5,6 @@ class MusicshopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'musicshop'
     verbose_name = 'Музыкальный магазин'
+
+    def ready(self):
+        from . import checks, signals, tasks  # noqa: F401
@@ -0,0 +1,172 @@
+"""
+Асинхронные версии представлений для работы под ASGI.
+
+В Django 3.2 нет асинхронного ORM, поэтому работа с БД и рендеринг
+шаблонов выполняются в пуле потоков (sync_to_async), а в цикле событий
+остаётся то, что не трогает БД: например, отдача страниц каталога из
+кэша - без перехода в поток на сам ответ.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.views.generic import View
+
+from . import views
+from .mixins import CatalogPageCacheMixin
+
+
+class AsyncViewMixin:
+    """
+    Пометка CBV как асинхронного. View.view_is_async появился только
+    в Django 4.1, поэтому as_view() помечает функцию вручную
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        response = super().http_method_not_allowed(request, *args, **kwargs)
+
+        async def func():
+            return response
+
+        return func()
+
+    def options(self, request, *args, **kwargs):
+        response = super().options(request, *args, **kwargs)
+
+        async def func():
+            return response
+
+        return func()
+
+
+def offloaded(method):
+    """Синхронный метод представления - в пуле потоков"""
+
+    async def wrapper(self, *args, **kwargs):
+        return await sync_to_async(method)(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def _resolve_user(request):
+    """request.user ленивый и читает сессию из БД - вычисляем в потоке"""
+    return request.user.is_authenticated
+
+
+class AsyncCatalogPageMixin(AsyncViewMixin):
+    """Страница каталога: из кэша - в цикле событий, иначе - в потоке"""
+
+    async def get(self, request, *args, **kwargs):
+        await sync_to_async(_resolve_user)(request)
+        key = self.get_cache_key()
+        response = self.get_cached_response(key)
+        if response is None:
+            response = await sync_to_async(self.render_fresh)(
+                key, request, *args, **kwargs)
+        return response
+
+    def render_fresh(self, key, request, *args, **kwargs):
+        response = super(CatalogPageCacheMixin, self).get(
+            request, *args, **kwargs)
+        return self.cache_response(key, response)
+
+
+class ArtistDetailView(AsyncCatalogPageMixin, views.ArtistDetailView):
+    pass
+
+
+class AlbumDetailView(AsyncCatalogPageMixin, views.AlbumDetailView):
+    pass
+
+
+class BaseView(AsyncViewMixin, views.BaseView):
+    get = offloaded(views.BaseView.get)
+
+
+class SearchView(AsyncViewMixin, views.SearchView):
+    get = offloaded(views.SearchView.get)
+
+
+class LoginView(AsyncViewMixin, views.LoginView):
+    get = offloaded(views.LoginView.get)
+    post = offloaded(views.LoginView.post)
+
+
+class RegistrationView(AsyncViewMixin, views.RegistrationView):
+    get = offloaded(views.RegistrationView.get)
+    post = offloaded(views.RegistrationView.post)
+
+
+class AsyncDispatchMixin(AsyncViewMixin):
+    """
+    dispatch с обращениями к БД (LoginRequiredMixin читает request.user,
+    CartMixin - покупателя и корзину) выполняется в потоке целиком
+    """
+
+    http_method_not_allowed = View.http_method_not_allowed
+    options = View.options
+
+    async def dispatch(self, request, *args, **kwargs):
+        return await sync_to_async(super().dispatch)(
+            request, *args, **kwargs)
+
+
+class CartView(AsyncDispatchMixin, views.CartView):
+    pass
+
+
+class CheckoutView(AsyncDispatchMixin, views.CheckoutView):
+    pass
+
+
+class AddToCartView(AsyncDispatchMixin, views.AddToCartView):
+    pass
+
+
+class DeleteFromCartView(AsyncDispatchMixin, views.DeleteFromCartView):
+    pass
+
+
+class ChangeQTYView(AsyncDispatchMixin, views.ChangeQTYView):
+    pass
+
+
+class UnreadNotificationsView(AsyncDispatchMixin,
+                              views.UnreadNotificationsView):
+    pass
+
+
+class MarkNotificationsReadView(AsyncDispatchMixin,
+                                views.MarkNotificationsReadView):
+    pass
+
+
+class CatalogFilterView(AsyncViewMixin, views.CatalogFilterView):
+    get = offloaded(views.CatalogFilterView.get)
+
+
+class GenreAlbumsView(AsyncViewMixin, views.GenreAlbumsView):
+    get = offloaded(views.GenreAlbumsView.get)
+
+
+class ArtistAlbumsView(AsyncViewMixin, views.ArtistAlbumsView):
+    get = offloaded(views.ArtistAlbumsView.get)
+
+
+class MediaTypeAlbumsView(AsyncViewMixin, views.MediaTypeAlbumsView):
+    get = offloaded(views.MediaTypeAlbumsView.get)
+
+
+class OrderReportView(AsyncDispatchMixin, views.OrderReportView):
+    pass
+
+
+class OrderExportView(AsyncDispatchMixin, views.OrderExportView):
+    spool = True
@@ -0,0 +1,128 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .perf import record_cache
+
+VERSION_KEY = 'catalog:version:{kind}:{slug}'
+GLOBAL_VERSION_KEY = 'catalog:version:global'
+PAGE_KEY = 'catalog:page:{name}:{auth}:{versions}'
+STATS_KEY = 'catalog:stats:{counter}'
+
+
+def get_catalog_cache():
+    """Кэш каталога (по умолчанию - 'default')"""
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _initial_version():
+    """
+    Начальная версия - время в мс, а не 1: если ключ версии вытеснен из
+    кэша, новая версия не совпадёт ни с одной из ранее выданных
+    """
+    return int(time.time() * 1000)
+
+
+def get_versions(*objects):
+    """
+    Версии объектов каталога одним обращением к кэшу.
+    objects - пары (kind, slug), например ('album', 'the-fragile')
+    """
+    cache = get_catalog_cache()
+    keys = [VERSION_KEY.format(kind=kind, slug=slug) for kind, slug in objects]
+    keys.append(GLOBAL_VERSION_KEY)
+    versions = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        # add(), а не set(): параллельный запрос мог уже завести версию
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    cache = get_catalog_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def bump_version(kind, slug):
+    """Инвалидировать все страницы, в ключ которых входит объект"""
+    if slug:
+        _bump(VERSION_KEY.format(kind=kind, slug=slug))
+
+
+def bump_global_version():
+    """Инвалидировать весь каталог (жанры, носители)"""
+    _bump(GLOBAL_VERSION_KEY)
+
+
+def versions_key(*objects):
+    """Версии объектов и глобальная версия одной строкой - часть ключа"""
+    versions = get_versions(*objects)
+    parts = [f'{kind}={slug}.{version}'
+             for (kind, slug), version in zip(objects, versions)]
+    parts.append(f'global.{versions[-1]}')
+    return ':'.join(parts)
+
+
+def page_cache_key(name, request, *objects):
+    """Ключ страницы: имя url + состояние авторизации + версии объектов"""
+    return PAGE_KEY.format(
+        name=name,
+        auth=int(request.user.is_authenticated),
+        versions=versions_key(*objects)
+    )
+
+
+def _count(counter):
+    cache = get_catalog_cache()
+    key = STATS_KEY.format(counter=counter)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cached_page(key):
+    """Готовый ответ из кэша или None"""
+    cached = get_catalog_cache().get(key)
+    if cached is None:
+        _count('miss')
+        record_cache(False)
+        return None
+    _count('hit')
+    record_cache(True)
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def set_cached_page(key, response):
+    """Сохранить отрендеренный ответ"""
+    get_catalog_cache().set(
+        key, (response.content, response['Content-Type']),
+        timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 15)
+    )
+
+
+def cache_stats():
+    """Счётчики попаданий/промахов кэша каталога"""
+    cache = get_catalog_cache()
+    keys = {counter: STATS_KEY.format(counter=counter)
+            for counter in ('hit', 'miss')}
+    values = cache.get_many(keys.values())
+    stats = {counter: values.get(key, 0) for counter, key in keys.items()}
+    total = stats['hit'] + stats['miss']
+    stats['hit_ratio'] = stats['hit'] / total if total else 0.0
+    return stats
+
+
+def reset_cache_stats():
+    get_catalog_cache().delete_many(
+        [STATS_KEY.format(counter=counter) for counter in ('hit', 'miss')])
@@ -0,0 +1,159 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, Sum, Count
+
+from .models import Album, Cart, CartProduct
+
+
+def clamp_qty(qty):
+    """
+    Количество в пределах CART_MAX_QTY: иначе qty и final_price позиции
+    переполнили бы свои столбцы (DataError вместо ошибки формы)
+    """
+    return min(qty, getattr(settings, 'CART_MAX_QTY', 99))
+
+
+class CartService:
+    """
+    Изменение корзины с инкрементальным пересчётом итогов.
+
+    Cart.total_products (число позиций) и Cart.final_price обновляются
+    в той же транзакции через F()-выражения на величину изменения,
+    без повторной агрегации всех позиций. Число запросов не зависит
+    от количества добавляемых товаров.
+    """
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    @classmethod
+    def for_customer(cls, customer):
+        """Текущая (не оформленная) корзина покупателя"""
+        cart = Cart.objects.filter(owner=customer, in_order=False).first()
+        if cart is None:
+            cart = Cart.objects.create(owner=customer, final_price=0)
+        return cls(cart)
+
+    def lines(self):
+        """Позиции корзины с альбомами - пачкой, без запроса на строку"""
+        return CartProduct.objects.filter(
+            cart=self.cart).with_content_objects().order_by('id')
+
+    @staticmethod
+    def _album_ct():
+        return ContentType.objects.get_for_model(Album)
+
+    def _lock_cart(self):
+        """Блокировка строки корзины: изменения одной корзины - по очереди"""
+        Cart.objects.select_for_update().filter(pk=self.cart.pk).exists()
+
+    def _lines(self, album_ids):
+        """Позиции корзины для альбомов: {album_id: CartProduct}"""
+        lines = CartProduct.objects.select_for_update().filter(
+            cart=self.cart, content_type=self._album_ct(),
+            object_id__in=album_ids)
+        return {line.object_id: line for line in lines}
+
+    def _apply_totals(self, lines_delta, price_delta):
+        if not lines_delta and not price_delta:
+            return
+        Cart.objects.filter(pk=self.cart.pk).update(
+            total_products=F('total_products') + lines_delta,
+            final_price=F('final_price') + price_delta)
+        self.cart.refresh_from_db(fields=['total_products', 'final_price'])
+
+    def add(self, album, qty=1):
+        self.add_many({album.pk: qty})
+
+    @transaction.atomic
+    def add_many(self, quantities):
+        """
+        Добавить альбомы: {album_id: qty}. Существующие позиции
+        увеличиваются, новые создаются одним bulk_create
+        """
+        quantities = {album_id: qty for album_id, qty in quantities.items()
+                      if qty > 0}
+        if not quantities:
+            return
+        prices = dict(Album.objects.filter(
+            pk__in=quantities).values_list('pk', 'price'))
+        self._lock_cart()
+        lines = self._lines(prices)
+        album_ct = self._album_ct()
+
+        price_delta = Decimal(0)
+        changed, created = [], []
+        for album_id, price in prices.items():
+            qty = clamp_qty(quantities[album_id])
+            line = lines.get(album_id)
+            if line is None:
+                line = CartProduct(
+                    user_id=self.cart.owner_id, cart=self.cart,
+                    content_type=album_ct, object_id=album_id, qty=qty,
+                    final_price=qty * price)
+                created.append(line)
+                price_delta += line.final_price
+            else:
+                old_price = line.final_price
+                line.qty = clamp_qty(line.qty + qty)
+                line.final_price = line.qty * price
+                changed.append(line)
+                price_delta += line.final_price - old_price
+
+        if changed:
+            CartProduct.objects.bulk_update(changed, ['qty', 'final_price'])
+        if created:
+            CartProduct.objects.bulk_create(created)
+            # SQLite не возвращает id из bulk_create - перечитываем их
+            # одним запросом для связи корзины с позициями (m2m)
+            new_ids = CartProduct.objects.filter(
+                cart=self.cart, content_type=album_ct,
+                object_id__in=[line.object_id for line in created]
+            ).values_list('pk', flat=True)
+            through = Cart.products.through
+            through.objects.bulk_create([
+                through(cart_id=self.cart.pk, cartproduct_id=line_id)
+                for line_id in new_ids
+            ])
+        self._apply_totals(len(created), price_delta)
+
+    @transaction.atomic
+    def remove(self, album_id):
+        self._lock_cart()
+        line = self._lines([album_id]).get(album_id)
+        if line is None:
+            return
+        line.delete()
+        self._apply_totals(-1, -line.final_price)
+
+    @transaction.atomic
+    def change_qty(self, album_id, qty):
+        """Установить количество; 0 - удалить позицию"""
+        if qty <= 0:
+            return self.remove(album_id)
+        price = Album.objects.filter(pk=album_id).values_list(
+            'price', flat=True).first()
+        self._lock_cart()
+        line = self._lines([album_id]).get(album_id)
+        if line is None or price is None:
+            return
+        old_price = line.final_price
+        line.qty = clamp_qty(qty)
+        line.final_price = line.qty * price
+        CartProduct.objects.filter(pk=line.pk).update(
+            qty=line.qty, final_price=line.final_price)
+        self._apply_totals(0, line.final_price - old_price)
+
+    @transaction.atomic
+    def recalculate(self):
+        """Полный пересчёт итогов - для исправления рассинхронизации"""
+        self._lock_cart()
+        totals = CartProduct.objects.filter(cart=self.cart).aggregate(
+            lines=Count('id'), price=Sum('final_price'))
+        Cart.objects.filter(pk=self.cart.pk).update(
+            total_products=totals['lines'],
+            final_price=totals['price'] or 0)
+        self.cart.refresh_from_db(fields=['total_products', 'final_price'])
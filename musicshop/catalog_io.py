@@ -0,0 +1,359 @@
+"""
+Импорт и экспорт каталога файлами CSV или JSON Lines.
+
+Каталог - каталог файлов по одному на сущность: genres, media_types,
+members, artists, albums (.csv или .jsonl). Связи задаются
+естественными ключами: жанр, музыкант, исполнитель - слагом, носитель -
+названием; музыканты исполнителя в CSV перечисляются через «|».
+
+Файлы читаются и пишутся потоково, пачками по BATCH_SIZE строк: память
+не зависит от размера файла, кроме словарей ключ -> id для связей.
+Существующие по ключу объекты обновляются (bulk_update), новые
+создаются (bulk_create). Сигналы моделей при этом не срабатывают,
+поэтому после импорта поисковый индекс, фасеты и кэш каталога
+обновляются целиком (refresh_catalog).
+"""
+import csv
+import json
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .cache import bump_global_version
+from .facets import get_facet_index
+from .models import Album, Artist, Genre, MediaType, Member
+from .search import get_search_index
+from .storefront import invalidate_snapshot
+
+BATCH_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+LIST_SEPARATOR = '|'
+
+# Порядок важен: сначала справочники, на которые ссылаются остальные
+FIELDS = {
+    'genres': ('name', 'slug'),
+    'media_types': ('name',),
+    'members': ('name', 'slug', 'image'),
+    'artists': ('name', 'slug', 'genre', 'members', 'image'),
+    'albums': ('artist', 'name', 'slug', 'media_type', 'release_date',
+               'price', 'stock', 'offer_of_the_week', 'image',
+               'description', 'songs_list'),
+}
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+def _batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def catalog_file(directory, kind, file_format):
+    return directory / f'{kind}.{file_format}'
+
+
+def read_rows(path):
+    """Строки файла по одной: (номер строки, словарь полей)"""
+    with open(path, encoding='utf-8', newline='') as file:
+        if path.suffix == '.csv':
+            # номер строки с учётом заголовка
+            for line, row in enumerate(csv.DictReader(file), 2):
+                yield line, row
+            return
+        for line, text in enumerate(file, 1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as error:
+                    raise CatalogImportError(f'{path}:{line}: {error}')
+
+
+class RowWriter:
+    """Запись строк в CSV или JSON Lines"""
+
+    def __init__(self, file, fields, file_format):
+        self.file = file
+        self.fields = fields
+        self.csv = file_format == 'csv'
+        if self.csv:
+            self.writer = csv.writer(file)
+            self.writer.writerow(fields)
+
+    def write(self, row):
+        if self.csv:
+            self.writer.writerow([
+                LIST_SEPARATOR.join(value) if isinstance(value, list)
+                else int(value) if isinstance(value, bool) else value
+                for value in (row[field] for field in self.fields)])
+            return
+        self.file.write(json.dumps(
+            {field: str(row[field]) if isinstance(row[field], Decimal)
+             else row[field] for field in self.fields},
+            ensure_ascii=False, default=str))
+        self.file.write('\n')
+
+
+def _parse_list(value):
+    if isinstance(value, list):
+        return value
+    return [item for item in (value or '').split(LIST_SEPARATOR) if item]
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+
+class CatalogImporter:
+    """
+    Импорт в открытой транзакции: вызывающий оборачивает его
+    в transaction.atomic, чтобы ошибка в файле не оставила полкаталога
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.ids = {
+            'genres': dict(Genre.objects.values_list('slug', 'id')),
+            'media_types': dict(MediaType.objects.values_list('name', 'id')),
+            'members': dict(Member.objects.values_list('slug', 'id')),
+            'artists': dict(Artist.objects.values_list('slug', 'id')),
+        }
+
+    def import_file(self, kind, path):
+        """Импорт файла; возвращает (создано, обновлено, без изменений)"""
+        build = getattr(self, f'_{kind}')
+        counts = [0, 0, 0]
+        for batch in _batches(read_rows(path), self.batch_size):
+            objects, extra, lines = {}, {}, {}
+            for line, row in batch:
+                try:
+                    obj, obj_extra = build(row)
+                except (KeyError, TypeError, ValueError,
+                        InvalidOperation) as error:
+                    raise CatalogImportError(
+                        f'{path}:{line}: {error.__class__.__name__}: {error}')
+                # повтор ключа в пачке - побеждает последняя строка
+                objects[self._key(kind, obj)] = obj
+                extra[self._key(kind, obj)] = obj_extra
+                lines[self._key(kind, obj)] = line
+            relinked = (self._changed_members(extra) if kind == 'artists'
+                        else set())
+            try:
+                # точка сохранения: после ошибки БД транзакция импорта
+                # остаётся рабочей, и строку можно найти (_failed_line)
+                with transaction.atomic():
+                    *batch_counts, ids = self._save(kind, objects, relinked)
+                    self._set_members(ids, extra, relinked)
+            except IntegrityError as error:
+                line = (self._failed_line(kind, objects, lines)
+                        or f'{batch[0][0]}-{batch[-1][0]}')
+                raise CatalogImportError(
+                    f'{path}:{line}: IntegrityError: {error}') from error
+            counts = [total + count
+                      for total, count in zip(counts, batch_counts)]
+        return tuple(counts)
+
+    @staticmethod
+    def _key(kind, obj):
+        return obj.name if kind == 'media_types' else obj.slug
+
+    def _lookup(self, kind, key):
+        try:
+            return self.ids[kind][key]
+        except KeyError:
+            raise KeyError(f'{kind}: нет объекта «{key}»') from None
+
+    def _genres(self, row):
+        return Genre(name=row['name'], slug=row['slug']), None
+
+    def _media_types(self, row):
+        return MediaType(name=row['name']), None
+
+    def _members(self, row):
+        return Member(name=row['name'], slug=row['slug'],
+                      image=row.get('image') or ''), None
+
+    def _artists(self, row):
+        members = [self._lookup('members', slug)
+                   for slug in _parse_list(row.get('members'))]
+        artist = Artist(
+            name=row['name'], slug=row['slug'],
+            genre_id=self._lookup('genres', row['genre']),
+            image=row.get('image') or '')
+        return artist, members
+
+    def _albums(self, row):
+        album = Album(
+            artist_id=self._lookup('artists', row['artist']),
+            name=row['name'], slug=row['slug'],
+            media_type_id=self._lookup('media_types', row['media_type']),
+            release_date=date.fromisoformat(row['release_date']),
+            price=Decimal(str(row['price'])),
+            stock=int(row.get('stock') or 0),
+            offer_of_the_week=_parse_bool(row.get('offer_of_the_week')),
+            image=row.get('image') or '',
+            description=row.get('description') or '',
+            songs_list=row.get('songs_list') or '')
+        return album, None
+
+    @staticmethod
+    def _fields(kind):
+        """(ключевое поле, остальные поля модели из файла)"""
+        key_field = 'name' if kind == 'media_types' else 'slug'
+        return key_field, [field for field in FIELDS[kind]
+                           if field not in (key_field, 'members')]
+
+    def _save(self, kind, objects, relinked=()):
+        """
+        Создать новые и обновить изменившиеся объекты пачки; строки,
+        совпадающие с БД, не пишутся - повторный импорт того же файла
+        почти ничего не стоит. Объект с ключом из relinked (сменился
+        состав) считается обновлённым, даже если поля те же.
+        Возвращает (создано, обновлено, без изменений, {ключ: id})
+        """
+        model = type(next(iter(objects.values())))
+        key_field, fields = self._fields(kind)
+        attnames = [model._meta.get_field(field).attname for field in fields]
+        stored = {
+            row[key_field]: row for row in model.objects.filter(
+                **{f'{key_field}__in': list(objects)}
+            ).values(key_field, 'id', *attnames)
+        }
+        ids = {key: row['id'] for key, row in stored.items()}
+        to_create, to_update = [], []
+        relinked_only = 0
+        for key, obj in objects.items():
+            row = stored.get(key)
+            if row is None:
+                to_create.append(obj)
+                continue
+            obj.pk = row['id']
+            # файловые поля сравниваются по имени файла
+            if any((row[attname] or '') != (getattr(obj, attname).name or '')
+                   if attname == 'image'
+                   else row[attname] != getattr(obj, attname)
+                   for attname in attnames):
+                to_update.append(obj)
+            elif key in relinked:
+                relinked_only += 1
+        if to_update:
+            model.objects.bulk_update(to_update, fields)
+        if to_create:
+            model.objects.bulk_create(to_create)
+            # SQLite не возвращает id из bulk_create - дочитываем их
+            ids.update(model.objects.filter(**{
+                f'{key_field}__in': [self._key(kind, obj) for obj in to_create]
+            }).values_list(key_field, 'id'))
+        if kind in self.ids:
+            self.ids[kind].update(ids)
+        updated = len(to_update) + relinked_only
+        unchanged = len(objects) - len(to_create) - updated
+        return len(to_create), updated, unchanged, ids
+
+    def _failed_line(self, kind, objects, lines):
+        """
+        Строка файла, на которой пачка нарушает ограничение БД: объекты
+        пишутся по одному до первой ошибки, затем всё откатывается
+        """
+        model = type(next(iter(objects.values())))
+        fields = self._fields(kind)[1]
+        failed = None
+        with transaction.atomic():
+            for key, obj in objects.items():
+                try:
+                    with transaction.atomic():
+                        if obj.pk is None:
+                            model.objects.bulk_create([obj])
+                        else:
+                            model.objects.bulk_update([obj], fields)
+                except IntegrityError:
+                    failed = lines[key]
+                    break
+            transaction.set_rollback(True)
+        return failed
+
+    def _changed_members(self, members):
+        """Слаги исполнителей, чей состав в файле отличается от БД"""
+        known = self.ids['artists']
+        existing = {slug: known[slug] for slug in members if slug in known}
+        stored = defaultdict(set)
+        for artist_id, member_id in Artist.members.through.objects.filter(
+                artist_id__in=existing.values()
+        ).values_list('artist_id', 'member_id'):
+            stored[artist_id].add(member_id)
+        return {slug for slug, member_ids in members.items()
+                if slug not in existing
+                or set(member_ids) != stored[existing[slug]]}
+
+    @staticmethod
+    def _set_members(ids, members, slugs):
+        """Состав исполнителей slugs заменяется составом из файла"""
+        if not slugs:
+            return
+        through = Artist.members.through
+        through.objects.filter(
+            artist_id__in=[ids[slug] for slug in slugs]).delete()
+        through.objects.bulk_create([
+            through(artist_id=ids[slug], member_id=member_id)
+            for slug in slugs
+            for member_id in dict.fromkeys(members[slug])
+        ])
+
+
+def refresh_catalog():
+    """
+    Обновить всё, что сигналы моделей поддерживают по одному объекту:
+    кэш страниц, снимок витрины, фасеты и поисковый индекс
+    """
+    invalidate_snapshot()
+    transaction.on_commit(bump_global_version)
+    transaction.on_commit(get_facet_index().invalidate)
+    transaction.on_commit(get_search_index().rebuild)
+
+
+def export_rows(kind):
+    """Строки сущности для экспорта - потоком, пачками по BATCH_SIZE"""
+    if kind == 'genres':
+        yield from Genre.objects.order_by('id').values(
+            'name', 'slug').iterator(chunk_size=BATCH_SIZE)
+    elif kind == 'media_types':
+        yield from MediaType.objects.order_by('id').values(
+            'name').iterator(chunk_size=BATCH_SIZE)
+    elif kind == 'members':
+        yield from Member.objects.order_by('id').values(
+            'name', 'slug', 'image').iterator(chunk_size=BATCH_SIZE)
+    elif kind == 'artists':
+        artists = Artist.objects.order_by('id').values(
+            'id', 'name', 'slug', 'image', genre_slug=F('genre__slug'))
+        for batch in _batches(artists.iterator(chunk_size=BATCH_SIZE)):
+            members = {}
+            for artist_id, slug in Artist.members.through.objects.filter(
+                    artist_id__in=[row['id'] for row in batch]
+            ).order_by('id').values_list('artist_id', 'member__slug'):
+                members.setdefault(artist_id, []).append(slug)
+            for row in batch:
+                row['genre'] = row.pop('genre_slug')
+                row['members'] = members.get(row['id'], [])
+                yield row
+    elif kind == 'albums':
+        albums = Album.objects.order_by('id').values(
+            'name', 'slug', 'release_date', 'price', 'stock',
+            'offer_of_the_week', 'image', 'description', 'songs_list',
+            artist_slug=F('artist__slug'),
+            media_type_name=F('media_type__name'))
+        for row in albums.iterator(chunk_size=BATCH_SIZE):
+            row['artist'] = row.pop('artist_slug')
+            row['media_type'] = row.pop('media_type_name')
+            row['release_date'] = row['release_date'].isoformat()
+            yield row
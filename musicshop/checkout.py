@@ -0,0 +1,224 @@
+"""
+Оформление заказа с резервированием остатков.
+
+Остаток списывается условным UPDATE ... WHERE stock >= qty: проверка
+и списание - одна операция в БД, поэтому параллельные заказы не
+продадут больше, чем есть, и не ждут друг друга дольше одного UPDATE.
+Резерв действует STOCK_RESERVATION_TIMEOUT секунд: неподтверждённые
+заказы отменяются, а товар возвращается в остаток (задача
+checkout.release_expired или manage.py release_reservations).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_version
+from .facets import get_facet_index
+from .jobs import enqueue, enqueue_on_commit
+from .models import Album, Cart, CartProduct, Order, StockReservation
+from .notifications import restock_event
+from .reports import orders_changed
+from .storefront import invalidate_snapshot
+
+RELEASE_BATCH_SIZE = 500
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+
+    def __init__(self):
+        super().__init__('Корзина пуста')
+
+
+class CartAlreadyOrdered(CheckoutError):
+
+    def __init__(self):
+        super().__init__('Заказ по этой корзине уже оформлен')
+
+
+class OutOfStock(CheckoutError):
+
+    def __init__(self, album):
+        self.album = album
+        super().__init__(f'Недостаточно товара: {album.name}')
+
+
+def reservation_timeout():
+    return getattr(settings, 'STOCK_RESERVATION_TIMEOUT', 15 * 60)
+
+
+def stock_changed(album_ids, restocked=()):
+    """
+    Остатки изменены массовым UPDATE, минуя сигналы моделей: обновить
+    кэш страниц, а при переходе через ноль - фасет наличия и витрину
+    """
+    rows = list(Album.objects.filter(
+        pk__in=list(album_ids)).values_list('pk', 'slug', 'stock'))
+    sold_out = [pk for pk, slug, stock in rows if stock == 0]
+    # остальные изменения остатка на фасеты не влияют
+    in_stock_changed = sold_out + list(restocked)
+
+    def after_commit():
+        if in_stock_changed:
+            get_facet_index().update_albums(in_stock_changed)
+        for pk, slug, stock in rows:
+            bump_version('album', slug)
+
+    transaction.on_commit(after_commit)
+    if in_stock_changed:
+        invalidate_snapshot()
+    for album_id in restocked:
+        enqueue_on_commit(
+            'notifications.restock',
+            {'album_id': album_id, 'event': restock_event(album_id)},
+            key=f'restock:{album_id}')
+
+
+def schedule_release(expires_at):
+    """Задача снятия просроченных резервов - одна в очереди"""
+    if getattr(settings, 'JOBS_EAGER', False):
+        # без воркеров отложенных задач нет - manage.py release_reservations
+        return
+    delay = max((expires_at - timezone.now()).total_seconds(), 0) + 1
+    enqueue('checkout.release_expired', delay=delay,
+            key='checkout:release_expired')
+
+
+def checkout(cart, **order_fields):
+    """
+    Оформить заказ по корзине: списать остатки, создать заказ
+    и резервы. При нехватке любого товара не меняется ничего
+    """
+    with transaction.atomic():
+        # условный UPDATE вместо блокировки: вторая попытка оформить
+        # ту же корзину не пройдёт
+        if not Cart.objects.filter(
+                pk=cart.pk, in_order=False).update(in_order=True):
+            raise CartAlreadyOrdered()
+        quantities = Counter()
+        lines = CartProduct.objects.filter(
+            cart=cart, content_type=ContentType.objects.get_for_model(Album)
+        ).values_list('object_id', 'qty')
+        for album_id, qty in lines:
+            quantities[album_id] += qty
+        if not quantities:
+            raise EmptyCart()
+        # один порядок списания у всех заказов - без взаимных блокировок
+        for album_id in sorted(quantities):
+            qty = quantities[album_id]
+            if not Album.objects.filter(
+                    pk=album_id, stock__gte=qty
+            ).update(stock=F('stock') - qty):
+                raise OutOfStock(Album.objects.only('name').get(pk=album_id))
+
+        order = Order.objects.create(
+            customer=cart.owner, cart=cart, **order_fields)
+        expires_at = timezone.now() + timedelta(seconds=reservation_timeout())
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, album_id=album_id, qty=qty,
+                             expires_at=expires_at)
+            for album_id, qty in sorted(quantities.items())
+        ])
+        order.customer.customer_orders.add(order)
+        stock_changed(quantities)
+        transaction.on_commit(lambda: schedule_release(expires_at))
+    cart.in_order = True
+    return order
+
+
+def confirm_reservations(order):
+    """Резервы заказа больше не истекают (заказ вышел из статуса «новый»)"""
+    return StockReservation.objects.filter(
+        order=order, status=StockReservation.STATUS_ACTIVE
+    ).update(status=StockReservation.STATUS_CONFIRMED)
+
+
+@transaction.atomic
+def confirm_order(order):
+    """Подтвердить заказ: резервы больше не истекают"""
+    confirmed = confirm_reservations(order)
+    Order.objects.filter(pk=order.pk, status=Order.STATUS_NEW).update(
+        status=Order.STATUS_IN_PROGRESS)
+    orders_changed([order.pk])
+    return confirmed
+
+
+def _release(reservations, order_status):
+    """
+    Снять резервы [(id, album_id, qty, order_id)] заказов в статусе
+    order_status и вернуть товар в остаток; число снятых резервов.
+    Выполняется в транзакции
+    """
+    returned, order_ids = Counter(), set()
+    released = 0
+    for reservation_id, album_id, qty, order_id in reservations:
+        # резерв снимает только один процесс, даже если их несколько, и
+        # только пока заказ в ожидаемом статусе: подтверждённый заказ
+        # уже не вернёт товар в продажу
+        if StockReservation.objects.filter(
+                pk=reservation_id, status=StockReservation.STATUS_ACTIVE,
+                order__status=order_status
+        ).update(status=StockReservation.STATUS_RELEASED):
+            returned[album_id] += qty
+            order_ids.add(order_id)
+            released += 1
+    restocked = list(Album.objects.filter(
+        pk__in=returned, stock=0).values_list('pk', flat=True))
+    for album_id in sorted(returned):
+        Album.objects.filter(pk=album_id).update(
+            stock=F('stock') + returned[album_id])
+    Order.objects.filter(
+        pk__in=order_ids, status=Order.STATUS_NEW
+    ).update(status=Order.STATUS_CANCELLED)
+    if returned:
+        stock_changed(returned, restocked)
+    orders_changed(order_ids)
+    return released
+
+
+def _release_batch(now):
+    expired = list(StockReservation.objects.filter(
+        status=StockReservation.STATUS_ACTIVE, expires_at__lte=now,
+        order__status=Order.STATUS_NEW
+    ).order_by('album_id', 'id').values_list(
+        'id', 'album_id', 'qty', 'order_id')[:RELEASE_BATCH_SIZE])
+    if not expired:
+        return 0, 0
+    with transaction.atomic():
+        released = _release(expired, Order.STATUS_NEW)
+    return len(expired), released
+
+
+@transaction.atomic
+def release_order(order):
+    """Заказ отменён: снять его резервы сразу, не дожидаясь срока"""
+    reservations = list(StockReservation.objects.filter(
+        order=order, status=StockReservation.STATUS_ACTIVE
+    ).order_by('album_id', 'id').values_list(
+        'id', 'album_id', 'qty', 'order_id'))
+    return _release(reservations, Order.STATUS_CANCELLED)
+
+
+def release_expired():
+    """Снять просроченные резервы и вернуть товар в остаток"""
+    now = timezone.now()
+    released = 0
+    while True:
+        fetched, count = _release_batch(now)
+        released += count
+        if fetched < RELEASE_BATCH_SIZE:
+            break
+    next_expiry = StockReservation.objects.filter(
+        status=StockReservation.STATUS_ACTIVE, order__status=Order.STATUS_NEW
+    ).order_by('expires_at').values_list('expires_at', flat=True).first()
+    if next_expiry is not None:
+        schedule_release(next_expiry)
+    return released
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Кэши, которые видит только свой процесс
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Настройки с алиасами кэшей, через которые процессы обмениваются
+# версиями каталога, снимком витрины и замерами
+SHARED_CACHE_SETTINGS = ('CATALOG_CACHE_ALIAS', 'PERF_CACHE_ALIAS')
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш каталога и замеров должен быть общим для всех процессов"""
+    errors = []
+    for setting in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, setting, 'default')
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(Warning(
+                f'{setting}: кэш "{alias}" ({backend}) виден только своему '
+                f'процессу',
+                hint='Изменения из админки и runworkers не дойдут до '
+                     'веб-воркеров, perfreport и catalog_cache_stats '
+                     'покажут пустые данные. Нужен FileBasedCache, '
+                     'memcached или другой общий кэш',
+                id='musicshop.W001'))
+    return errors
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+
+def fragment_cache(request):
+    """Срок и кэш для фрагментов {% cache %} - те же, что у страниц каталога"""
+    return {
+        'fragment_cache_timeout': getattr(
+            settings, 'CATALOG_CACHE_TIMEOUT', 60 * 15),
+        'fragment_cache_alias': getattr(
+            settings, 'CATALOG_CACHE_ALIAS', 'default'),
+    }
@@ -0,0 +1,330 @@
+"""
+Фасетный фильтр каталога: жанр, носитель, ценовой диапазон, наличие.
+
+Для каждого значения фасета хранится множество id альбомов в виде
+битовой маски (int: бит N - альбом с id N). Отбор по любой комбинации
+фильтров и счётчики всех значений считаются операциями над масками,
+без COUNT ... GROUP BY на каждый запрос. Индекс живёт в памяти процесса,
+обновляется сигналами (musicshop.signals); изменения в других процессах
+отслеживаются через счётчик поколения в кэше и журнал изменённых
+альбомов, как у поискового индекса: другие процессы перечитывают только
+эти альбомы, а целиком индекс строится заново лишь при смене
+справочников или если процесс отстал от журнала.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from .cache import get_catalog_cache
+from .models import Album, Genre, MediaType
+
+GENRE = 'genre'
+MEDIA_TYPE = 'media'
+PRICE = 'price'
+IN_STOCK = 'in_stock'
+
+FACETS = (GENRE, MEDIA_TYPE, PRICE, IN_STOCK)
+
+# Ценовые диапазоны: (ключ, название, от включительно, до не включая)
+PRICE_BANDS = (
+    ('0-20', 'до 20', Decimal(0), Decimal(20)),
+    ('20-50', '20 - 50', Decimal(20), Decimal(50)),
+    ('50-100', '50 - 100', Decimal(50), Decimal(100)),
+    ('100+', 'от 100', Decimal(100), None),
+)
+
+INDEX_BATCH_SIZE = 2000
+
+_PENDING = object()
+
+
+def price_band(price):
+    for key, label, low, high in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+
+def count_bits(mask):
+    return bin(mask).count('1')
+
+
+def iter_bits(mask, reverse=False):
+    """id альбомов из маски (reverse - от больших id к меньшим)"""
+    digits = format(mask, 'b')
+    if reverse:
+        top = len(digits) - 1
+        position = digits.find('1')
+        while position != -1:
+            yield top - position
+            position = digits.find('1', position + 1)
+    else:
+        digits = digits[::-1]
+        position = digits.find('1')
+        while position != -1:
+            yield position
+            position = digits.find('1', position + 1)
+
+
+class FacetIndex:
+    """Битовые маски альбомов по значениям фасетов"""
+
+    GENERATION_KEY = 'facets:generation'
+    # id альбомов, изменённых в поколении, или REBUILD
+    CHANGES_KEY = 'facets:changes:{generation}'
+    CHANGES_LIMIT = 100
+    CHANGES_TIMEOUT = 60 * 60
+    REBUILD = 'rebuild'
+    # сколько ждать записи журнала, уже увидев новое поколение, с
+    PENDING_WAIT = 1.0
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._masks = {facet: {} for facet in FACETS}
+        self._all = 0
+        self._albums = {}  # id альбома -> {фасет: значение}
+        self._labels = {}
+        self._genre_slugs = {}
+        self._params = {}
+        self._generation = None
+        self._pending_since = None
+
+    def _next_generation(self, change):
+        """Новое поколение и запись журнала о нём"""
+        cache = get_catalog_cache()
+        try:
+            generation = cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            generation = 1
+            cache.set(self.GENERATION_KEY, generation, timeout=None)
+        key = self.CHANGES_KEY.format(generation=generation)
+        # поколение уже кем-то записано (неатомарный incr) - изменения
+        # двух процессов не различить, пусть все перестроятся
+        if not cache.add(key, change, timeout=self.CHANGES_TIMEOUT):
+            cache.set(key, self.REBUILD, timeout=self.CHANGES_TIMEOUT)
+
+    def _changed_ids(self, since, until):
+        """id альбомов, изменённых после поколения since; None - перестроить"""
+        if since is None or not since < until <= since + self.CHANGES_LIMIT:
+            return None
+        names = [self.CHANGES_KEY.format(generation=generation)
+                 for generation in range(since + 1, until + 1)]
+        changes = get_catalog_cache().get_many(names)
+        if len(changes) != len(names):
+            now = time.monotonic()
+            if self._pending_since is None:
+                self._pending_since = now
+            if now - self._pending_since < self.PENDING_WAIT:
+                return _PENDING
+            return None
+        if self.REBUILD in changes.values():
+            return None
+        return {album_id for change in changes.values()
+                for album_id in change}
+
+    def _sync(self):
+        cache = get_catalog_cache()
+        cache.add(self.GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(self.GENERATION_KEY)
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation == self._generation:
+                return
+            ids = self._changed_ids(self._generation, generation)
+            if ids is _PENDING:
+                return
+            self._pending_since = None
+            if ids is None:
+                self._build()
+            else:
+                self._reload(ids)
+            self._generation = generation
+
+    def _build(self):
+        self._masks = {facet: {} for facet in FACETS}
+        self._all = 0
+        self._albums = {}
+        genres = Genre.objects.order_by('name')
+        media_types = MediaType.objects.order_by('name')
+        self._labels = {
+            GENRE: {genre.id: genre.name for genre in genres},
+            MEDIA_TYPE: {media.id: media.name for media in media_types},
+            PRICE: {key: label for key, label, low, high in PRICE_BANDS},
+            IN_STOCK: {True: 'В наличии'},
+        }
+        self._genre_slugs = {genre.slug: genre.id for genre in genres}
+        self._params = {
+            GENRE: {genre.id: genre.slug for genre in genres},
+            IN_STOCK: {True: '1'},
+        }
+        rows = Album.objects.values_list(
+            'id', 'artist__genre_id', 'media_type_id', 'price', 'stock')
+        for row in rows.iterator(chunk_size=INDEX_BATCH_SIZE):
+            self._add(*row)
+
+    def _reload(self, ids):
+        """Перечитать альбомы из БД (удалённые просто не найдутся)"""
+        ids = list(ids)
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            chunk = ids[start:start + INDEX_BATCH_SIZE]
+            rows = Album.objects.filter(id__in=chunk).values_list(
+                'id', 'artist__genre_id', 'media_type_id', 'price', 'stock')
+            for album_id in chunk:
+                self._remove(album_id)
+            for row in rows:
+                self._add(*row)
+
+    def _add(self, album_id, genre_id, media_type_id, price, stock):
+        values = {
+            GENRE: genre_id,
+            MEDIA_TYPE: media_type_id,
+            PRICE: price_band(price),
+            IN_STOCK: True if stock > 0 else None,
+        }
+        bit = 1 << album_id
+        for facet, value in values.items():
+            if value is not None:
+                masks = self._masks[facet]
+                masks[value] = masks.get(value, 0) | bit
+        self._all |= bit
+        self._albums[album_id] = values
+
+    def _remove(self, album_id):
+        values = self._albums.pop(album_id, None)
+        if values is None:
+            return
+        bit = 1 << album_id
+        self._all &= ~bit
+        for facet, value in values.items():
+            if value is not None:
+                masks = self._masks[facet]
+                masks[value] &= ~bit
+                if not masks[value]:
+                    del masks[value]
+
+    def update_albums(self, ids):
+        """
+        Пересчитать положение альбомов в масках (удалённые - убрать).
+        Вызывается после фиксации: другие процессы перечитают их же
+        """
+        ids = sorted(set(ids))
+        if not ids:
+            return
+        self._next_generation(ids)
+        # индекс ещё не построен в этом процессе - достаточно поколения
+        if self._generation is not None:
+            self._sync()
+
+    def remove_albums(self, ids):
+        self.update_albums(ids)
+
+    def invalidate(self):
+        """Полная перестройка во всех процессах (изменились справочники)"""
+        self._next_generation(self.REBUILD)
+        if self._generation is not None:
+            self._sync()
+
+    def parse_filters(self, params):
+        """
+        Фильтры из GET-параметров: ?genre=<slug>&media=<id>&price=<ключ>
+        &in_stock=1, значения одного фасета объединяются через ИЛИ
+        """
+        self._sync()
+        filters = {}
+        genres = {self._genre_slugs[slug] for slug in params.getlist(GENRE)
+                  if slug in self._genre_slugs}
+        media_types = {int(value) for value in params.getlist(MEDIA_TYPE)
+                       if value.isdigit()}
+        prices = {key for key in params.getlist(PRICE)
+                  if key in self._labels[PRICE]}
+        for facet, values in ((GENRE, genres), (MEDIA_TYPE, media_types),
+                              (PRICE, prices)):
+            if values:
+                filters[facet] = values
+        if params.get(IN_STOCK) in ('1', 'true', 'on'):
+            filters[IN_STOCK] = {True}
+        return filters
+
+    def query(self, filters):
+        """
+        Маска альбомов, подходящих под все фильтры, и счётчики значений
+        каждого фасета: для фасета учитываются фильтры остальных
+        фасетов, чтобы было видно, сколько даст выбор ещё одного значения
+        """
+        self._sync()
+        with self._lock:
+            masks = self._masks
+            labels = self._labels
+            params = self._params
+            everything = self._all
+            selected = {}
+            for facet, values in filters.items():
+                selected[facet] = 0
+                for value in values:
+                    selected[facet] |= masks[facet].get(value, 0)
+            result = everything
+            for mask in selected.values():
+                result &= mask
+            counts = {}
+            for facet in FACETS:
+                base = everything
+                for other, mask in selected.items():
+                    if other != facet:
+                        base &= mask
+                counts[facet] = [
+                    {
+                        'value': value,
+                        'param': params.get(facet, {}).get(value, str(value)),
+                        'label': label,
+                        'count': count_bits(
+                            base & masks[facet].get(value, 0)),
+                        'selected': value in filters.get(facet, ()),
+                    }
+                    for value, label in labels[facet].items()
+                ]
+        return result, counts
+
+
+_index = None
+
+
+def get_facet_index():
+    global _index
+    if _index is None:
+        _index = FacetIndex()
+    return _index
+
+
+class FacetResults:
+    """
+    Результат фасетного отбора для Paginator: альбомы от новых
+    добавленных к старым, загружаются только объекты страницы
+    """
+
+    def __init__(self, mask):
+        self.mask = mask
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = count_bits(self.mask)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        stop = item.stop if item.stop is not None else self.count()
+        ids = []
+        for position, album_id in enumerate(iter_bits(self.mask, True)):
+            if position >= stop:
+                break
+            if position >= offset:
+                ids.append(album_id)
+        albums = Album.objects.select_related(
+            'artist', 'media_type').in_bulk(ids)
+        return [albums[album_id] for album_id in ids if album_id in albums]
@@ -1,36 +1,55 @@
 from django import forms
 from django.contrib.auth import get_user_model
 
+from .models import Order
+
 User = get_user_model()
 
 
-class LoginForm(forms.ModelForm):
-    """Форма для входа"""
-    password = forms.CharField(widget=forms.PasswordInput)
+class LoginForm(forms.Form):
+    """
+    Форма для входа. Обычная Form, а не ModelForm: ModelForm строит
+    экземпляр User и может проверять уникальность логина, а для входа
+    нужен лишь поиск пользователя. Пользователь ищется одним запросом,
+    пароль проверяется один раз, найденный пользователь - form.user
+    """
 
-    def clean(self):
-        username = self.cleaned_data['username']
-        password = self.cleaned_data['password']
-        user = User.objects.filter(username=username).first()
-        if not user:  # None
-            raise forms.ValidationError(
-                f'Пользователь с логином {username} не найден в системе')
-        if not user.check_password(password):
-            raise forms.ValidationError('Неверный пароль')
-        return self.cleaned_data
+    INVALID_LOGIN = 'Неверный логин или пароль'
+
+    username = forms.CharField(max_length=150)
+    password = forms.CharField(widget=forms.PasswordInput)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.user = None
         self.fields['username'].label = 'Логин'
         self.fields['password'].label = 'Пароль'
 
-    class Meta:
-        model = User
-        fields = ('username', 'password')
+    def clean(self):
+        username = self.cleaned_data.get('username')
+        password = self.cleaned_data.get('password')
+        if not username or not password:
+            return self.cleaned_data
+        user = User._default_manager.filter(username=username).first()
+        if not user:  # None
+            # хэш считается и для несуществующего логина, как в
+            # ModelBackend: по времени ответа логин не подобрать
+            User().set_password(password)
+        # одна ошибка на неизвестный логин и неверный пароль - иначе
+        # форма подсказывает, какие логины есть в системе
+        if not user or not user.check_password(password):
+            raise forms.ValidationError(self.INVALID_LOGIN)
+        if not user.is_active:
+            raise forms.ValidationError('Пользователь заблокирован')
+        self.user = user
+        return self.cleaned_data
 
 
 class RegistrationsForm(forms.ModelForm):
-    """Форма для регистрации нового пользователя"""
+    """
+    Форма для регистрации нового пользователя. save() хэширует пароль
+    один раз и сохраняет пользователя одним INSERT
+    """
 
     password = forms.CharField(widget=forms.PasswordInput)
     confirm_password = forms.CharField(widget=forms.PasswordInput)
@@ -57,8 +76,8 @@ class RegistrationsForm(forms.ModelForm):
         return username
 
     def clean(self):
-        password = self.cleaned_data['password']
-        confirm_password = self.cleaned_data['confirm_password']
+        password = self.cleaned_data.get('password')
+        confirm_password = self.cleaned_data.get('confirm_password')
         if password != confirm_password:
             raise forms.ValidationError('Пароли не совпадают')
         return self.cleaned_data
@@ -74,7 +93,51 @@ class RegistrationsForm(forms.ModelForm):
         self.fields['address'].label = 'Адрес'
         self.fields['email'].label = 'Почта'
 
+    def save(self, commit=True):
+        user = super().save(commit=False)
+        user.set_password(self.cleaned_data['password'])
+        if commit:
+            user.save()
+        return user
+
     class Meta:
         model = User
         fields = ('username', 'password', 'confirm_password', 'first_name',
                   'last_name', 'phone', 'address', 'email')
+
+
+class OrderForm(forms.ModelForm):
+    """Форма оформления заказа"""
+
+    order_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['order_date'].label = 'Дата получения заказа'
+
+    class Meta:
+        model = Order
+        fields = ('first_name', 'last_name', 'phone', 'address',
+                  'buying_type', 'order_date', 'comment')
+
+
+class OrderReportForm(forms.Form):
+    """Период и статус для отчёта и выгрузки заказов (GET-параметры)"""
+
+    start = forms.DateField(
+        required=False, label='С',
+        widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(
+        required=False, label='По',
+        widget=forms.DateInput(attrs={'type': 'date'}))
+    status = forms.ChoiceField(
+        required=False, label='Статус',
+        choices=(('', 'Все'),) + Order.STATUS_CHOICES)
+
+    def clean(self):
+        start = self.cleaned_data.get('start')
+        end = self.cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('Начало периода позже конца')
+        return self.cleaned_data
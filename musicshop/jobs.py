@@ -0,0 +1,163 @@
+"""
+Очередь фоновых задач в БД, без Redis/Celery.
+
+Задача - строка Job с именем зарегистрированного обработчика и
+JSON-параметрами. enqueue() ставит её в очередь, manage.py runworkers
+забирает задачи пачками и выполняет в пуле потоков или процессов:
+с повторами (экспоненциальная задержка), ключами идемпотентности
+и временем выполнения каждой задачи.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Avg, Count, F, Max
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def register(name):
+    """@register('images.generate_variants') - обработчик задачи"""
+
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=3):
+    """
+    Поставить задачу в очередь. Пока задача с тем же key ждёт в очереди,
+    повторный вызов возвращает её, а не создаёт новую
+    """
+    if name not in HANDLERS:
+        raise KeyError(f'Неизвестная задача: {name}')
+    if getattr(settings, 'JOBS_EAGER', False):
+        HANDLERS[name](**(payload or {}))
+        return None
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'idempotency_key': key,
+        'max_attempts': max_attempts,
+        'run_after': timezone.now() + timedelta(seconds=delay),
+    }
+    if key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(**fields)
+    except IntegrityError:
+        # ожидавшую задачу могли уже забрать - тогда вернётся она же,
+        # но в статусе выполнения
+        return Job.objects.filter(idempotency_key=key).order_by('-id').first()
+
+
+def enqueue_on_commit(name, payload=None, key=None, **kwargs):
+    """Поставить задачу после фиксации текущей транзакции"""
+    transaction.on_commit(lambda: enqueue(name, payload, key, **kwargs))
+
+
+def claim(limit):
+    """
+    Забрать до limit готовых задач. Условный UPDATE по статусу
+    гарантирует, что задачу заберёт только один воркер
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.STATUS_QUEUED, run_after__lte=now
+    ).order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+    claimed = []
+    for job_id in candidates:
+        updated = Job.objects.filter(
+            id=job_id, status=Job.STATUS_QUEUED
+        ).update(status=Job.STATUS_RUNNING, started_at=now,
+                 attempts=F('attempts') + 1)
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale(timeout):
+    """
+    Вернуть в очередь задачи, чей воркер пропал (дольше timeout, с).
+    Если с тем же ключом уже ждёт новая задача, зависшая помечается
+    ошибкой: выполнится новая
+    """
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).values_list('id', flat=True)
+    requeued = 0
+    for job_id in list(stale):
+        running = Job.objects.filter(id=job_id, status=Job.STATUS_RUNNING)
+        try:
+            with transaction.atomic():
+                requeued += running.update(status=Job.STATUS_QUEUED)
+        except IntegrityError:
+            running.update(
+                status=Job.STATUS_FAILED, finished_at=timezone.now(),
+                last_error='Воркер пропал, задача с тем же ключом '
+                           'уже в очереди')
+    return requeued
+
+
+def run_job(job_id):
+    """Выполнить забранную задачу и записать результат"""
+    close_old_connections()
+    try:
+        job = Job.objects.get(id=job_id)
+        started = time.perf_counter()
+        try:
+            handler = HANDLERS[job.name]
+            handler(**job.payload)
+        except Exception:
+            job.duration = time.perf_counter() - started
+            job.last_error = traceback.format_exc()
+            logger.warning('Задача %s #%s завершилась ошибкой (попытка %s)',
+                           job.name, job.id, job.attempts)
+            if job.attempts < job.max_attempts:
+                job.status = Job.STATUS_QUEUED
+                job.run_after = timezone.now() + timedelta(
+                    seconds=2 ** job.attempts)
+            else:
+                job.status = Job.STATUS_FAILED
+                job.finished_at = timezone.now()
+        else:
+            job.duration = time.perf_counter() - started
+            job.status = Job.STATUS_DONE
+            job.finished_at = timezone.now()
+        try:
+            with transaction.atomic():
+                job.save(update_fields=[
+                    'status', 'run_after', 'finished_at', 'duration',
+                    'last_error'])
+        except IntegrityError:
+            # повтор совпал с новой задачей с тем же ключом - выполнится
+            # она, а эта попытка остаётся неудачной
+            job.status = Job.STATUS_FAILED
+            job.finished_at = timezone.now()
+            job.last_error += ('Повтор не поставлен: задача с тем же '
+                               'ключом уже в очереди\n')
+            job.save(update_fields=['status', 'finished_at', 'last_error'])
+        return job.status
+    finally:
+        close_old_connections()
+
+
+def job_stats():
+    """Метрики по задачам: количество, среднее и максимальное время"""
+    return list(
+        Job.objects.values('name', 'status').annotate(
+            count=Count('id'), avg_duration=Avg('duration'),
+            max_duration=Max('duration')
+        ).order_by('name', 'status'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Счётчики попаданий/промахов кэша страниц каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(
+            f'hits: {stats["hit"]}, misses: {stats["miss"]}, '
+            f'hit ratio: {stats["hit_ratio"]:.1%}')
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,92 @@
+import re
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from musicshop.models import (
+    Album, Artist, CartProduct, ImageGallery, Job, Notification, Order)
+
+
+def hot_paths():
+    """Ключевые запросы витрины, админки и отчётов по заказам"""
+    album_ct = ContentType.objects.get_for_model(Album)
+    month_ago = timezone.now().date() - timedelta(days=30)
+    return [
+        ('album_detail', Album.objects.filter(slug='slug')),
+        ('artist_detail', Artist.objects.filter(slug='slug')),
+        ('offer_of_the_week', Album.objects.filter(offer_of_the_week=True)),
+        ('new_releases', Album.objects.order_by('-release_date')[:12]),
+        ('cheapest', Album.objects.order_by('price')[:12]),
+        ('artist_albums_page',
+         Album.objects.filter(artist_id=1).filter(
+             Q(release_date__lt=month_ago)
+             | Q(release_date=month_ago, id__lt=1)
+         ).order_by('-release_date', '-id')[:25]),
+        ('media_type_albums_page',
+         Album.objects.filter(media_type_id=1).filter(
+             Q(price__gt=0) | Q(price=0, id__gt=1)
+         ).order_by('price', 'id')[:25]),
+        ('orders_by_status',
+         Order.objects.filter(status=Order.STATUS_NEW).order_by(
+             '-created_at')[:50]),
+        ('orders_last_month', Order.objects.filter(created_at__gte=month_ago)),
+        ('unread_notifications',
+         Notification.objects.filter(recipient_id=1, read=False)),
+        ('cart_lines_for_product',
+         CartProduct.objects.filter(content_type=album_ct, object_id=1)),
+        ('gallery_for_object',
+         ImageGallery.objects.filter(content_type=album_ct, object_id=1)),
+        ('jobs_ready',
+         Job.objects.filter(
+             status=Job.STATUS_QUEUED, run_after__lte=timezone.now()
+         ).order_by('run_after', 'id')[:10]),
+    ]
+
+
+# SQLite: "SCAN musicshop_album" (или "SCAN TABLE ...") без "USING ... INDEX"
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+
+
+def explain(queryset):
+    """План запроса и признак полного сканирования таблицы"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+            full_scan = any(SQLITE_FULL_SCAN.match(line) for line in plan)
+        elif connection.vendor == 'postgresql':
+            # на маленьких таблицах планировщик выбирает Seq Scan и при
+            # наличии индекса: запрещаем его, чтобы проверить сам индекс
+            with transaction.atomic():
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+                plan = [row[0] for row in cursor.fetchall()]
+            full_scan = any('Seq Scan' in line for line in plan)
+        else:
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается')
+    return plan, full_scan
+
+
+class Command(BaseCommand):
+    help = ('Проверить планы ключевых запросов: ошибка, если какой-то '
+            'из них читает таблицу целиком')
+
+    def handle(self, *args, **options):
+        failed = []
+        for name, queryset in hot_paths():
+            plan, full_scan = explain(queryset)
+            status = 'FULL SCAN' if full_scan else 'ok'
+            self.stdout.write(f'{name}: {status}')
+            for line in plan:
+                self.stdout.write(f'    {line}')
+            if full_scan:
+                failed.append(name)
+        if failed:
+            raise CommandError(
+                f'Полное сканирование таблицы: {", ".join(failed)}')
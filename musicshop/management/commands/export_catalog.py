@@ -0,0 +1,33 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from musicshop.catalog_io import (
+    FIELDS, FORMATS, RowWriter, catalog_file, export_rows)
+
+
+class Command(BaseCommand):
+    help = ('Экспорт каталога в каталог directory: по файлу на сущность '
+            '(формат - для import_catalog)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        directory.mkdir(parents=True, exist_ok=True)
+        for kind, fields in FIELDS.items():
+            path = catalog_file(directory, kind, options['format'])
+            started = time.perf_counter()
+            rows = 0
+            with open(path, 'w', encoding='utf-8', newline='') as file:
+                writer = RowWriter(file, fields, options['format'])
+                for row in export_rows(kind):
+                    writer.write(row)
+                    rows += 1
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{path.name:18} {rows:>8} строк, '
+                f'{rows / elapsed if elapsed else 0:>9.0f} строк/с')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.media import blob_stats, collect_garbage
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.2f} МБ'
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать ссылки на загруженные файлы по полям изображений и '
+            'удалить файлы без ссылок; вывести, сколько места сэкономлено '
+            'на одинаковых файлах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено')
+        parser.add_argument(
+            '--grace', type=int,
+            help='Не трогать файлы моложе N секунд '
+                 '(по умолчанию MEDIA_GC_GRACE)')
+
+    def handle(self, *args, **options):
+        removed, freed = collect_garbage(
+            grace=options['grace'], dry_run=options['dry_run'])
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(f'{verb} файлов: {removed} ({_megabytes(freed)})')
+        stats = blob_stats()
+        self.stdout.write(
+            f'Файлов по содержимому: {stats["blobs"]}, на диске '
+            f'{_megabytes(stats["stored"])}, по ссылкам '
+            f'{_megabytes(stats["referenced"])}, сэкономлено '
+            f'{_megabytes(stats["saved"])}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.models import Album, Artist, ImageGallery, Member
+from utils.images import generate_variants
+
+
+class Command(BaseCommand):
+    help = 'Создать миниатюры и webp-варианты для уже загруженных изображений'
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in (Member, Artist, Album, ImageGallery):
+            images = model.objects.exclude(image='').values_list(
+                'pk', 'image')
+            for pk, name in images.iterator():
+                field_file = model(pk=pk, image=name).image
+                try:
+                    generate_variants(field_file)
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f'{model.__name__} #{pk} {name}: {error}')
+                    continue
+                total += 1
+        self.stdout.write(f'Обработано изображений: {total}')
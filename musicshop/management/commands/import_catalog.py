@@ -0,0 +1,57 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from musicshop.catalog_io import (
+    BATCH_SIZE, FIELDS, FORMATS, CatalogImportError, CatalogImporter,
+    catalog_file, refresh_catalog)
+
+
+class Command(BaseCommand):
+    help = ('Импорт каталога из файлов genres, media_types, members, '
+            'artists, albums (.csv или .jsonl) в каталоге directory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        files = []
+        for kind in FIELDS:
+            paths = [catalog_file(directory, kind, file_format)
+                     for file_format in FORMATS]
+            paths = [path for path in paths if path.exists()]
+            if len(paths) > 1:
+                raise CommandError(
+                    f'{kind}: несколько файлов ({", ".join(map(str, paths))})')
+            files += [(kind, path) for path in paths]
+        if not files:
+            raise CommandError(f'В {directory} нет файлов каталога')
+
+        total_started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                importer = CatalogImporter(options['batch_size'])
+                changed = False
+                for kind, path in files:
+                    started = time.perf_counter()
+                    created, updated, unchanged = importer.import_file(
+                        kind, path)
+                    elapsed = time.perf_counter() - started
+                    rows = created + updated + unchanged
+                    changed = changed or created or updated
+                    self.stdout.write(
+                        f'{path.name:18} создано {created:>7}, обновлено '
+                        f'{updated:>7}, без изменений {unchanged:>7}, '
+                        f'{rows / elapsed if elapsed else 0:>8.0f} строк/с')
+                if changed:
+                    refresh_catalog()
+        except CatalogImportError as error:
+            raise CommandError(f'Импорт отменён: {error}')
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - total_started:.1f} с'
+            + (' (с перестройкой поиска и фасетов)' if changed
+               else ', каталог не изменился'))
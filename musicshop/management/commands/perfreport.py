@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.perf import clear_stats, collected_stats, percentile
+
+
+class Command(BaseCommand):
+    help = ('Перцентили времени ответа по именам url '
+            '(замеры musicshop.perf.PerformanceMiddleware)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutes', type=int, default=15,
+            help='За сколько последних минут считать')
+        parser.add_argument(
+            'url_names', nargs='*', help='Только эти имена url')
+        parser.add_argument(
+            '--reset', action='store_true', help='Удалить замеры')
+
+    def handle(self, *args, **options):
+        stats = collected_stats(options['minutes'])
+        names = options['url_names'] or sorted(stats)
+        self.stdout.write(
+            f'{"url":20} {"n":>6} {"p50":>8} {"p95":>8} {"p99":>8} '
+            f'{"db p95":>8} {"tpl p95":>8} {"queries":>8} {"cache hit":>9}')
+        for name in names:
+            item = stats.get(name)
+            if not item or not item['count']:
+                self.stdout.write(f'{name:20} {0:>6}')
+                continue
+            lookups = item['cache_hits'] + item['cache_misses']
+            hit_ratio = (f'{item["cache_hits"] / lookups:.0%}'
+                         if lookups else '-')
+            self.stdout.write(
+                f'{name:20} {item["count"]:>6} '
+                f'{percentile(item["wall"], 50):>6.1f}ms '
+                f'{percentile(item["wall"], 95):>6.1f}ms '
+                f'{percentile(item["wall"], 99):>6.1f}ms '
+                f'{percentile(item["db"], 95):>6.1f}ms '
+                f'{percentile(item["template"], 95):>6.1f}ms '
+                f'{item["queries"] / item["count"]:>8.1f} '
+                f'{hit_ratio:>9}')
+        if options['reset']:
+            clear_stats(options['minutes'])
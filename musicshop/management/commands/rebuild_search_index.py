@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from musicshop.search import get_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестроить поисковый индекс каталога'
+
+    def handle(self, *args, **options):
+        index = get_search_index()
+        started = time.perf_counter()
+        index.rebuild()
+        self.stdout.write(
+            f'{index.__class__.__name__}: индекс перестроен за '
+            f'{time.perf_counter() - started:.2f} с')
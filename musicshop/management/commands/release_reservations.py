@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from musicshop.checkout import release_expired
+
+
+class Command(BaseCommand):
+    help = ('Снять просроченные резервы товара и вернуть его в остаток '
+            '(для запуска по cron, если фоновые воркеры не запущены)')
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(f'Снято резервов: {released}')
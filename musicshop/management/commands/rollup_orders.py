@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from musicshop.models import Order, OrderDailyRollup
+from musicshop.reports import rollup_day
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать итоги заказов по дням (первичное заполнение '
+            'или исправление; обычно их обновляет задача reports.rollup_day)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Только последние N дней (по умолчанию - все дни с заказами)')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        rollups = OrderDailyRollup.objects.all()
+        if options['days']:
+            since = timezone.localdate() - timedelta(days=options['days'] - 1)
+            orders = orders.filter(created_at__gte=since)
+            rollups = rollups.filter(day__gte=since)
+        # дни из итогов - чтобы убрать итоги дней, заказы которых удалены
+        days = set(orders.values_list('created_at', flat=True).distinct())
+        days |= set(rollups.values_list('day', flat=True).distinct())
+        started = time.perf_counter()
+        for day in sorted(days):
+            rollup_day(day)
+        self.stdout.write(
+            f'Пересчитано дней: {len(days)} за '
+            f'{time.perf_counter() - started:.2f} с')
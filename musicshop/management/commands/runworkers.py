@@ -0,0 +1,77 @@
+import signal
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait)
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from musicshop.jobs import claim, job_stats, requeue_stale, run_job
+
+
+def _init_process():
+    # соединения с БД родителя не должны использоваться в дочернем процессе
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Выполнять фоновые задачи из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default='thread')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='пауза, когда очередь пуста, с')
+        parser.add_argument(
+            '--stale-timeout', type=int, default=600,
+            help='через сколько секунд зависшая задача возвращается в очередь')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='выполнить всё, что есть в очереди, и завершиться')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        workers = options['workers']
+        if options['pool'] == 'process':
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, initializer=_init_process)
+        else:
+            pool = ThreadPoolExecutor(workers)
+
+        running = set()
+        processed = 0
+        requeue_stale(options['stale_timeout'])
+        with pool:
+            while not self.stopping:
+                free = workers - len(running)
+                job_ids = claim(free) if free else []
+                running |= {pool.submit(run_job, job_id) for job_id in job_ids}
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    requeue_stale(options['stale_timeout'])
+                    continue
+                done, running = wait(
+                    running, timeout=options['poll_interval'],
+                    return_when=FIRST_COMPLETED)
+                processed += len(done)
+            wait(running)
+        processed += len(running)
+        self.stdout.write(f'Выполнено задач: {processed}')
+        self.print_stats()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def print_stats(self):
+        for row in job_stats():
+            self.stdout.write(
+                f'{row["name"]:<32} {row["status"]:<8} {row["count"]:>7} '
+                f'avg {row["avg_duration"] or 0:.3f} с, '
+                f'max {row["max_duration"] or 0:.3f} с')
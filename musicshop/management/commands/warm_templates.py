@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.templates import warm_templates
+
+
+class Command(BaseCommand):
+    help = ('Скомпилировать все шаблоны: проверка перед выкладкой. '
+            'Сам прогрев кэша шаблонов - при запуске wsgi/asgi '
+            '(TEMPLATE_WARMUP), кэш у каждого процесса свой')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        compiled, errors = warm_templates()
+        self.stdout.write(
+            f'Скомпилировано шаблонов: {compiled} за '
+            f'{time.perf_counter() - started:.2f} с')
+        for name, error in errors.items():
+            self.stderr.write(f'{name}: {error.__class__.__name__}: {error}')
+        if errors:
+            raise CommandError(f'Шаблонов с ошибками: {len(errors)}')
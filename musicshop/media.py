@@ -0,0 +1,192 @@
+"""
+Ссылки на файлы хранилища по содержимому (utils.media_storage).
+
+Одинаковое изображение у альбома, исполнителя и в галерее - один файл
+blobs/ab/cd/<sha256>.<ext> и одна строка MediaBlob, refs - число полей,
+которые на него ссылаются. refs меняют сигналы сохранения и удаления
+объектов с изображением; массовые операции (bulk_create, update,
+import_catalog) их обходят, поэтому gc_media сначала пересчитывает refs
+по самим полям, а потом удаляет файлы без ссылок вместе с вариантами.
+
+Файл удаляется, только если ни ссылок, ни загрузок его содержимого не
+было дольше MEDIA_GC_GRACE: форма, которая только что сохранила файл,
+ещё не успела записать объект.
+"""
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from utils.media_storage import (
+    BLOB_DIR, BLOB_PATH, TMP_DIR, is_blob_name)
+
+from .models import Album, Artist, ImageGallery, MediaBlob, Member
+
+# Поля, из которых считаются ссылки на файлы
+IMAGE_FIELDS = (
+    (Member, 'image'),
+    (Artist, 'image'),
+    (Album, 'image'),
+    (ImageGallery, 'image'),
+)
+
+
+def _size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def add_reference(name):
+    """Поле стало ссылаться на файл name (прочие имена не учитываются)"""
+    if not is_blob_name(name):
+        return
+    blob, _ = MediaBlob.objects.get_or_create(
+        name=name, defaults={'size': _size(name)})
+    MediaBlob.objects.filter(pk=blob.pk).update(
+        refs=F('refs') + 1, updated_at=timezone.now())
+
+
+def release_reference(name):
+    """Поле перестало ссылаться на файл name"""
+    if not is_blob_name(name):
+        return
+    MediaBlob.objects.filter(name=name).update(
+        refs=F('refs') - 1, updated_at=timezone.now())
+
+
+def referenced_blobs():
+    """Число ссылок на каждый файл по полям IMAGE_FIELDS"""
+    counts = Counter()
+    for model, field in IMAGE_FIELDS:
+        names = model.objects.filter(
+            **{f'{field}__startswith': f'{BLOB_DIR}/'}).values_list(
+            field, flat=True)
+        counts.update(name for name in names.iterator() if is_blob_name(name))
+    return counts
+
+
+def recount():
+    """Привести refs к числу ссылок из полей; (ссылки по файлам, исправлено)"""
+    counts = referenced_blobs()
+    now = timezone.now()
+    fixed = 0
+    known = dict(MediaBlob.objects.values_list('name', 'refs'))
+    for name, refs in known.items():
+        if refs != counts.get(name, 0):
+            MediaBlob.objects.filter(name=name).update(
+                refs=counts.get(name, 0), updated_at=now)
+            fixed += 1
+    missing = [MediaBlob(name=name, size=_size(name), refs=refs)
+               for name, refs in counts.items() if name not in known]
+    MediaBlob.objects.bulk_create(missing, ignore_conflicts=True)
+    return counts, fixed + len(missing)
+
+
+def _blob_files(storage):
+    """(имя, путь, stat) всех файлов каталога blob-ов, кроме временных"""
+    root = storage.path(BLOB_DIR)
+    tmp_dir = storage.path(TMP_DIR)
+    for directory, subdirs, files in os.walk(root):
+        if directory == tmp_dir:
+            subdirs[:] = []
+            continue
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            try:
+                yield name, path, os.stat(path)
+            except FileNotFoundError:
+                continue
+
+
+def collect_garbage(grace=None, dry_run=False):
+    """
+    Удалить файлы без ссылок (и их варианты), не нужные дольше grace
+    секунд, и брошенные временные файлы загрузок; (файлов, байт)
+    """
+    storage = default_storage
+    if grace is None:
+        grace = getattr(settings, 'MEDIA_GC_GRACE', 60 * 60 * 24)
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    if dry_run:
+        counts = referenced_blobs()
+    else:
+        counts, _ = recount()
+    if not os.path.isdir(storage.path(BLOB_DIR)):
+        return 0, 0
+
+    removed = freed = 0
+    present = set()
+    variants = []
+    for name, path, stat in list(_blob_files(storage)):
+        if not is_blob_name(name):
+            if BLOB_PATH.match(name):
+                variants.append((name, path))
+            continue
+        present.add(name)
+        if counts.get(name) or stat.st_mtime >= cutoff.timestamp():
+            continue
+        recent = MediaBlob.objects.filter(
+            name=name).filter(Q(refs__gt=0) | Q(updated_at__gte=cutoff))
+        if recent.exists():
+            continue
+        removed += 1
+        freed += stat.st_size
+        if not dry_run:
+            MediaBlob.objects.filter(name=name, refs__lte=0).delete()
+            storage.delete(name)
+        present.discard(name)
+
+    # варианты удалённых файлов (варианты появляются только после
+    # оригинала, поэтому срок не проверяется) и временные файлы
+    # прерванных загрузок
+    stems = {_stem(name) for name in present}
+    leftovers = [path for name, path in variants
+                 if _stem(name) not in stems]
+    tmp_dir = storage.path(TMP_DIR)
+    if os.path.isdir(tmp_dir):
+        leftovers += [
+            entry.path for entry in os.scandir(tmp_dir) if entry.is_file()
+            and entry.stat().st_mtime < cutoff.timestamp()]
+    for path in leftovers:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        freed += stat.st_size
+        if not dry_run:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    if not dry_run:
+        # строки без ссылок, файлы которых уже удалены
+        stale = MediaBlob.objects.filter(refs__lte=0, updated_at__lt=cutoff)
+        MediaBlob.objects.filter(pk__in=[
+            pk for pk, name in stale.values_list('pk', 'name')
+            if name not in present]).delete()
+    return removed, freed
+
+
+def _stem(name):
+    """blobs/ab/cd/<hash>.jpg и blobs/ab/cd/<hash>_400w.webp -> <hash>"""
+    return name.rsplit('/', 1)[-1].split('.', 1)[0].split('_', 1)[0]
+
+
+def blob_stats():
+    """Файлов и байт на диске, байт по ссылкам и сэкономлено на повторах"""
+    totals = MediaBlob.objects.aggregate(
+        blobs=Count('id'),
+        stored=Sum('size'),
+        referenced=Sum(F('size') * F('refs'), filter=Q(refs__gt=0)),
+        referenced_stored=Sum('size', filter=Q(refs__gt=0)))
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['saved'] = totals['referenced'] - totals.pop('referenced_stored')
+    return totals
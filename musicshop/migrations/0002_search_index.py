@@ -0,0 +1,34 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:06
+
+from django.db import migrations, utils
+
+FTS_TABLE = 'musicshop_search'
+
+
+def create_fts_table(apps, schema_editor):
+    """Таблица FTS5 - только для SQLite, собранного с поддержкой FTS5"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            'name, people, genre, description, songs_list, '
+            "tokenize = 'unicode61 remove_diacritics 2')")
+    except utils.OperationalError:
+        pass  # без FTS5 поиск работает на индексе в памяти
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
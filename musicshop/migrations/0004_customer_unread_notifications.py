@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_unread_notifications(apps, schema_editor):
+    """Начальные значения счётчика - по уже существующим уведомлениям"""
+    Customer = apps.get_model('musicshop', 'Customer')
+    Notification = apps.get_model('musicshop', 'Notification')
+    unread = Notification.objects.filter(
+        recipient=models.OuterRef('pk'), read=False
+    ).order_by().values('recipient').annotate(
+        count=models.Count('id')).values('count')
+    Customer.objects.update(unread_notifications=Coalesce(
+        models.Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, verbose_name='Непрочитанных уведомлений'),
+        ),
+        migrations.RunPython(
+            fill_unread_notifications, migrations.RunPython.noop),
+    ]
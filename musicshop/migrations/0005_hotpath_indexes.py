@@ -0,0 +1,45 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0004_customer_unread_notifications'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['release_date'], name='musicshop_a_release_e90d92_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['price'], name='musicshop_a_price_097a38_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(condition=models.Q(('offer_of_the_week', True)), fields=['offer_of_the_week'], name='musicshop_album_offer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartproduct',
+            index=models.Index(fields=['content_type', 'object_id'], name='musicshop_c_content_d44f62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagegallery',
+            index=models.Index(fields=['content_type', 'object_id'], name='musicshop_i_content_21e00d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'read'], name='musicshop_n_recipie_a5825a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='musicshop_o_status_dd8e38_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='musicshop_o_created_c77d3e_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0005_hotpath_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['artist', 'release_date', 'id'], name='musicshop_a_artist__6e3385_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['artist', 'price', 'id'], name='musicshop_a_artist__2a3393_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['media_type', 'release_date', 'id'], name='musicshop_a_media_t_bfab50_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['media_type', 'price', 'id'], name='musicshop_a_media_t_72e83e_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0006_album_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('new', 'Новый заказ'), ('in_progress', 'Заказ в обработке'), ('is_ready', 'Заказ готов'), ('completed', 'Заказ получен покупателем'), ('cancelled', 'Заказ отменён')], default='new', max_length=100, verbose_name='Статус заказа'),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('qty', models.PositiveSmallIntegerField(verbose_name='Количество')),
+                ('status', models.CharField(choices=[('active', 'Действует'), ('confirmed', 'Подтверждён'), ('released', 'Снят')], default='active', max_length=20, verbose_name='Статус')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicshop.album', verbose_name='Альбом')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='musicshop.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Резерв товара',
+                'verbose_name_plural': 'Резервы товара',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='musicshop_s_status_434da0_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0007_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('dimension', models.CharField(choices=[('total', 'Всего'), ('status', 'Статус заказа'), ('media_type', 'Носитель'), ('genre', 'Жанр')], max_length=20, verbose_name='Срез')),
+                ('key', models.CharField(blank=True, max_length=100, verbose_name='Значение среза (статус или id)')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Единиц товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Итоги заказов за день',
+                'verbose_name_plural': 'Итоги заказов по дням',
+            },
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateField(auto_now_add=True, verbose_name='Дата создания заказа'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'dimension', 'key'), name='musicshop_order_rollup_unique'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0008_order_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('refs', models.IntegerField(default=0, verbose_name='Ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ссылки изменены')),
+            ],
+            options={
+                'verbose_name': 'Файл по содержимому',
+                'verbose_name_plural': 'Файлы по содержимому',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mediablob',
+            index=models.Index(fields=['refs', 'updated_at'], name='musicshop_m_refs_8674cf_idx'),
+        ),
+    ]
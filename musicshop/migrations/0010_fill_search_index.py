@@ -0,0 +1,52 @@
+from django.db import migrations
+
+FTS_TABLE = 'musicshop_search'
+
+
+def fill_fts_table(apps, schema_editor):
+    """
+    Документы уже существующих альбомов и исполнителей: 0002 создавала
+    пустую таблицу, и поиск ничего не находил до rebuild_search_index.
+    rowid - как в FTS5SearchIndex.rowid: id * 2 (+ 1 для исполнителя)
+    """
+    connection = schema_editor.connection
+    if (connection.vendor != 'sqlite'
+            or FTS_TABLE not in connection.introspection.table_names()):
+        return
+    album = apps.get_model('musicshop', 'Album')._meta.db_table
+    artist_model = apps.get_model('musicshop', 'Artist')
+    artist = artist_model._meta.db_table
+    members = artist_model._meta.get_field('members').remote_field.through
+    through = members._meta.db_table
+    member = apps.get_model('musicshop', 'Member')._meta.db_table
+    genre = apps.get_model('musicshop', 'Genre')._meta.db_table
+    member_names = (
+        f'(SELECT group_concat(m.name, \' \') FROM {through} am '
+        f'JOIN {member} m ON m.id = am.member_id '
+        f'WHERE am.artist_id = ar.id)')
+    schema_editor.execute(f'DELETE FROM {FTS_TABLE}')
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} '
+        f'(rowid, name, people, genre, description, songs_list) '
+        f'SELECT ar.id * 2 + 1, ar.name, coalesce({member_names}, \'\'), '
+        f'g.name, \'\', \'\' '
+        f'FROM {artist} ar JOIN {genre} g ON g.id = ar.genre_id')
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} '
+        f'(rowid, name, people, genre, description, songs_list) '
+        f'SELECT a.id * 2, a.name, '
+        f'ar.name || coalesce(\' \' || {member_names}, \'\'), g.name, '
+        f'a.description, a.songs_list '
+        f'FROM {album} a JOIN {artist} ar ON ar.id = a.artist_id '
+        f'JOIN {genre} g ON g.id = ar.genre_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0009_mediablob'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_fts_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicshop', '0010_fill_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Событие'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('event', 'recipient'), name='musicshop_notification_unique_event'),
+        ),
+    ]
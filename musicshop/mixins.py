@@ -0,0 +1,83 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.middleware.csrf import get_token
+
+from .anonymous_cart import AnonymousCart
+from .cache import get_cached_page, page_cache_key, set_cached_page
+from .cart import CartService
+from .models import Customer
+
+
+class CatalogPageCacheMixin:
+    """
+    Кэширование страницы каталога целиком.
+    cache_objects - пары (kind, url kwarg), версии которых входят в ключ.
+    Формы на таких страницах берут csrf-токен из cookie, поэтому cookie
+    выставляется и для ответа из кэша. Запросы с параметрами (?q=...)
+    мимо кэша: страница выводит их в форму поиска, и ответ с чужим
+    вводом попал бы всем
+    """
+
+    cache_name = None
+    cache_objects = ()
+
+    def get_cache_key(self):
+        """Ключ страницы или None - не кэшировать"""
+        if self.request.GET:
+            return None
+        objects = [(kind, self.kwargs[kwarg])
+                   for kind, kwarg in self.cache_objects]
+        return page_cache_key(self.cache_name, self.request, *objects)
+
+    def get_cached_response(self, key):
+        """Ответ из кэша или None"""
+        if key is None:
+            return None
+        response = get_cached_page(key)
+        if response is not None:
+            get_token(self.request)
+            response['X-Catalog-Cache'] = 'hit'
+        return response
+
+    def cache_response(self, key, response):
+        """Отрендерить свежий ответ и сохранить его в кэш"""
+        if hasattr(response, 'render'):
+            response.render()
+        # страницы с csrf-токеном привязаны к пользователю - не кэшируем
+        if (key is not None and response.status_code == 200
+                and not self.request.META.get('CSRF_COOKIE_USED')):
+            set_cached_page(key, response)
+        get_token(self.request)
+        response['X-Catalog-Cache'] = 'miss' if key else 'bypass'
+        return response
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_cache_key()
+        response = self.get_cached_response(key)
+        if response is None:
+            response = self.cache_response(
+                key, super().get(request, *args, **kwargs))
+        return response
+
+
+class CartMixin:
+    """
+    Текущая корзина - self.cart_service: CartService для покупателя,
+    AnonymousCart (cookie) - без входа
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            self.cart_service = AnonymousCart.from_request(request)
+            response = super().dispatch(request, *args, **kwargs)
+            self.cart_service.save(response)
+            return response
+        customer, _ = Customer.objects.get_or_create(user=request.user)
+        self.cart_service = CartService.for_customer(customer)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class StaffRequiredMixin(UserPassesTestMixin):
+    """Только для персонала: анонимный - на вход, остальные - 403"""
+
+    def test_func(self):
+        return self.request.user.is_staff
@@ -1,12 +1,46 @@
 from django.conf import settings
-from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.fields import (
+    GenericForeignKey, GenericRelation)
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 
-from utils import upload_function
+from utils import GenericRelationQuerySet, upload_function
+from utils.images import thumbnail_url
+
+
+class LoadedValuesMixin:
+    """
+    Запоминает значения полей, загруженные из БД (или сохранённые в неё),
+    чтобы обработчики сигналов видели, что именно изменилось
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
+
+    def get_loaded_value(self, field_name, default=None):
+        """Значение поля на момент загрузки из БД"""
+        return getattr(self, '_loaded_values', {}).get(field_name, default)
+
+    def fields_changed(self, *field_names):
+        """Изменилось ли хоть одно из полей (новый объект - изменён)"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(loaded.get(name) != getattr(self, name)
+                   for name in field_names)
 
 
 class MediaType(models.Model):
@@ -23,7 +57,7 @@ class MediaType(models.Model):
         verbose_name_plural = 'Медианосители'
 
 
-class Member(models.Model):
+class Member(LoadedValuesMixin, models.Model):
     """Музыкант"""
 
     name = models.CharField(max_length=255, verbose_name='Имя музыканта')
@@ -54,7 +88,47 @@ class Genre(models.Model):
         verbose_name_plural = 'Жанры'
 
 
-class Artist(models.Model):
+class ArtistQuerySet(models.QuerySet):
+    """Выборки исполнителей для страниц каталога"""
+
+    def for_detail(self):
+        """
+        Страница исполнителя целиком: жанр, участники, галерея и альбомы
+        с носителями - за фиксированное число запросов (4)
+        """
+        return self.select_related('genre').prefetch_related(
+            'members',
+            'gallery',
+            models.Prefetch(
+                'album_set',
+                queryset=Album.objects.select_related('media_type').order_by(
+                    '-release_date', '-id')
+            ),
+        )
+
+
+class AlbumQuerySet(models.QuerySet):
+    """Выборки альбомов для страниц каталога"""
+
+    def for_detail(self):
+        """
+        Страница альбома целиком: исполнитель с жанром, носитель, галерея,
+        участники и остальные альбомы исполнителя - за 4 запроса
+        """
+        return self.select_related(
+            'artist__genre', 'media_type'
+        ).prefetch_related(
+            'gallery',
+            'artist__members',
+            models.Prefetch(
+                'artist__album_set',
+                queryset=Album.objects.select_related('media_type').order_by(
+                    '-release_date', '-id')
+            ),
+        )
+
+
+class Artist(LoadedValuesMixin, models.Model):
     """Исполнитель"""
 
     name = models.CharField(max_length=255, verbose_name='Исполнитель/группа')
@@ -66,6 +140,9 @@ class Artist(models.Model):
         upload_to=upload_function, null=True, blank=True,
         verbose_name='Аватарка')
     slug = models.SlugField(unique=True, verbose_name='Слаг')
+    gallery = GenericRelation('ImageGallery')
+
+    objects = ArtistQuerySet.as_manager()
 
     def get_absolute_url(self):
         return reverse('artist_detail', kwargs={'artist_slug': self.slug})
@@ -78,7 +155,7 @@ class Artist(models.Model):
         verbose_name_plural = 'Исполнители'
 
 
-class Album(models.Model):
+class Album(LoadedValuesMixin, models.Model):
     """Альбом исполнителя"""
 
     artist = models.ForeignKey(
@@ -99,6 +176,9 @@ class Album(models.Model):
     offer_of_the_week = models.BooleanField(
         default=False, verbose_name='Предложение недели!?!?')
     slug = models.SlugField(unique=True, verbose_name='Слаг')
+    gallery = GenericRelation('ImageGallery')
+
+    objects = AlbumQuerySet.as_manager()
 
     @property
     def ct_model(self):
@@ -117,6 +197,20 @@ class Album(models.Model):
     class Meta:
         verbose_name = 'Альбом'
         verbose_name_plural = 'Альбомы'
+        indexes = [
+            models.Index(fields=['release_date']),
+            models.Index(fields=['price']),
+            # списки по исполнителю/носителю с сортировкой по ключу
+            models.Index(fields=['artist', 'release_date', 'id']),
+            models.Index(fields=['artist', 'price', 'id']),
+            models.Index(fields=['media_type', 'release_date', 'id']),
+            models.Index(fields=['media_type', 'price', 'id']),
+            # предложений недели единицы - частичный индекс только по ним
+            models.Index(
+                fields=['offer_of_the_week'],
+                condition=models.Q(offer_of_the_week=True),
+                name='musicshop_album_offer_idx'),
+        ]
 
 
 class CartProduct(models.Model):
@@ -138,17 +232,39 @@ class CartProduct(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
 
-    def save(self, *args, **kwargs):
-        """Получить полную стоимость"""
-        self.final_price = self.qty * self.content_object.price
+    objects = GenericRelationQuerySet.as_manager()
+
+    def save(self, *args, price=None, **kwargs):
+        """
+        Получить полную стоимость. price - цена единицы, если она уже
+        известна (CartService берёт цены пачкой)
+        """
+        if price is None:
+            price = self.unit_price()
+        self.final_price = self.qty * price
         super().save(*args, **kwargs)
 
+    def unit_price(self):
+        """
+        Цена товара: из уже загруженного (with_content_objects) или одним
+        запросом только цены - без загрузки товара через content_object
+        """
+        if CartProduct.content_object.is_cached(self):
+            return self.content_object.price
+        model = ContentType.objects.get_for_id(
+            self.content_type_id).model_class()
+        return model._default_manager.filter(pk=self.object_id).values_list(
+            'price', flat=True).get()
+
     def __str__(self):
         return f'Продукт: {self.content_object.name} (для корзины)'
 
     class Meta:
         verbose_name = 'Продукт корзины'
         verbose_name_plural = 'Продукты корзины'
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+        ]
 
 
 class Cart(models.Model):
@@ -183,6 +299,7 @@ class Order(models.Model):
     STATUS_IN_PROGRESS = 'in_progress'
     STATUS_READY = 'is_ready'
     STATUS_COMPLETED = 'completed'
+    STATUS_CANCELLED = 'cancelled'
 
     BUYING_TYPE_SELF = 'self'
     BUYING_TYPE_DELIVERY = 'delivery'
@@ -191,7 +308,8 @@ class Order(models.Model):
         (STATUS_NEW, 'Новый заказ'),
         (STATUS_IN_PROGRESS, 'Заказ в обработке'),
         (STATUS_READY, 'Заказ готов'),
-        (STATUS_COMPLETED, 'Заказ получен покупателем')
+        (STATUS_COMPLETED, 'Заказ получен покупателем'),
+        (STATUS_CANCELLED, 'Заказ отменён')
     )
 
     BUYING_TYPE_CHOICES = (
@@ -218,7 +336,7 @@ class Order(models.Model):
         max_length=15000, null=True, blank=True,
         verbose_name='Комментарий к заказу')
     created_at = models.DateField(
-        auto_now=True, verbose_name='Дата создания заказа')
+        auto_now_add=True, verbose_name='Дата создания заказа')
     order_date = models.DateField(
         default=timezone.now, verbose_name='Дата получения заказа')
 
@@ -228,6 +346,93 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+
+class StockReservation(models.Model):
+    """
+    Резерв товара под заказ: остаток уже списан с Album.stock и
+    возвращается, если заказ не подтверждён до expires_at
+    """
+
+    STATUS_ACTIVE = 'active'
+    STATUS_CONFIRMED = 'confirmed'
+    STATUS_RELEASED = 'released'
+
+    STATUS_CHOICES = (
+        (STATUS_ACTIVE, 'Действует'),
+        (STATUS_CONFIRMED, 'Подтверждён'),
+        (STATUS_RELEASED, 'Снят')
+    )
+
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='reservations',
+        verbose_name='Заказ')
+    album = models.ForeignKey(
+        Album, on_delete=models.CASCADE, verbose_name='Альбом')
+    qty = models.PositiveSmallIntegerField(verbose_name='Количество')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE,
+        verbose_name='Статус')
+    expires_at = models.DateTimeField(verbose_name='Действует до')
+
+    def __str__(self):
+        return (f'Резерв {self.qty} шт. альбома #{self.album_id}'
+                f' под заказ № {self.order_id}')
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товара'
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+
+class OrderDailyRollup(models.Model):
+    """
+    Итоги заказов за день по срезу: всего, по статусу, по носителю,
+    по жанру. Пересчитываются за день целиком задачей
+    reports.rollup_day (musicshop.reports) при изменении заказов дня
+    """
+
+    DIMENSION_TOTAL = 'total'
+    DIMENSION_STATUS = 'status'
+    DIMENSION_MEDIA_TYPE = 'media_type'
+    DIMENSION_GENRE = 'genre'
+
+    DIMENSION_CHOICES = (
+        (DIMENSION_TOTAL, 'Всего'),
+        (DIMENSION_STATUS, 'Статус заказа'),
+        (DIMENSION_MEDIA_TYPE, 'Носитель'),
+        (DIMENSION_GENRE, 'Жанр')
+    )
+
+    day = models.DateField(verbose_name='День')
+    dimension = models.CharField(
+        max_length=20, choices=DIMENSION_CHOICES, verbose_name='Срез')
+    key = models.CharField(
+        max_length=100, blank=True,
+        verbose_name='Значение среза (статус или id)')
+    orders = models.PositiveIntegerField(default=0, verbose_name='Заказов')
+    units = models.PositiveIntegerField(
+        default=0, verbose_name='Единиц товара')
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+
+    def __str__(self):
+        return f'{self.day} {self.dimension} {self.key}'
+
+    class Meta:
+        verbose_name = 'Итоги заказов за день'
+        verbose_name_plural = 'Итоги заказов по дням'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'dimension', 'key'],
+                name='musicshop_order_rollup_unique'),
+        ]
 
 
 class Customer(models.Model):
@@ -245,6 +450,8 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, verbose_name='Номер телефона')
     address = models.CharField(
         max_length=255, null=True, blank=True, verbose_name='Адрес')
+    unread_notifications = models.PositiveIntegerField(
+        default=0, verbose_name='Непрочитанных уведомлений')
 
     def __str__(self):
         if not (self.user.first_name and self.user.last_name):
@@ -256,13 +463,16 @@ class Customer(models.Model):
         verbose_name_plural = 'Покупатели'
 
 
-class Notification(models.Model):
+class Notification(LoadedValuesMixin, models.Model):
     """Уведомления"""
 
     recipient = models.ForeignKey(
         Customer, on_delete=models.CASCADE, verbose_name='Получатель')
     text = models.TextField(max_length=10000, verbose_name='Сообщение')
     read = models.BooleanField(default=False, verbose_name='Прочитано?')
+    # событие рассылки: повтор задачи не создаёт второе уведомление
+    event = models.CharField(
+        max_length=100, null=True, blank=True, verbose_name='Событие')
 
     def __str__(self):
         return (f'Уведомление для {self.recipient.user.username}'
@@ -271,9 +481,17 @@ class Notification(models.Model):
     class Meta:
         verbose_name = 'Уведомление'
         verbose_name_plural = 'Уведомления'
+        indexes = [
+            models.Index(fields=['recipient', 'read']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['event', 'recipient'],
+                name='musicshop_notification_unique_event'),
+        ]
 
 
-class ImageGallery(models.Model):
+class ImageGallery(LoadedValuesMixin, models.Model):
     """Галерея изображений"""
 
     image = models.ImageField(upload_to=upload_function, verbose_name='Фото')
@@ -284,9 +502,13 @@ class ImageGallery(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
 
+    objects = GenericRelationQuerySet.as_manager()
+
     def image_url(self):
+        """Превью в админке - миниатюра, а не оригинал"""
         return mark_safe(
-            f'<img src="{self.image.url}" width="auto" height="200px">')
+            f'<img src="{thumbnail_url(self.image)}" width="200px" '
+            f'height="auto">')
 
     def __str__(self):
         return f'Изображение для {self.content_object}'
@@ -294,3 +516,90 @@ class ImageGallery(models.Model):
     class Meta:
         verbose_name = 'Галерея изображений'
         verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+
+
+class MediaBlob(models.Model):
+    """
+    Файл хранилища по содержимому (utils.media_storage) и число ссылок
+    на него из полей изображений. refs ведут сигналы (musicshop.media),
+    manage.py gc_media сверяет их с полями и удаляет файлы без ссылок
+    """
+
+    name = models.CharField(max_length=255, unique=True, verbose_name='Файл')
+    size = models.PositiveBigIntegerField(
+        default=0, verbose_name='Размер, байт')
+    refs = models.IntegerField(default=0, verbose_name='Ссылок')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Создан')
+    updated_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Ссылки изменены')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл по содержимому'
+        verbose_name_plural = 'Файлы по содержимому'
+        indexes = [
+            models.Index(fields=['refs', 'updated_at']),
+        ]
+
+
+class Job(models.Model):
+    """Фоновая задача (очередь в БД, обрабатывается manage.py runworkers)"""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+        (STATUS_FAILED, 'Ошибка')
+    )
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.JSONField(default=dict, verbose_name='Параметры')
+    idempotency_key = models.CharField(
+        max_length=255, null=True, blank=True,
+        verbose_name='Ключ идемпотентности')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED,
+        verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3, verbose_name='Максимум попыток')
+    run_after = models.DateTimeField(
+        default=timezone.now, verbose_name='Не раньше')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Создана')
+    started_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Начало выполнения')
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Окончание выполнения')
+    duration = models.FloatField(
+        null=True, blank=True, verbose_name='Длительность, с')
+    last_error = models.TextField(blank=True, verbose_name='Ошибка')
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.get_status_display()})'
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            # одна задача на ключ среди ожидающих выполнения
+            models.UniqueConstraint(
+                fields=['idempotency_key'],
+                condition=models.Q(status='queued'),
+                name='musicshop_job_unique_queued_key'),
+        ]
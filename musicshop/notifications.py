@@ -0,0 +1,85 @@
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+
+from .models import Customer, Notification
+
+NOTIFY_CHUNK_SIZE = 5000
+
+
+def restock_event(album_id):
+    """Событие рассылки о поступлении - для параметров задачи"""
+    return f'restock:{album_id}:{int(time.time() * 1000)}'
+
+
+def notify_wishlist_holders(album, text, event,
+                            chunk_size=NOTIFY_CHUNK_SIZE):
+    """
+    Уведомить всех, у кого альбом в списке ожидаемого; возвращает число
+    созданных уведомлений.
+    Получатели читаются из промежуточной таблицы m2m пачками по
+    customer_id (keyset, без OFFSET) сразу без уже уведомлённых об event
+    (NOT EXISTS по уникальному (event, recipient)); на пачку - один
+    bulk_create и один UPDATE счётчиков ровно тех, кому уведомление
+    создано. Поэтому повтор задачи с тем же event досылает только
+    пропущенным, в том числе добавившим альбом после первой рассылки
+    """
+    last_id = 0
+    total = 0
+    retried = False
+    while True:
+        try:
+            inserted = _notify_chunk(album, text, event, last_id, chunk_size)
+        except IntegrityError:
+            # параллельная рассылка того же event успела уведомить часть
+            # пачки: пачка откатилась целиком, читаем её заново
+            if retried:
+                raise
+            retried = True
+            continue
+        retried = False
+        if not inserted:
+            return total
+        total += len(inserted)
+        last_id = inserted[-1]
+
+
+@transaction.atomic
+def _notify_chunk(album, text, event, last_id, chunk_size):
+    """Уведомить следующую пачку получателей; [id уведомлённых]"""
+    notified = Notification.objects.filter(
+        event=event, recipient_id=OuterRef('customer_id'))
+    recipients = list(
+        Customer.wishlist.through.objects
+        .filter(~Exists(notified), album_id=album.pk, customer_id__gt=last_id)
+        .order_by('customer_id')
+        .values_list('customer_id', flat=True)[:chunk_size])
+    if recipients:
+        Notification.objects.bulk_create(
+            [Notification(recipient_id=customer_id, text=text, event=event)
+             for customer_id in recipients],
+            batch_size=chunk_size)
+        Customer.objects.filter(pk__in=recipients).update(
+            unread_notifications=F('unread_notifications') + 1)
+    return recipients
+
+
+def unread_count(user):
+    """Число непрочитанных - из денормализованного счётчика, без COUNT(*)"""
+    count = Customer.objects.filter(user=user).values_list(
+        'unread_notifications', flat=True).first()
+    return count or 0
+
+
+@transaction.atomic
+def mark_read(customer, notification_ids=None):
+    """Отметить прочитанными (все или указанные) и уменьшить счётчик"""
+    notifications = Notification.objects.filter(recipient=customer, read=False)
+    if notification_ids is not None:
+        notifications = notifications.filter(pk__in=notification_ids)
+    updated = notifications.update(read=True)
+    if updated:
+        Customer.objects.filter(pk=customer.pk).update(
+            unread_notifications=F('unread_notifications') - updated)
+    return updated
@@ -0,0 +1,126 @@
+import base64
+import binascii
+import decimal
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по ключу (keyset/cursor) вместо OFFSET.
+
+    Курсор - значения полей сортировки последней строки страницы;
+    следующая страница - строки «после» неё по (field, id), поэтому
+    глубокая страница стоит столько же, сколько первая (по индексу).
+    """
+
+    def __init__(self, queryset, field, descending=False, per_page=24):
+        self.queryset = queryset
+        self.field = field
+        self.descending = descending
+        self.per_page = per_page
+        self.model_field = queryset.model._meta.get_field(field)
+
+    @property
+    def ordering(self):
+        prefix = '-' if self.descending else ''
+        return f'{prefix}{self.field}', f'{prefix}id'
+
+    def encode_cursor(self, obj):
+        value = self.model_field.value_to_string(obj)
+        raw = json.dumps([value, obj.pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded))
+            value, pk = self.model_field.to_python(value), int(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError,
+                decimal.InvalidOperation) as error:
+            raise InvalidCursor(cursor) from error
+        # поля сортировки NOT NULL, а с NaN сравнение бессмысленно
+        if value is None or (isinstance(value, decimal.Decimal)
+                             and not value.is_finite()):
+            raise InvalidCursor(cursor)
+        return value, pk
+
+    def page(self, cursor=None):
+        """(объекты страницы, курсор следующей страницы или None)"""
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            after = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{after}': value})
+                | Q(**{self.field: value, f'id__{after}': pk}))
+        objects = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(objects) > self.per_page:
+            objects = objects[:self.per_page]
+            next_cursor = self.encode_cursor(objects[-1])
+        return objects, next_cursor
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator для changelist админки на больших таблицах.
+
+    COUNT(*) по всей таблице на каждой странице - полный проход: без
+    фильтров на PostgreSQL берётся оценка из статистики (pg_class),
+    если она больше ADMIN_ESTIMATED_COUNT_THRESHOLD; иначе точный COUNT
+    кэшируется по тексту запроса на ADMIN_COUNT_CACHE_TIMEOUT секунд.
+    Число страниц может отставать от таблицы на это время
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            threshold = getattr(
+                settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100_000)
+            if estimate is not None and estimate > threshold:
+                return estimate
+        try:
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        except EmptyResultSet:
+            # фильтр заведомо без строк (например, pk__in=[])
+            return 0
+        digest = hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+        key = f'admin:count:{queryset.db}:{digest}'
+        cache = caches[getattr(settings, 'ADMIN_COUNT_CACHE_ALIAS', 'default')]
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, getattr(
+                settings, 'ADMIN_COUNT_CACHE_TIMEOUT', 60))
+        return count
+
+
+def estimated_count(model, using='default'):
+    """Оценка числа строк таблицы из статистики СУБД или None"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(model._meta.db_table)])
+        row = cursor.fetchone()
+    # -1 или 0 - таблица ещё не анализировалась
+    return row[0] if row and row[0] > 0 else None
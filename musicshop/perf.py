@@ -0,0 +1,306 @@
+"""
+Замеры производительности запросов: общее время, число и время запросов
+к БД, время рендеринга шаблонов, попадания в кэш каталога.
+
+PerformanceMiddleware замеряет долю запросов PERF_SAMPLE_RATE (в бою -
+малую, чтобы накладные расходы были меньше процента), отдаёт
+заголовок Server-Timing и копит гистограммы по имени url. Гистограммы
+процесса раз в PERF_FLUSH_INTERVAL секунд (и при выходе процесса)
+сливаются в кэш поминутными окнами - их читает manage.py perfreport.
+Поэтому PERF_CACHE_ALIAS должен быть общим для всех процессов: с
+LocMemCache отчёт пуст (проверка musicshop.W001).
+"""
+import asyncio
+import atexit
+import contextvars
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.backends.django import DjangoTemplates
+
+SLOT_KEY = 'perf:{slot}:{name}'
+SLOT_NAMES_KEY = 'perf:{slot}:names'
+SLOT_SECONDS = 60
+
+# Границы корзин гистограммы, мс: геометрическая прогрессия 0.1 мс - ~60 с
+BUCKET_RATIO = 1.15
+BUCKET_MIN = 0.1
+TIMINGS = ('wall', 'db', 'template')
+
+_current = contextvars.ContextVar('musicshop_perf', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Время одного запроса к БД"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    def server_timing(self, wall):
+        return ', '.join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+            f'cache;desc="hit={self.cache_hits} miss={self.cache_misses}"',
+            f'total;dur={wall * 1000:.1f}',
+        ])
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    execute_wrapper всех соединений (ставится на connection_created):
+    запрос учитывается в замере текущего запроса, в каком бы потоке он
+    ни шёл - контекст переносится и в sync_to_async
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection):
+    # connection_created приходит на каждое переподключение
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def record_cache(hit):
+    """Попадание/промах кэша в замер текущего запроса (если он идёт)"""
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def bucket(ms):
+    if ms <= BUCKET_MIN:
+        return 0
+    return int(math.log(ms / BUCKET_MIN, BUCKET_RATIO)) + 1
+
+
+def bucket_bound(index):
+    """Верхняя граница корзины, мс"""
+    return BUCKET_MIN * BUCKET_RATIO ** index
+
+
+def percentile(histogram, pct):
+    """Перцентиль по гистограмме {корзина: число} - граница корзины, мс"""
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    rank = math.ceil(total * pct / 100)
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= rank:
+            return bucket_bound(index)
+    return bucket_bound(max(histogram))
+
+
+def _empty_stats():
+    return {'count': 0, 'queries': 0, 'cache_hits': 0, 'cache_misses': 0,
+            **{timing: {} for timing in TIMINGS}}
+
+
+def merge_stats(target, source):
+    for counter in ('count', 'queries', 'cache_hits', 'cache_misses'):
+        target[counter] += source[counter]
+    for timing in TIMINGS:
+        histogram = target[timing]
+        for index, count in source[timing].items():
+            histogram[index] = histogram.get(index, 0) + count
+    return target
+
+
+def get_perf_cache():
+    return caches[getattr(settings, 'PERF_CACHE_ALIAS', 'default')]
+
+
+class Recorder:
+    """Гистограммы процесса до сброса в кэш"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(_empty_stats)
+        self._flushed_at = time.monotonic()
+
+    def add(self, name, metrics, wall):
+        with self._lock:
+            stats = self._stats[name]
+            stats['count'] += 1
+            stats['queries'] += metrics.queries
+            stats['cache_hits'] += metrics.cache_hits
+            stats['cache_misses'] += metrics.cache_misses
+            for timing, seconds in (('wall', wall), ('db', metrics.db),
+                                    ('template', metrics.template)):
+                index = bucket(seconds * 1000)
+                stats[timing][index] = stats[timing].get(index, 0) + 1
+            interval = getattr(settings, 'PERF_FLUSH_INTERVAL', 10)
+            if time.monotonic() - self._flushed_at < interval:
+                return
+            pending, self._stats = self._stats, defaultdict(_empty_stats)
+            self._flushed_at = time.monotonic()
+        self.flush(pending)
+
+    def flush(self, pending=None):
+        """
+        Слить накопленное в окно текущей минуты. get + set без блокировки:
+        при одновременном сбросе двух процессов часть замеров теряется,
+        для статистики это допустимо
+        """
+        if pending is None:
+            with self._lock:
+                pending, self._stats = self._stats, defaultdict(_empty_stats)
+        if not pending:
+            return
+        cache = get_perf_cache()
+        slot = int(time.time() // SLOT_SECONDS)
+        timeout = getattr(settings, 'PERF_RETENTION', 60 * 60)
+        keys = {name: SLOT_KEY.format(slot=slot, name=name)
+                for name in pending}
+        names_key = SLOT_NAMES_KEY.format(slot=slot)
+        stored = cache.get_many([*keys.values(), names_key])
+        values = {
+            key: merge_stats(stored.get(key) or _empty_stats(), pending[name])
+            for name, key in keys.items()
+        }
+        values[names_key] = set(stored.get(names_key) or ()) | set(pending)
+        cache.set_many(values, timeout=timeout)
+
+
+recorder = Recorder()
+# иначе замеры, не дождавшиеся интервала, теряются с процессом
+atexit.register(recorder.flush)
+
+
+def collected_stats(minutes):
+    """{имя url: статистика} за последние minutes минут из кэша"""
+    cache = get_perf_cache()
+    current = int(time.time() // SLOT_SECONDS)
+    slots = range(current - minutes + 1, current + 1)
+    names_by_slot = cache.get_many(
+        [SLOT_NAMES_KEY.format(slot=slot) for slot in slots])
+    keys = [SLOT_KEY.format(slot=slot, name=name)
+            for slot in slots
+            for name in names_by_slot.get(
+                SLOT_NAMES_KEY.format(slot=slot), ())]
+    result = defaultdict(_empty_stats)
+    for key, stats in cache.get_many(keys).items():
+        merge_stats(result[key.split(':', 2)[2]], stats)
+    return dict(result)
+
+
+def clear_stats(minutes):
+    cache = get_perf_cache()
+    current = int(time.time() // SLOT_SECONDS)
+    for slot in range(current - minutes + 1, current + 1):
+        names_key = SLOT_NAMES_KEY.format(slot=slot)
+        names = cache.get(names_key) or ()
+        cache.delete_many(
+            [names_key] + [SLOT_KEY.format(slot=slot, name=name)
+                           for name in names])
+
+
+class PerformanceMiddleware:
+    """
+    Замер запроса целиком: ставится первым в MIDDLEWARE, чтобы учесть
+    и время остальных middleware. Умеет работать и синхронно, и
+    асинхронно: под ASGI иначе весь обработчик оборачивался бы в
+    async_to_sync, а запросы шли бы по одному через общий поток
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # так Django 3.2 узнаёт асинхронный вызов (см. MiddlewareMixin)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def sampled(self):
+        return random.random() < getattr(settings, 'PERF_SAMPLE_RATE', 1.0)
+
+    def finish(self, request, response, metrics):
+        wall = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        name = match.url_name if match and match.url_name else 'unresolved'
+        recorder.add(name, metrics, wall)
+        if getattr(settings, 'PERF_SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.server_timing(wall)
+        return response
+
+
+class TimedTemplate:
+    """Шаблон backend'а с замером render() для текущего запроса"""
+
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self._template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            metrics.template += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Backend шаблонов Django с замером времени рендеринга. Замеряется
+    render() верхнего уровня: include и extends входят в его время
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
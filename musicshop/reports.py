@@ -0,0 +1,181 @@
+"""
+Отчёты по заказам для персонала.
+
+Итоги за день (OrderDailyRollup) считаются агрегатами в SQL по заказам
+одного дня и пересчитываются задачей reports.rollup_day, когда заказы
+дня меняются (создание, статус, снятие резервов). Отчёт за любой период
+суммирует готовые строки по дням и не читает сами заказы.
+
+Выгрузка заказов идёт потоком из .iterator(): в памяти - одна пачка.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .jobs import enqueue_on_commit
+from .models import (
+    Genre, MediaType, Order, OrderDailyRollup, StockReservation)
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Поле values_list -> заголовок столбца выгрузки
+EXPORT_COLUMNS = (
+    ('id', '№'),
+    ('created_at', 'Создан'),
+    ('order_date', 'Дата получения'),
+    ('status', 'Статус'),
+    ('buying_type', 'Тип заказа'),
+    ('customer__user__username', 'Покупатель'),
+    ('first_name', 'Имя'),
+    ('last_name', 'Фамилия'),
+    ('phone', 'Телефон'),
+    ('address', 'Адрес'),
+    ('cart__final_price', 'Сумма'),
+    ('units', 'Товаров'),
+)
+
+# Снятые резервы - товар вернулся на склад и не продан
+_SOLD = ~Q(status=StockReservation.STATUS_RELEASED)
+
+
+def rollup_day(day):
+    """Пересчитать итоги дня: несколько GROUP BY по заказам этого дня"""
+    rows = []
+    total = OrderDailyRollup(
+        day=day, dimension=OrderDailyRollup.DIMENSION_TOTAL, key='')
+    by_status = Order.objects.filter(created_at=day).values(
+        'status').annotate(
+        orders=Count('id'), revenue=Sum('cart__final_price')).order_by()
+    for row in by_status:
+        revenue = row['revenue'] or Decimal(0)
+        rows.append(OrderDailyRollup(
+            day=day, dimension=OrderDailyRollup.DIMENSION_STATUS,
+            key=row['status'], orders=row['orders'], revenue=revenue))
+        if row['status'] != Order.STATUS_CANCELLED:
+            total.orders += row['orders']
+            total.revenue += revenue
+
+    reservations = StockReservation.objects.filter(
+        _SOLD, order__created_at=day)
+    for dimension, field in (
+            (OrderDailyRollup.DIMENSION_MEDIA_TYPE, 'album__media_type_id'),
+            (OrderDailyRollup.DIMENSION_GENRE, 'album__artist__genre_id')):
+        grouped = reservations.values(field).annotate(
+            units=Sum('qty'), orders=Count('order_id', distinct=True)
+        ).order_by()
+        for row in grouped:
+            rows.append(OrderDailyRollup(
+                day=day, dimension=dimension, key=str(row[field]),
+                orders=row['orders'], units=row['units']))
+            # у резерва один носитель - сумма по носителям и есть итог
+            if dimension == OrderDailyRollup.DIMENSION_MEDIA_TYPE:
+                total.units += row['units']
+    if rows:
+        rows.append(total)
+
+    with transaction.atomic():
+        OrderDailyRollup.objects.filter(day=day).delete()
+        OrderDailyRollup.objects.bulk_create(rows)
+    return len(rows)
+
+
+def schedule_rollup(days):
+    """Пересчитать итоги дней после фиксации - одна задача на день"""
+    for day in set(days):
+        if day is None:
+            continue
+        enqueue_on_commit(
+            'reports.rollup_day', {'day': day.isoformat()},
+            key=f'reports:rollup:{day.isoformat()}')
+
+
+def orders_changed(order_ids):
+    """Заказы изменены массовым UPDATE, минуя сигналы"""
+    schedule_rollup(Order.objects.filter(pk__in=order_ids).values_list(
+        'created_at', flat=True).distinct())
+
+
+def order_report(start, end):
+    """
+    Отчёт за период [start, end] из итогов по дням: итоги по срезам
+    и ряд по дням. Число запросов не зависит от числа заказов
+    """
+    rollups = OrderDailyRollup.objects.filter(day__range=(start, end))
+    grouped = rollups.values('dimension', 'key').annotate(
+        orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue')
+    ).order_by('dimension', '-revenue', '-units')
+    labels = {
+        OrderDailyRollup.DIMENSION_TOTAL: {'': 'Всего'},
+        OrderDailyRollup.DIMENSION_STATUS: dict(Order.STATUS_CHOICES),
+        OrderDailyRollup.DIMENSION_MEDIA_TYPE: {
+            str(pk): name
+            for pk, name in MediaType.objects.values_list('id', 'name')},
+        OrderDailyRollup.DIMENSION_GENRE: {
+            str(pk): name
+            for pk, name in Genre.objects.values_list('id', 'name')},
+    }
+    sections = {dimension: [] for dimension, _ in
+                OrderDailyRollup.DIMENSION_CHOICES}
+    for row in grouped:
+        row['label'] = labels[row['dimension']].get(row['key'], row['key'])
+        sections[row['dimension']].append(row)
+    days = rollups.filter(
+        dimension=OrderDailyRollup.DIMENSION_TOTAL).order_by('-day').values(
+        'day', 'orders', 'units', 'revenue')
+    total = sections.pop(OrderDailyRollup.DIMENSION_TOTAL)
+    return {
+        'start': start,
+        'end': end,
+        'total': total[0] if total else None,
+        'sections': [
+            (label, sections[dimension])
+            for dimension, label in OrderDailyRollup.DIMENSION_CHOICES
+            if dimension in sections
+        ],
+        'days': list(days),
+    }
+
+
+def default_period(today=None, days=30):
+    end = today or timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def export_orders(start=None, end=None, status=None):
+    """
+    Заголовок и строки выгрузки заказов. Покупатель, сумма и число
+    товаров приходят тем же запросом (JOIN и агрегат), без запроса
+    на строку
+    """
+    orders = Order.objects.order_by('id')
+    if start:
+        orders = orders.filter(created_at__gte=start)
+    if end:
+        orders = orders.filter(created_at__lte=end)
+    if status:
+        orders = orders.filter(status=status)
+    orders = orders.annotate(
+        units=Sum('reservations__qty',
+                  filter=~Q(reservations__status=(
+                      StockReservation.STATUS_RELEASED))))
+    fields = [field for field, _ in EXPORT_COLUMNS]
+    status_index = fields.index('status')
+    buying_type_index = fields.index('buying_type')
+    statuses = dict(Order.STATUS_CHOICES)
+    buying_types = dict(Order.BUYING_TYPE_CHOICES)
+
+    def rows():
+        for row in orders.values_list(*fields).iterator(
+                chunk_size=EXPORT_CHUNK_SIZE):
+            row = list(row)
+            row[status_index] = statuses.get(
+                row[status_index], row[status_index])
+            row[buying_type_index] = buying_types.get(
+                row[buying_type_index], row[buying_type_index])
+            row[-1] = row[-1] or 0
+            yield row
+
+    return [title for _, title in EXPORT_COLUMNS], rows()
@@ -0,0 +1,486 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Документ индекса - альбом или исполнитель. Основной движок - таблица
+SQLite FTS5 (создаётся миграцией, если FTS5 доступен), запасной -
+инвертированный индекс в памяти процесса. Индекс обновляется сигналами
+(musicshop.signals), полная перестройка - команда rebuild_search_index.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .cache import get_catalog_cache
+from .models import Album, Artist
+
+FTS_TABLE = 'musicshop_search'
+
+# Поля документа и их вес при ранжировании
+FIELDS = ('name', 'people', 'genre', 'description', 'songs_list')
+WEIGHTS = (10.0, 5.0, 3.0, 1.0, 1.0)
+
+KIND_ALBUM = 'album'
+KIND_ARTIST = 'artist'
+
+TOKEN_RE = re.compile(r'\w+')
+
+INDEX_BATCH_SIZE = 500
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def album_documents(ids):
+    """Документы альбомов: (kind, id, {поле: текст})"""
+    albums = Album.objects.filter(id__in=ids).select_related(
+        'artist__genre').prefetch_related('artist__members')
+    # без iterator(): с ним prefetch_related в Django 3.2 не работает,
+    # а ids и так приходят пачками по INDEX_BATCH_SIZE
+    for album in albums:
+        artist = album.artist
+        people = ' '.join(
+            [artist.name] + [member.name for member in artist.members.all()])
+        yield KIND_ALBUM, album.id, {
+            'name': album.name,
+            'people': people,
+            'genre': artist.genre.name,
+            'description': album.description,
+            'songs_list': album.songs_list,
+        }
+
+
+def artist_documents(ids):
+    """Документы исполнителей: (kind, id, {поле: текст})"""
+    artists = Artist.objects.filter(id__in=ids).select_related(
+        'genre').prefetch_related('members')
+    for artist in artists:
+        yield KIND_ARTIST, artist.id, {
+            'name': artist.name,
+            'people': ' '.join(member.name for member in artist.members.all()),
+            'genre': artist.genre.name,
+            'description': '',
+            'songs_list': '',
+        }
+
+
+def _chunks(ids, size=INDEX_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class BaseSearchIndex:
+    """Общий интерфейс движков поиска"""
+
+    def index_albums(self, ids):
+        raise NotImplementedError
+
+    def index_artists(self, ids, with_albums=True):
+        """Переиндексировать исполнителей (и их альбомы - в них есть имя)"""
+        raise NotImplementedError
+
+    def remove_documents(self, kind, ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, offset=0, limit=20):
+        """Список пар (kind, id), лучшие совпадения первыми"""
+        raise NotImplementedError
+
+    def count(self, query):
+        raise NotImplementedError
+
+
+class FTS5SearchIndex(BaseSearchIndex):
+    """
+    Индекс SQLite FTS5. rowid документа кодирует тип и id объекта,
+    чтобы обновление было поиском по ключу, а не сканированием таблицы
+    """
+
+    KIND_OFFSETS = {KIND_ALBUM: 0, KIND_ARTIST: 1}
+
+    @classmethod
+    def rowid(cls, kind, obj_id):
+        return obj_id * 2 + cls.KIND_OFFSETS[kind]
+
+    @staticmethod
+    def from_rowid(rowid):
+        return (KIND_ARTIST if rowid % 2 else KIND_ALBUM), rowid // 2
+
+    @staticmethod
+    def match_expression(query):
+        """Каждое слово - префиксный поиск, все слова обязательны"""
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def index_albums(self, ids):
+        for chunk in _chunks(ids):
+            self.remove(KIND_ALBUM, chunk)
+            self.add(album_documents(chunk))
+
+    def index_artists(self, ids, with_albums=True):
+        for chunk in _chunks(ids):
+            self.remove(KIND_ARTIST, chunk)
+            self.add(artist_documents(chunk))
+            if with_albums:
+                self.index_albums(Album.objects.filter(
+                    artist_id__in=chunk).values_list('id', flat=True))
+
+    def remove_documents(self, kind, ids):
+        self.remove(kind, ids)
+
+    def rebuild(self):
+        # одной транзакцией: вне её каждая вставка в FTS5 - отдельная
+        # фиксация на диск, а поиск на время перестройки видит старый индекс
+        with transaction.atomic():
+            self.clear()
+            self.index_artists(
+                Artist.objects.values_list('id', flat=True), with_albums=False)
+            self.index_albums(Album.objects.values_list('id', flat=True))
+
+    def add(self, documents):
+        rows = [(self.rowid(kind, obj_id),
+                 *(fields[name] for name in FIELDS))
+                for kind, obj_id, fields in documents]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FIELDS)}) '
+                f'VALUES (%s, {", ".join(["%s"] * len(FIELDS))})', rows)
+
+    def remove(self, kind, ids):
+        rowids = [self.rowid(kind, obj_id) for obj_id in ids]
+        if not rowids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+                f'({", ".join(["%s"] * len(rowids))})', rowids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, query, offset=0, limit=20):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                [match, limit, offset])
+            return [self.from_rowid(rowid) for rowid, in cursor.fetchall()]
+
+    def count(self, query):
+        match = self.match_expression(query)
+        if not match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s', [match])
+            return cursor.fetchone()[0]
+
+
+_PENDING = object()
+
+
+class _IndexState:
+    """
+    Содержимое индекса в памяти. Состояние, по которому уже ищут, не
+    меняется: изменения вносятся в копию (fork), и она подменяет его
+    целиком, поэтому поиск в других потоках читает его без блокировок.
+    Копия делит с оригиналом списки вхождений и копирует только те,
+    что меняет
+    """
+
+    def __init__(self):
+        self.postings = {}  # term -> {(kind, id): score}
+        self.documents = {}  # (kind, id) -> frozenset(term, ...)
+        self._owned = None  # None - все списки вхождений свои
+        self._sorted_terms = None
+
+    def fork(self):
+        state = _IndexState()
+        state.postings = dict(self.postings)
+        state.documents = dict(self.documents)
+        state._owned = set()
+        return state
+
+    def _own(self, term):
+        """Список вхождений term, который можно менять"""
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = self.postings[term] = {}
+        elif self._owned is None or term in self._owned:
+            return postings
+        else:
+            postings = self.postings[term] = dict(postings)
+        if self._owned is not None:
+            self._owned.add(term)
+        return postings
+
+    def add(self, documents):
+        for kind, obj_id, fields in documents:
+            key = (kind, obj_id)
+            terms = set(self.documents.get(key, ()))
+            for name, weight in zip(FIELDS, WEIGHTS):
+                for term in tokenize(fields[name]):
+                    postings = self._own(term)
+                    postings[key] = postings.get(key, 0.0) + weight
+                    terms.add(term)
+            self.documents[key] = frozenset(terms)
+        self._sorted_terms = None
+
+    def remove(self, keys):
+        for key in keys:
+            for term in self.documents.pop(key, ()):
+                postings = self._own(term)
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
+        self._sorted_terms = None
+
+    @property
+    def sorted_terms(self):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        return self._sorted_terms
+
+
+class PythonSearchIndex(BaseSearchIndex):
+    """
+    Инвертированный индекс в памяти процесса (для БД без FTS5).
+    Изменение поднимает счётчик поколения в кэше и пишет в журнал
+    (CHANGES_KEY) изменённые документы: другие процессы перечитывают из
+    БД только их. Полная перестройка - если журнал не догнать (вытеснен,
+    отстали больше чем на CHANGES_LIMIT) или индекс перестроен целиком
+    """
+
+    GENERATION_KEY = 'search:generation'
+    CHANGES_KEY = 'search:changes:{generation}'
+    CHANGES_LIMIT = 100
+    CHANGES_TIMEOUT = 60 * 60
+    # запись журнала: перестроить индекс целиком
+    REBUILD = 'rebuild'
+    # запись журнала появляется сразу после поколения: столько секунд
+    # её ждут, ища по прежнему состоянию, а потом перестраивают индекс
+    PENDING_WAIT = 1.0
+
+    def __init__(self):
+        # (поколение, состояние) - одним кортежем, чтобы читать их
+        # согласованно без блокировки
+        self._snapshot = (None, _IndexState())
+        self._pending_since = None
+        # только на подмену снимка: строят состояние вне блокировки,
+        # поиск её не ждёт никогда
+        self._lock = threading.Lock()
+
+    def index_albums(self, ids):
+        self._publish([(KIND_ALBUM, obj_id) for obj_id in ids])
+
+    def index_artists(self, ids, with_albums=True):
+        keys = [(KIND_ARTIST, obj_id) for obj_id in ids]
+        if with_albums:
+            keys += [(KIND_ALBUM, obj_id) for obj_id in Album.objects.filter(
+                artist_id__in=ids).values_list('id', flat=True)]
+        self._publish(keys)
+
+    def remove_documents(self, kind, ids):
+        self._publish([(kind, obj_id) for obj_id in ids])
+
+    def rebuild(self):
+        # поколение - до чтения БД: изменения после него догонит журнал
+        generation = self._next_generation(self.REBUILD)
+        state = self._build()
+        with self._lock:
+            current, _ = self._snapshot
+            if current is None or current < generation:
+                self._snapshot = (generation, state)
+
+    def _next_generation(self, change):
+        """Поднять поколение и записать изменение в журнал"""
+        cache = get_catalog_cache()
+        try:
+            generation = cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            generation = 1
+            cache.set(self.GENERATION_KEY, generation, timeout=None)
+        key = self.CHANGES_KEY.format(generation=generation)
+        # поколение уже занято параллельным изменением (incr кэша не
+        # атомарен) - безопаснее всем перестроить индекс
+        if not cache.add(key, change, timeout=self.CHANGES_TIMEOUT):
+            cache.set(key, self.REBUILD, timeout=self.CHANGES_TIMEOUT)
+        return generation
+
+    def _publish(self, keys):
+        """Записать изменённые документы; свой индекс догоняет журнал"""
+        if not keys:
+            return
+        self._next_generation(sorted(set(keys)))
+        # индекс ещё не построен в этом процессе - достаточно поколения
+        if self._snapshot[0] is not None:
+            self._sync()
+
+    def _changed_keys(self, since, until):
+        """Документы, изменённые после поколения since; None - перестроить"""
+        if since is None or not since < until <= since + self.CHANGES_LIMIT:
+            return None
+        names = [self.CHANGES_KEY.format(generation=generation)
+                 for generation in range(since + 1, until + 1)]
+        changes = get_catalog_cache().get_many(names)
+        if len(changes) != len(names):
+            now = time.monotonic()
+            if self._pending_since is None:
+                self._pending_since = now
+            if now - self._pending_since < self.PENDING_WAIT:
+                return _PENDING
+            return None
+        if self.REBUILD in changes.values():
+            return None
+        return {tuple(key) for change in changes.values() for key in change}
+
+    def _build(self):
+        state = _IndexState()
+        for chunk in _chunks(Artist.objects.values_list('id', flat=True)):
+            state.add(artist_documents(chunk))
+        for chunk in _chunks(Album.objects.values_list('id', flat=True)):
+            state.add(album_documents(chunk))
+        return state
+
+    def _sync(self):
+        cache = get_catalog_cache()
+        cache.add(self.GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(self.GENERATION_KEY)
+        snapshot = self._snapshot
+        since, state = snapshot
+        if generation == since:
+            return
+        keys = self._changed_keys(since, generation)
+        if keys is _PENDING:
+            return
+        if keys is None:
+            state = self._build()
+        else:
+            # удалённые объекты просто не найдутся в БД
+            state = state.fork()
+            state.remove(keys)
+            for kind, documents in ((KIND_ARTIST, artist_documents),
+                                    (KIND_ALBUM, album_documents)):
+                for chunk in _chunks(obj_id for key_kind, obj_id in keys
+                                     if key_kind == kind):
+                    state.add(documents(chunk))
+        with self._lock:
+            # другой поток успел подменить снимок - оставляем его: он не
+            # старее нашего, а отставание догонит следующий поиск
+            if self._snapshot is snapshot:
+                self._snapshot = (generation, state)
+                self._pending_since = None
+
+    @staticmethod
+    def _prefix_postings(state, prefix):
+        """Объединённые вхождения всех терминов, начинающихся с prefix"""
+        terms = state.sorted_terms
+        scores = defaultdict(float)
+        start = bisect.bisect_left(terms, prefix)
+        for term in terms[start:]:
+            if not term.startswith(prefix):
+                break
+            for key, score in state.postings[term].items():
+                scores[key] += score
+        return scores
+
+    def _ranked(self, query):
+        self._sync()
+        # одно состояние на весь запрос: его могут подменить параллельно
+        _, state = self._snapshot
+        ranked = None
+        total = max(len(state.documents), 1)
+        for token in tokenize(query):
+            postings = self._prefix_postings(state, token)
+            idf = math.log(1 + total / (1 + len(postings)))
+            scores = {key: score * idf for key, score in postings.items()}
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {key: ranked[key] + score
+                          for key, score in scores.items() if key in ranked}
+        if not ranked:
+            return []
+        return sorted(ranked, key=lambda key: (-ranked[key], key))
+
+    def search(self, query, offset=0, limit=20):
+        return self._ranked(query)[offset:offset + limit]
+
+    def count(self, query):
+        return len(self._ranked(query))
+
+
+def fts5_table_exists():
+    if connection.vendor != 'sqlite':
+        return False
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+_index = None
+
+
+def get_search_index():
+    """Движок поиска согласно SEARCH_BACKEND ('auto', 'fts5', 'python')"""
+    global _index
+    if _index is None:
+        backend = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if backend == 'fts5' or (backend == 'auto' and fts5_table_exists()):
+            _index = FTS5SearchIndex()
+        else:
+            _index = PythonSearchIndex()
+    return _index
+
+
+class SearchResults:
+    """
+    Ленивый результат поиска для Paginator: считает совпадения одним
+    запросом и загружает только объекты запрошенной страницы
+    """
+
+    def __init__(self, query, index=None):
+        self.query = query
+        self.index = index or get_search_index()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.index.count(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        limit = (item.stop if item.stop is not None else self.count()) - offset
+        keys = self.index.search(self.query, offset, max(limit, 0))
+        album_ids = [obj_id for kind, obj_id in keys if kind == KIND_ALBUM]
+        artist_ids = [obj_id for kind, obj_id in keys if kind == KIND_ARTIST]
+        objects = {
+            KIND_ALBUM: Album.objects.select_related(
+                'artist', 'media_type').in_bulk(album_ids),
+            KIND_ARTIST: Artist.objects.select_related(
+                'genre').in_bulk(artist_ids),
+        }
+        # документ мог пережить объект, если индекс ещё не обновился
+        return [objects[kind][obj_id] for kind, obj_id in keys
+                if obj_id in objects[kind]]
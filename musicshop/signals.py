@@ -0,0 +1,382 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+
+from utils.images import delete_variants
+from utils.media_storage import is_blob_name
+
+from .cache import bump_global_version, bump_version
+from .checkout import confirm_reservations, release_order
+from .facets import get_facet_index
+from .jobs import enqueue_on_commit
+from .media import add_reference, release_reference
+from .models import (
+    Album, Artist, Customer, Genre, ImageGallery, MediaType, Member,
+    Notification, Order)
+from .notifications import restock_event
+from .perf import install_execute_wrapper
+from .reports import schedule_rollup
+from .search import KIND_ALBUM, KIND_ARTIST, get_search_index
+from .storefront import ALBUM_FIELDS, invalidate_snapshot
+
+
+def bump_after_commit(*objects):
+    """
+    Поднять версии после фиксации транзакции, чтобы параллельный запрос
+    не закэшировал страницу по ещё не изменённым данным
+    """
+    objects = [(kind, slug) for kind, slug in objects if slug]
+    transaction.on_commit(
+        lambda: [bump_version(kind, slug) for kind, slug in objects])
+
+
+def _artist_slugs(**filters):
+    return Artist.objects.filter(**filters).values_list('slug', flat=True)
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def album_changed(sender, instance, **kwargs):
+    objects = [('album', instance.slug),
+               ('album', instance.get_loaded_value('slug'))]
+    artist_ids = {instance.artist_id, instance.get_loaded_value('artist_id')}
+    objects += [('artist', slug) for slug in _artist_slugs(id__in=artist_ids)]
+    bump_after_commit(*objects)
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Artist)
+def artist_changed(sender, instance, **kwargs):
+    bump_after_commit(('artist', instance.slug),
+                      ('artist', instance.get_loaded_value('slug')))
+
+
+@receiver(post_save, sender=Member)
+@receiver(pre_delete, sender=Member)
+def member_changed(sender, instance, **kwargs):
+    # pre_delete: после удаления связи m2m с исполнителями уже потеряны
+    bump_after_commit(
+        *[('artist', slug) for slug in _artist_slugs(members=instance)])
+
+
+@receiver(m2m_changed, sender=Artist.members.through)
+def artist_members_changed(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_after_commit(('artist', instance.slug))
+        return
+    # изменения со стороны музыканта: pk_set - это id исполнителей,
+    # а при clear их нужно собрать до удаления связей
+    if action == 'pre_clear':
+        bump_after_commit(
+            *[('artist', slug) for slug in _artist_slugs(members=instance)])
+    elif action in ('post_add', 'post_remove'):
+        bump_after_commit(
+            *[('artist', slug) for slug in _artist_slugs(id__in=pk_set)])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=MediaType)
+@receiver(post_delete, sender=MediaType)
+def catalog_dictionary_changed(sender, **kwargs):
+    transaction.on_commit(bump_global_version)
+
+
+@receiver(post_save, sender=ImageGallery)
+@receiver(post_delete, sender=ImageGallery)
+def gallery_changed(sender, instance, **kwargs):
+    content_object = instance.content_object
+    if isinstance(content_object, (Album, Artist)):
+        bump_after_commit(
+            (content_object._meta.model_name, content_object.slug))
+
+
+# Поисковый индекс
+
+
+def _artist_ids(**filters):
+    return list(Artist.objects.filter(**filters).values_list('id', flat=True))
+
+
+def reindex_artists_after_commit(ids):
+    if ids:
+        transaction.on_commit(lambda: get_search_index().index_artists(ids))
+
+
+@receiver(post_save, sender=Album)
+def search_album_saved(sender, instance, **kwargs):
+    if not instance.fields_changed(
+            'name', 'description', 'songs_list', 'artist_id'):
+        return
+    transaction.on_commit(
+        lambda: get_search_index().index_albums([instance.id]))
+
+
+@receiver(post_delete, sender=Album)
+def search_album_deleted(sender, instance, **kwargs):
+    album_id = instance.id
+    transaction.on_commit(
+        lambda: get_search_index().remove_documents(KIND_ALBUM, [album_id]))
+
+
+@receiver(post_save, sender=Artist)
+def search_artist_saved(sender, instance, **kwargs):
+    if not instance.fields_changed('name', 'genre_id'):
+        return
+    reindex_artists_after_commit([instance.id])
+
+
+@receiver(post_delete, sender=Artist)
+def search_artist_deleted(sender, instance, **kwargs):
+    artist_id = instance.id
+    transaction.on_commit(
+        lambda: get_search_index().remove_documents(KIND_ARTIST, [artist_id]))
+
+
+@receiver(post_save, sender=Member)
+def search_member_saved(sender, instance, **kwargs):
+    if instance.fields_changed('name'):
+        reindex_artists_after_commit(_artist_ids(members=instance))
+
+
+@receiver(pre_delete, sender=Member)
+def search_member_deleted(sender, instance, **kwargs):
+    reindex_artists_after_commit(_artist_ids(members=instance))
+
+
+@receiver(m2m_changed, sender=Artist.members.through)
+def search_artist_members_changed(sender, instance, action, reverse, pk_set,
+                                  **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            reindex_artists_after_commit([instance.id])
+    elif action == 'pre_clear':
+        reindex_artists_after_commit(_artist_ids(members=instance))
+    elif action in ('post_add', 'post_remove'):
+        reindex_artists_after_commit(list(pk_set))
+
+
+@receiver(post_save, sender=Genre)
+def search_genre_saved(sender, instance, **kwargs):
+    reindex_artists_after_commit(_artist_ids(genre=instance))
+
+
+# Варианты изображений (миниатюры, webp)
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=ImageGallery)
+def image_saved(sender, instance, **kwargs):
+    if not instance.fields_changed('image'):
+        return
+    image = instance.image
+    old_name = str(instance.get_loaded_value('image') or '')
+    # варианты файла по содержимому общие для всех ссылок на него -
+    # их удаляет gc_media вместе с самим файлом
+    if (old_name and old_name != image.name
+            and not is_blob_name(old_name)):
+        transaction.on_commit(lambda: delete_variants(image.storage, old_name))
+    if image:
+        label = instance._meta.label_lower
+        enqueue_on_commit(
+            'images.generate_variants', {'model': label, 'pk': instance.pk},
+            key=f'images:{label}:{instance.pk}')
+
+
+@receiver(post_delete, sender=Member)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=ImageGallery)
+def image_deleted(sender, instance, **kwargs):
+    image = instance.image
+    if image and not is_blob_name(image.name):
+        transaction.on_commit(
+            lambda: delete_variants(image.storage, image.name))
+
+
+# Ссылки на файлы хранилища по содержимому (массовые изменения - gc_media)
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=ImageGallery)
+def media_refs_saved(sender, instance, **kwargs):
+    if not instance.fields_changed('image'):
+        return
+    add_reference(instance.image.name)
+    release_reference(str(instance.get_loaded_value('image') or ''))
+
+
+@receiver(post_delete, sender=Member)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=ImageGallery)
+def media_refs_deleted(sender, instance, **kwargs):
+    release_reference(instance.image.name)
+
+
+# Уведомления о поступлении
+
+
+@receiver(post_save, sender=Album)
+def album_restocked(sender, instance, created, **kwargs):
+    if created or instance.get_loaded_value('stock') != 0:
+        return
+    if instance.stock > 0:
+        enqueue_on_commit(
+            'notifications.restock',
+            {'album_id': instance.pk, 'event': restock_event(instance.pk)},
+            key=f'restock:{instance.pk}')
+
+
+# Счётчик непрочитанных уведомлений (массовые операции - notifications.py)
+
+
+def _shift_unread(customer_id, delta):
+    Customer.objects.filter(pk=customer_id).update(
+        unread_notifications=F('unread_notifications') + delta)
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    if created:
+        delta = 0 if instance.read else 1
+    else:
+        was_read = instance.get_loaded_value('read', instance.read)
+        delta = int(was_read) - int(instance.read)
+    if delta:
+        _shift_unread(instance.recipient_id, delta)
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.get_loaded_value('read', instance.read):
+        _shift_unread(instance.recipient_id, -1)
+
+
+# Снимок витрины главной страницы
+
+
+@receiver(post_save, sender=Album)
+def storefront_album_saved(sender, instance, **kwargs):
+    if instance.fields_changed(*ALBUM_FIELDS):
+        invalidate_snapshot()
+
+
+@receiver(post_save, sender=Artist)
+def storefront_artist_saved(sender, instance, **kwargs):
+    if instance.fields_changed('name', 'slug', 'genre_id'):
+        invalidate_snapshot()
+
+
+@receiver(post_delete, sender=Album)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=MediaType)
+@receiver(post_delete, sender=MediaType)
+def storefront_changed(sender, **kwargs):
+    invalidate_snapshot()
+
+
+# Фасетный фильтр каталога
+
+
+@receiver(post_save, sender=Album)
+def facets_album_saved(sender, instance, **kwargs):
+    # остаток важен только переходом через ноль (фасет наличия)
+    in_stock_changed = (
+        (instance.get_loaded_value('stock', 0) > 0) != (instance.stock > 0))
+    if (instance.fields_changed('artist_id', 'media_type_id', 'price')
+            or in_stock_changed):
+        album_id = instance.id
+        transaction.on_commit(
+            lambda: get_facet_index().update_albums([album_id]))
+
+
+@receiver(post_delete, sender=Album)
+def facets_album_deleted(sender, instance, **kwargs):
+    album_id = instance.id
+    transaction.on_commit(lambda: get_facet_index().remove_albums([album_id]))
+
+
+@receiver(post_save, sender=Artist)
+def facets_artist_saved(sender, instance, created, **kwargs):
+    if created or not instance.fields_changed('genre_id'):
+        return
+    ids = list(instance.album_set.values_list('id', flat=True))
+    if ids:
+        transaction.on_commit(lambda: get_facet_index().update_albums(ids))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=MediaType)
+@receiver(post_delete, sender=MediaType)
+def facets_dictionary_changed(sender, **kwargs):
+    transaction.on_commit(lambda: get_facet_index().invalidate())
+
+
+# Итоги заказов по дням (массовые изменения - checkout.py)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    schedule_rollup([instance.created_at])
+
+
+@receiver(post_save, sender=Order)
+def order_status_changed(sender, instance, created, **kwargs):
+    """
+    Заказ вышел из статуса «новый» (админка, shell): резервы больше не
+    истекают, а у отменённого товар сразу возвращается в остаток
+    """
+    if created or instance.status == Order.STATUS_NEW:
+        return
+    if instance.status == Order.STATUS_CANCELLED:
+        release_order(instance)
+    else:
+        confirm_reservations(instance)
+
+
+# Соединения с БД
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Настройки SQLite (WAL, synchronous...) - на каждое соединение"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def track_queries(sender, connection, **kwargs):
+    """Запросы к БД - в замер PerformanceMiddleware"""
+    install_execute_wrapper(connection)
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    """
+    Постоянное соединение могло закрыться на стороне сервера между
+    запросами: проверяем его до начала работы, а не на первом запросе
+    """
+    for connection in connections.all():
+        if (connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                and connection.connection is not None
+                and not connection.in_atomic_block
+                and not connection.is_usable()):
+            connection.close()
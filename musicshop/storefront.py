@@ -0,0 +1,140 @@
+"""
+Витрина главной страницы: предложения недели, новинки и полки жанров.
+
+Полки собираются заранее в снимок - простые словари с готовыми url,
+поэтому главная рендерится без запросов к БД. Снимок лежит в кэше
+и пересобирается, только когда меняются влияющие на него поля
+(musicshop.signals).
+"""
+import time
+
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from utils.images import srcset, thumbnail_url
+
+from .cache import bump_version, get_catalog_cache, versions_key
+from .jobs import enqueue
+from .models import Album, Genre
+
+SNAPSHOT_KEY = 'storefront:snapshot:{versions}'
+# Версия снимка - как у объекта каталога (musicshop.cache)
+SNAPSHOT_OBJECT = ('storefront', 'home')
+# Снимки прежних версий не удаляются, а истекают
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+OFFERS_LIMIT = 8
+NEW_RELEASES_LIMIT = 12
+SHELF_LIMIT = 8
+
+# Поля альбома, которые видны на витрине
+ALBUM_FIELDS = (
+    'name', 'slug', 'image', 'price', 'stock', 'offer_of_the_week',
+    'release_date', 'artist_id', 'media_type_id')
+
+
+def album_card(album):
+    """Карточка альбома без ссылок на модели"""
+    return {
+        'id': album.id,
+        'name': album.name,
+        'slug': album.slug,
+        'artist_slug': album.artist.slug,
+        'url': album.get_absolute_url(),
+        'artist': album.artist.name,
+        'artist_url': album.artist.get_absolute_url(),
+        'media_type': album.media_type.name,
+        'year': album.release_date.year,
+        'price': album.price,
+        'in_stock': album.stock > 0,
+        'thumbnail': thumbnail_url(album.image),
+        'srcset': srcset(album.image, 'webp'),
+    }
+
+
+def cards_version(cards):
+    """
+    Версия списка карточек для ключа фрагмента: версии альбомов, их
+    исполнителей (имя на карточке) и глобальная - одним get_many
+    """
+    objects = {}
+    for card in cards:
+        objects[('album', card['slug'])] = None
+        objects[('artist', card['artist_slug'])] = None
+    return versions_key(*objects)
+
+
+def shelf_album_ids(limit=SHELF_LIMIT):
+    """
+    id первых limit альбомов каждого жанра одним запросом:
+    ROW_NUMBER() по жанру в подзапросе, отбор по номеру снаружи
+    """
+    numbered = Album.objects.annotate(position=Window(
+        RowNumber(), partition_by=F('artist__genre_id'),
+        order_by=[F('release_date').desc(), F('id').desc()],
+    )).values('id', 'position')
+    sql, params = numbered.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM ({sql}) numbered WHERE position <= %s',
+            [*params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def build_snapshot():
+    """Снимок витрины - постоянным числом запросов при любом числе жанров"""
+    albums = Album.objects.select_related('artist', 'media_type').order_by(
+        '-release_date', '-id')
+    by_genre = {}
+    for album in albums.filter(pk__in=shelf_album_ids()):
+        by_genre.setdefault(album.artist.genre_id, []).append(
+            album_card(album))
+    shelves = [
+        {'genre': genre.name, 'slug': genre.slug, 'albums': by_genre[genre.id]}
+        for genre in Genre.objects.filter(
+            pk__in=list(by_genre)).order_by('name')]
+    return {
+        # версия снимка - ключ фрагмента главной в шаблоне
+        'version': int(time.time() * 1000),
+        'offers': [album_card(album) for album in
+                   albums.filter(offer_of_the_week=True)[:OFFERS_LIMIT]],
+        'new_releases': [album_card(album) for album in
+                         albums[:NEW_RELEASES_LIMIT]],
+        'shelves': shelves,
+    }
+
+
+def snapshot_key():
+    """
+    Ключ снимка с версией витрины. Версия читается до сборки: если за
+    время сборки витрину сбросили, снимок ляжет под прежним ключом,
+    который уже никто не читает
+    """
+    return SNAPSHOT_KEY.format(versions=versions_key(SNAPSHOT_OBJECT))
+
+
+def rebuild_snapshot():
+    key = snapshot_key()
+    get_catalog_cache().set(key, build_snapshot(), timeout=SNAPSHOT_TIMEOUT)
+
+
+def get_snapshot():
+    """Снимок витрины; при промахе кэша - собирается и сохраняется"""
+    cache = get_catalog_cache()
+    key = snapshot_key()
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot()
+        cache.set(key, snapshot, timeout=SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def invalidate_snapshot():
+    """Сменить версию снимка после фиксации и пересобрать его в фоне"""
+
+    def invalidate():
+        bump_version(*SNAPSHOT_OBJECT)
+        enqueue('storefront.rebuild', key='storefront:rebuild')
+
+    transaction.on_commit(invalidate)
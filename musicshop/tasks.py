@@ -0,0 +1,56 @@
+"""Обработчики фоновых задач (musicshop.jobs)"""
+from datetime import date
+
+from django.apps import apps
+
+from utils.images import generate_variants
+
+from .cache import bump_global_version
+from .checkout import release_expired
+from .jobs import register
+from .models import Album
+from .notifications import notify_wishlist_holders, restock_event
+from .reports import rollup_day
+from .storefront import invalidate_snapshot, rebuild_snapshot
+
+
+@register('images.generate_variants')
+def generate_image_variants(model, pk):
+    """Варианты текущего изображения объекта (могло смениться с момента
+    постановки задачи - берём актуальное из БД)"""
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return
+    if generate_variants(instance.image):
+        # страницы, собранные до вариантов, ссылаются на оригинал
+        bump_global_version()
+        invalidate_snapshot()
+
+
+@register('notifications.restock')
+def notify_restock(album_id, event=None):
+    """
+    Уведомить всех, у кого альбом в списке ожидаемого. event задаётся при
+    постановке задачи (restock_event) - повторы задачи его сохраняют
+    """
+    album = Album.objects.select_related('artist').filter(pk=album_id).first()
+    if album is None or album.stock <= 0:
+        return
+    notify_wishlist_holders(
+        album, f'Альбом «{album.artist.name} - {album.name}» снова в наличии',
+        event or restock_event(album_id))
+
+
+@register('storefront.rebuild')
+def rebuild_storefront():
+    rebuild_snapshot()
+
+
+@register('checkout.release_expired')
+def release_expired_reservations():
+    release_expired()
+
+
+@register('reports.rollup_day')
+def rollup_order_day(day):
+    rollup_day(date.fromisoformat(day))
@@ -0,0 +1,51 @@
+from django import template
+
+from utils import images, resolve_content_objects
+
+from ..storefront import cards_version as _cards_version
+
+register = template.Library()
+
+
+@register.filter
+def with_content_objects(rows):
+    """
+    {% for line in lines|with_content_objects %} - content_object всех
+    строк загружается пачкой, а не по запросу на строку
+    """
+    return resolve_content_objects(rows)
+
+
+@register.filter
+def thumbnail_url(image):
+    """{{ album.image|thumbnail_url }} - миниатюра для списков"""
+    return images.thumbnail_url(image)
+
+
+@register.simple_tag
+def srcset(image, extension='jpg'):
+    """{% srcset album.image 'webp' %} - все ширины вариантов"""
+    return images.srcset(image, extension)
+
+
+@register.simple_tag
+def cards_version(cards):
+    """
+    {% cards_version albums as version %} - версия списка карточек для
+    {% cache %}: фрагмент устаревает с любым альбомом или исполнителем
+    """
+    return _cards_version(cards)
+
+
+@register.inclusion_tag('musicshop/includes/picture.html')
+def picture(image, alt='', sizes='100vw', css_class='img-fluid'):
+    """<picture> с webp и jpeg-вариантами вместо оригинала"""
+    return {
+        'image': image,
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'webp_srcset': images.srcset(image, 'webp'),
+        'jpeg_srcset': images.srcset(image, 'jpg'),
+        'fallback': images.thumbnail_url(image),
+    }
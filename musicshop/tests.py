@@ -0,0 +1,1197 @@
+import asyncio
+import base64
+import csv
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
+
+from asgiref.sync import SyncToAsync, async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.signing import get_cookie_signer
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.db import IntegrityError, OperationalError, connection
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from utils import images
+from utils.db_backends.pool import (
+    ConnectionPool, PooledDatabaseWrapperMixin)
+from utils.db_backends.sqlite3_pooled.base import (
+    DatabaseWrapper as PooledDatabaseWrapper)
+from utils.staticfiles import parse_range, serve_file
+
+from .anonymous_cart import (
+    COOKIE_NAME, COOKIE_SALT, MAX_LINES, AnonymousCart)
+from .cart import CartService
+from .catalog_io import CatalogImportError, CatalogImporter
+from .checkout import OutOfStock, checkout, release_expired
+from .facets import IN_STOCK, FacetIndex, count_bits
+from .forms import LoginForm
+from .jobs import HANDLERS, claim, enqueue, requeue_stale, run_job
+from .notifications import notify_wishlist_holders
+from .media import collect_garbage
+from .pagination import CachedCountPaginator
+from .reports import EXPORT_COLUMNS, order_report, rollup_day
+from .search import (
+    KIND_ALBUM, FTS5SearchIndex, PythonSearchIndex, fts5_table_exists)
+from .perf import PerformanceMiddleware, recorder
+from .storefront import (
+    SHELF_LIMIT, build_snapshot, get_snapshot, invalidate_snapshot)
+from .models import (
+    Album, Artist, CartProduct, Customer, Genre, ImageGallery, Job,
+    MediaBlob, MediaType, Member, Notification, Order, OrderDailyRollup,
+    StockReservation)
+
+# Тесты - один процесс: общий кэш не нужен, а файловый мешал бы
+# параллельным прогонам
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'musicshop-tests',
+    }
+}
+
+
+def create_catalog(members=2, albums=2, images=2):
+    """Жанр, носитель и исполнитель с участниками, альбомами и галереей"""
+    genre = Genre.objects.create(name='Индастриал', slug='industrial')
+    media_type = MediaType.objects.create(name='CD')
+    artist = Artist.objects.create(
+        name='Nine Inch Nails', genre=genre, slug='nine-inch-nails')
+    for number in range(members):
+        artist.members.add(Member.objects.create(
+            name=f'Участник {number}', slug=f'member-{number}'))
+    for number in range(albums):
+        Album.objects.create(
+            artist=artist, name=f'Альбом {number}', slug=f'album-{number}',
+            image=f'images/album-{number}.jpg', media_type=media_type,
+            songs_list='', release_date=date(2000 + number, 1, 1),
+            price=Decimal('10.00'), stock=5)
+    content_types = ContentType.objects.get_for_models(Artist, Album)
+    album = Album.objects.order_by('id').first()
+    for number in range(images):
+        for obj in (artist, album):
+            ImageGallery.objects.create(
+                content_type=content_types[type(obj)], object_id=obj.id,
+                image=f'images/gallery-{number}.jpg')
+    return artist
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class CatalogQueryCountTests(TestCase):
+    """
+    Число запросов страниц каталога не зависит от числа участников,
+    альбомов и изображений галереи
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        ContentType.objects.clear_cache()
+
+    def assertPageQueries(self, num, url):
+        caches['default'].clear()
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def grow_catalog(self, artist):
+        """Ещё участники, альбомы и изображения у того же исполнителя"""
+        media_type = MediaType.objects.get()
+        album = Album.objects.order_by('id').first()
+        content_type = ContentType.objects.get_for_model(Album)
+        for number in range(10, 15):
+            artist.members.add(Member.objects.create(
+                name=f'Участник {number}', slug=f'member-{number}'))
+            Album.objects.create(
+                artist=artist, name=f'Альбом {number}',
+                slug=f'album-{number}', image='images/album.jpg',
+                media_type=media_type, songs_list='',
+                release_date=date(2010, 1, number - 9),
+                price=Decimal('10.00'))
+            ImageGallery.objects.create(
+                content_type=content_type, object_id=album.id,
+                image=f'images/gallery-{number}.jpg')
+
+    def test_artist_detail(self):
+        artist = create_catalog()
+        url = artist.get_absolute_url()
+        self.assertPageQueries(4, url)
+        self.grow_catalog(artist)
+        self.assertPageQueries(4, url)
+
+    def test_album_detail(self):
+        artist = create_catalog()
+        url = Album.objects.order_by('id').first().get_absolute_url()
+        self.assertPageQueries(4, url)
+        self.grow_catalog(artist)
+        self.assertPageQueries(4, url)
+
+    def test_cached_detail_page_skips_database(self):
+        artist = create_catalog()
+        url = artist.get_absolute_url()
+        self.assertPageQueries(4, url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Catalog-Cache'], 'hit')
+
+    def test_query_string_bypasses_page_cache(self):
+        url = create_catalog().get_absolute_url()
+        response = self.client.get(url, {'q': '<poisoned>'})
+        self.assertEqual(response['X-Catalog-Cache'], 'bypass')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Catalog-Cache'], 'miss')
+        self.assertNotContains(response, 'poisoned')
+
+    def test_homepage_from_snapshot(self):
+        create_catalog()
+        self.client.get('/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertContains(response, 'Альбом 0')
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class ContentObjectsTests(TestCase):
+
+    def test_one_query_per_content_type(self):
+        create_catalog(albums=3, images=1)
+        content_type = ContentType.objects.get_for_model(Album)
+        for album in Album.objects.all():
+            for number in range(3):
+                ImageGallery.objects.create(
+                    content_type=content_type, object_id=album.id,
+                    image=f'images/extra-{number}.jpg')
+        # строки, пачка исполнителей, пачка альбомов - при любом числе строк
+        with self.assertNumQueries(3):
+            rows = list(ImageGallery.objects.with_content_objects())
+            objects = [row.content_object for row in rows]
+        self.assertEqual(len(objects), 11)
+        self.assertEqual({type(obj) for obj in objects}, {Artist, Album})
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True, CART_MAX_QTY=99)
+class CartTests(TestCase):
+
+    def setUp(self):
+        create_catalog()
+        self.album = Album.objects.order_by('id').first()
+        user = get_user_model().objects.create_user('buyer', password='pw')
+        self.customer = Customer.objects.create(user=user)
+        self.client.force_login(user)
+
+    def test_quantity_is_clamped(self):
+        # больше PositiveSmallIntegerField и max_digits цены позиции
+        self.client.post(f'/cart/add/{self.album.slug}/', {'qty': 10 ** 9})
+        line = CartProduct.objects.get()
+        self.assertEqual(line.qty, 99)
+        self.client.post(f'/cart/add/{self.album.slug}/', {'qty': 5})
+        self.client.post(
+            f'/cart/change-qty/{self.album.slug}/', {'qty': 70000})
+        line.refresh_from_db()
+        self.assertEqual(line.qty, 99)
+        self.assertEqual(line.final_price, 99 * self.album.price)
+
+    def test_line_save_does_not_load_product(self):
+        CartService.for_customer(self.customer).add(self.album, 2)
+        line = CartProduct.objects.with_content_objects().get()
+        line.qty = 3
+        with self.assertNumQueries(1):
+            line.save()
+        line = CartProduct.objects.get()
+        line.qty = 4
+        # цена - одним запросом, ContentType - из кэша
+        ContentType.objects.get_for_id(line.content_type_id)
+        with self.assertNumQueries(2):
+            line.save()
+        self.assertEqual(line.final_price, 4 * self.album.price)
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True, CART_MAX_QTY=99)
+class AnonymousCartTests(TestCase):
+    """Корзина без входа - в подписанной cookie, при входе переносится"""
+
+    def setUp(self):
+        create_catalog()
+        self.album = Album.objects.order_by('id').first()
+
+    def cart_from_cookie(self, value):
+        request = RequestFactory().get('/cart/')
+        request.COOKIES[COOKIE_NAME] = value
+        return AnonymousCart.from_request(request)
+
+    def signed(self, lines):
+        return get_cookie_signer(salt=COOKIE_NAME + COOKIE_SALT).sign(
+            json.dumps(lines, separators=(',', ':')))
+
+    def test_tampered_cookie_is_empty_cart(self):
+        value = self.signed([[self.album.pk, 1]])
+        self.assertEqual(self.cart_from_cookie(value).quantities,
+                         {self.album.pk: 1})
+        tampered = value.replace(f'[{self.album.pk},1]',
+                                 f'[{self.album.pk},50]')
+        self.assertEqual(self.cart_from_cookie(tampered).quantities, {})
+        self.assertEqual(self.cart_from_cookie('garbage').quantities, {})
+        # подписанное, но не то содержимое
+        self.assertEqual(
+            self.cart_from_cookie(self.signed({'a': 1})).quantities, {})
+
+    def test_max_lines(self):
+        cart = AnonymousCart()
+        cart.add_many({album_id: 1 for album_id in range(1, MAX_LINES + 10)})
+        self.assertEqual(len(cart.quantities), MAX_LINES)
+        # уже лежащие позиции увеличиваются и в полной корзине
+        cart.add_many({1: 2})
+        self.assertEqual(cart.quantities[1], 3)
+        lines = [[album_id, 1] for album_id in range(1, MAX_LINES + 10)]
+        self.assertEqual(
+            len(self.cart_from_cookie(self.signed(lines)).quantities),
+            MAX_LINES)
+
+    def test_merge_on_login(self):
+        user = get_user_model().objects.create_user('buyer', password='pw')
+        customer = Customer.objects.create(user=user)
+        CartService.for_customer(customer).add(self.album, 90)
+        other = Album.objects.order_by('id').last()
+        self.client.post(f'/cart/add/{self.album.slug}/', {'qty': 20})
+        self.client.post(f'/cart/add/{other.slug}/', {'qty': 2})
+        self.assertFalse(Customer.objects.exclude(pk=customer.pk).exists())
+        response = self.client.post(
+            '/login/', {'username': 'buyer', 'password': 'pw'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[COOKIE_NAME].value, '')
+        quantities = dict(CartProduct.objects.values_list(
+            'object_id', 'qty'))
+        self.assertEqual(quantities, {self.album.pk: 99, other.pk: 2})
+
+
+class LoginFormTests(TestCase):
+
+    def test_unknown_user_and_wrong_password_look_the_same(self):
+        get_user_model().objects.create_user('buyer', password='pw')
+        errors = []
+        for username, password in (('nobody', 'pw'), ('buyer', 'wrong')):
+            form = LoginForm({'username': username, 'password': password})
+            self.assertFalse(form.is_valid())
+            self.assertIsNone(form.user)
+            errors.append(form.errors.as_data())
+        self.assertEqual(str(errors[0]), str(errors[1]))
+        self.assertEqual(form.non_field_errors(), [LoginForm.INVALID_LOGIN])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), MEDIA_URL='/media/')
+class ImageVariantTests(TestCase):
+
+    def test_original_until_variants_exist(self):
+        album = Album(image='images/cover.jpg')
+        self.assertEqual(images.thumbnail_url(album.image),
+                         '/media/images/cover.jpg')
+        self.assertEqual(images.srcset(album.image, 'webp'), '')
+        for name in images.variant_names(album.image.name):
+            default_storage.save(name, ContentFile(b''))
+        self.assertEqual(images.thumbnail_url(album.image),
+                         '/media/images/cover_200w.jpg')
+        self.assertIn('cover_800w.webp 800w',
+                      images.srcset(album.image, 'webp'))
+        images.delete_variants(default_storage, album.image.name)
+        self.assertEqual(images.thumbnail_url(album.image),
+                         '/media/images/cover.jpg')
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=False,
+                   MEDIA_ROOT=tempfile.mkdtemp())
+class MediaStorageTests(TestCase):
+    """Одинаковые загрузки - один файл, gc_media удаляет файлы без ссылок"""
+
+    def setUp(self):
+        create_catalog(members=2)
+        self.members = list(Member.objects.order_by('id'))
+
+    def upload(self, member, filename, content=b'same image'):
+        member.image.save(filename, ContentFile(content))
+        return member.image.name
+
+    def test_identical_uploads_share_blob(self):
+        first, second = self.members
+        name = self.upload(first, 'first.jpg')
+        self.assertEqual(self.upload(second, 'second.JPG'), name)
+        self.assertRegex(name, r'^blobs/../../[0-9a-f]{64}\.jpg$')
+        blob = MediaBlob.objects.get()
+        self.assertEqual((blob.name, blob.refs), (name, 2))
+
+    def test_gc_removes_file_after_last_reference(self):
+        first, second = self.members
+        name = self.upload(first, 'first.jpg')
+        self.upload(second, 'second.jpg')
+        first.delete()
+        collect_garbage(grace=0)
+        self.assertTrue(default_storage.exists(name))
+        second.delete()
+        self.assertEqual(MediaBlob.objects.get().refs, 0)
+        self.assertEqual(collect_garbage(grace=0), (1, len(b'same image')))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_legacy_names_left_alone(self):
+        name = default_storage.save(
+            'members_images/member-0.jpg', ContentFile(b'legacy'))
+        first = self.members[0]
+        first.image = name
+        first.save()
+        first.delete()
+        collect_garbage(grace=0)
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertTrue(default_storage.exists(name))
+
+
+class StaticFileServingTests(SimpleTestCase):
+    """Range, If-Range и выбор сжатого варианта в utils.staticfiles"""
+
+    SIZE = 1000
+    ENCODINGS = ('.br', '.gz')
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.content = bytes(range(256)) * 3 + bytes(self.SIZE - 768)
+        (self.root / 'app.css').write_bytes(self.content)
+        (self.root / 'app.css.gz').write_bytes(b'gzip')
+        (self.root / 'app.css.br').write_bytes(b'brotli')
+
+    def serve(self, encodings=(), **headers):
+        request = RequestFactory().get('/static/app.css', **headers)
+        return serve_file(request, str(self.root), 'app.css', 'public',
+                          encodings=encodings)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=10-5000', 1000), (10, 999))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=1000-', 1000)
+        with self.assertRaises(ValueError):
+            parse_range('bytes=-0', 1000)
+
+    def test_suffix_range(self):
+        response = self.serve(HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 990-999/1000')
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.content[-10:])
+
+    def test_range_in_the_middle(self):
+        response = self.serve(HTTP_RANGE='bytes=256-511')
+        self.assertEqual(response['Content-Length'], '256')
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.content[256:512])
+
+    def test_range_past_end(self):
+        response = self.serve(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1000')
+
+    def test_if_range_with_other_etag_serves_whole_file(self):
+        response = self.serve(HTTP_RANGE='bytes=0-9',
+                              HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        etag = response['ETag']
+        response = self.serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_compressed_variant(self):
+        for accepted, encoding, body in (('gzip, br', 'br', b'brotli'),
+                                         ('gzip', 'gzip', b'gzip')):
+            response = self.serve(self.ENCODINGS,
+                                  HTTP_ACCEPT_ENCODING=accepted)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(b''.join(response.streaming_content), body)
+        response = self.serve(self.ENCODINGS)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        # диапазон - только по несжатому файлу
+        response = self.serve(self.ENCODINGS, HTTP_ACCEPT_ENCODING='br',
+                              HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=False)
+class JobQueueTests(TestCase):
+    """Ключ идемпотентности: не больше одной ожидающей задачи"""
+
+    def test_enqueue_returns_claimed_job(self):
+        job = enqueue('storefront.rebuild', key='storefront:rebuild')
+        self.assertEqual(
+            enqueue('storefront.rebuild', key='storefront:rebuild'), job)
+        claim(10)
+        # ожидавшую задачу забрал воркер между INSERT и повторным чтением
+        with mock.patch.object(Job.objects, 'create',
+                               side_effect=IntegrityError):
+            self.assertEqual(
+                enqueue('storefront.rebuild', key='storefront:rebuild'), job)
+
+    def test_requeue_stale_with_queued_duplicate(self):
+        first = enqueue('storefront.rebuild', key='storefront:rebuild')
+        other = enqueue('notifications.restock', {'album_id': 0})
+        claim(10)
+        queued = enqueue('storefront.rebuild', key='storefront:rebuild')
+        Job.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(60), 1)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            first.pk: Job.STATUS_FAILED,
+            other.pk: Job.STATUS_QUEUED,
+            queued.pk: Job.STATUS_QUEUED,
+        })
+
+    def test_retry_with_queued_duplicate_fails(self):
+        first = enqueue('storefront.rebuild', key='storefront:rebuild')
+        claim(10)
+        queued = enqueue('storefront.rebuild', key='storefront:rebuild')
+        with mock.patch.dict(HANDLERS,
+                             {'storefront.rebuild': mock.Mock(
+                                 side_effect=RuntimeError)}), \
+                self.assertLogs('musicshop.jobs', 'WARNING'):
+            self.assertEqual(run_job(first.pk), Job.STATUS_FAILED)
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.STATUS_FAILED)
+        self.assertIn('RuntimeError', first.last_error)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.STATUS_QUEUED)
+
+
+class NotificationFanOutTests(TestCase):
+
+    def add_fans(self, album, start, count):
+        for number in range(start, start + count):
+            user = get_user_model().objects.create_user(f'fan-{number}')
+            Customer.objects.create(user=user).wishlist.add(album)
+
+    def unread(self):
+        return dict(Customer.objects.values_list(
+            'user__username', 'unread_notifications'))
+
+    def test_retry_does_not_duplicate(self):
+        create_catalog()
+        album = Album.objects.order_by('id').first()
+        self.add_fans(album, 0, 5)
+        self.assertEqual(
+            notify_wishlist_holders(album, 'В наличии', 'restock:1:1',
+                                    chunk_size=2), 5)
+        # повтор задачи после сбоя
+        self.assertEqual(
+            notify_wishlist_holders(album, 'В наличии', 'restock:1:1',
+                                    chunk_size=2), 0)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(
+            set(Customer.objects.values_list(
+                'unread_notifications', flat=True)), {1})
+        notify_wishlist_holders(album, 'Снова в наличии', 'restock:1:2')
+        self.assertEqual(Notification.objects.count(), 10)
+
+    def test_retry_reaches_only_missing_recipients(self):
+        create_catalog()
+        album = Album.objects.order_by('id').first()
+        self.add_fans(album, 0, 5)
+        # первая попытка успела уведомить не всю пачку
+        for customer in Customer.objects.filter(
+                user__username__in=['fan-1', 'fan-3']):
+            Notification.objects.create(
+                recipient=customer, text='В наличии', event='restock:1:1')
+            customer.unread_notifications = 1
+            customer.save()
+        # добавил альбом уже после первой попытки
+        self.add_fans(album, 5, 1)
+        self.assertEqual(
+            notify_wishlist_holders(album, 'В наличии', 'restock:1:1',
+                                    chunk_size=2), 4)
+        self.assertEqual(Notification.objects.count(), 6)
+        self.assertEqual(set(self.unread().values()), {1})
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        create_catalog()
+        self.first, self.second = Album.objects.order_by('id')
+        # совпадение в названии весит больше, чем в описании
+        Album.objects.filter(pk=self.first.pk).update(
+            description='fragile edition')
+        Album.objects.filter(pk=self.second.pk).update(name='The Fragile')
+
+    def skip_without_fts5(self):
+        if not fts5_table_exists():
+            self.skipTest('SQLite без FTS5')
+
+    def test_fts5_ranks_name_above_description(self):
+        self.skip_without_fts5()
+        index = FTS5SearchIndex()
+        index.rebuild()
+        self.assertEqual(index.search('fragi'), [
+            (KIND_ALBUM, self.second.pk), (KIND_ALBUM, self.first.pk)])
+        self.assertEqual(index.count('fragile edition'), 1)
+
+    def test_python_index_ranks_like_fts5(self):
+        index = PythonSearchIndex()
+        index.rebuild()
+        self.assertEqual(index.search('fragi'), [
+            (KIND_ALBUM, self.second.pk), (KIND_ALBUM, self.first.pk)])
+
+    def test_python_index_follows_other_process_journal(self):
+        # два индекса с общим кэшем - как два процесса
+        writer, reader = PythonSearchIndex(), PythonSearchIndex()
+        reader.search('fragile')
+        Album.objects.filter(pk=self.first.pk).update(name='Still')
+        writer.index_albums([self.first.pk])
+        # догоняет по журналу - перечитывает один документ, а не всё
+        with mock.patch.object(PythonSearchIndex, '_build') as build:
+            self.assertEqual(reader.search('still'),
+                             [(KIND_ALBUM, self.first.pk)])
+        build.assert_not_called()
+        writer.remove_documents(KIND_ALBUM, [self.second.pk])
+        Album.objects.filter(pk=self.second.pk).delete()
+        self.assertEqual(reader.search('fragile'),
+                         [(KIND_ALBUM, self.first.pk)])
+
+    def test_fill_migration_matches_rebuild(self):
+        self.skip_without_fts5()
+        index = FTS5SearchIndex()
+        index.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT * FROM musicshop_search ORDER BY rowid')
+            rebuilt = cursor.fetchall()
+            cursor.execute('DELETE FROM musicshop_search')
+        migration = importlib.import_module(
+            'musicshop.migrations.0010_fill_search_index')
+        migration.fill_fts_table(django_apps, connection.schema_editor())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT * FROM musicshop_search ORDER BY rowid')
+            self.assertEqual(cursor.fetchall(), rebuilt)
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class StorefrontSnapshotTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def add_genre(self, number, albums):
+        genre = Genre.objects.create(
+            name=f'Жанр {number}', slug=f'genre-{number}')
+        artist = Artist.objects.create(
+            name=f'Исполнитель {number}', genre=genre,
+            slug=f'artist-{number}')
+        media_type = MediaType.objects.first()
+        for album in range(albums):
+            Album.objects.create(
+                artist=artist, name=f'Альбом {number}-{album}',
+                slug=f'album-{number}-{album}', image='images/album.jpg',
+                media_type=media_type, songs_list='',
+                release_date=date(2000, 1, 1 + album % 28),
+                price=Decimal('10.00'))
+
+    def test_queries_do_not_depend_on_genres(self):
+        create_catalog()
+        with self.assertNumQueries(5):
+            build_snapshot()
+        for number in range(3):
+            self.add_genre(number, SHELF_LIMIT + 3)
+        with self.assertNumQueries(5):
+            snapshot = build_snapshot()
+        shelves = {shelf['slug']: shelf['albums']
+                   for shelf in snapshot['shelves']}
+        self.assertEqual(len(shelves), 4)
+        self.assertEqual(len(shelves['genre-0']), SHELF_LIMIT)
+        self.assertEqual(
+            [card['slug'] for card in shelves['genre-1'][:2]],
+            ['album-1-10', 'album-1-9'])
+
+    @override_settings(JOBS_EAGER=False)
+    def test_stale_build_is_not_served(self):
+        create_catalog()
+
+        def build_during_invalidation():
+            snapshot = build_snapshot()
+            # альбом изменился, пока собирался снимок
+            with self.captureOnCommitCallbacks(execute=True):
+                Album.objects.update(name='Переименован')
+                invalidate_snapshot()
+            return snapshot
+
+        with mock.patch('musicshop.storefront.build_snapshot',
+                        side_effect=build_during_invalidation):
+            stale = get_snapshot()
+        self.assertEqual(stale['new_releases'][0]['name'], 'Альбом 1')
+        self.assertEqual(
+            get_snapshot()['new_releases'][0]['name'], 'Переименован')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PaginationTests(TestCase):
+
+    def test_invalid_cursor_is_bad_request(self):
+        create_catalog()
+        url = '/catalog/genre/industrial/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        for value in ('not-a-date', 'NaN', {'x': 1}, None):
+            for order in ('new', 'price'):
+                raw = json.dumps([value, 1]).encode()
+                cursor = base64.urlsafe_b64encode(raw).decode()
+                response = self.client.get(
+                    url, {'order': order, 'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'cursor': '%%%'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached_count_of_empty_filter(self):
+        paginator = CachedCountPaginator(
+            Album.objects.filter(pk__in=[]).order_by('id'), 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FacetIndexTests(TestCase):
+    """Два экземпляра индекса - два процесса с общим кэшем"""
+
+    def setUp(self):
+        caches['default'].clear()
+        create_catalog()
+        self.album = Album.objects.order_by('id').first()
+        self.local, self.other = FacetIndex(), FacetIndex()
+
+    def in_stock(self, index):
+        mask, counts = index.query({IN_STOCK: {True}})
+        return count_bits(mask)
+
+    def test_changes_do_not_rebuild_other_processes(self):
+        self.assertEqual(self.in_stock(self.local), 2)
+        self.assertEqual(self.in_stock(self.other), 2)
+        Album.objects.filter(pk=self.album.pk).update(stock=0)
+        self.local.update_albums([self.album.pk])
+        with mock.patch.object(self.other, '_build') as build:
+            with self.assertNumQueries(1):
+                self.assertEqual(self.in_stock(self.other), 1)
+        build.assert_not_called()
+        self.assertEqual(self.in_stock(self.local), 1)
+        Album.objects.filter(pk=self.album.pk).delete()
+        self.local.remove_albums([self.album.pk])
+        self.assertEqual(count_bits(self.local.query({})[0]), 1)
+        self.assertEqual(count_bits(self.other.query({})[0]), 1)
+
+    def test_invalidate_rebuilds(self):
+        self.in_stock(self.other)
+        self.local.invalidate()
+        with mock.patch.object(self.other, '_build') as build:
+            self.in_stock(self.other)
+        build.assert_called_once_with()
+
+    def test_stock_change_above_zero_is_not_published(self):
+        self.in_stock(self.other)
+        self.album.stock = 3
+        with mock.patch.object(FacetIndex, 'update_albums') as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.album.save()
+        update.assert_not_called()
+
+
+ORDER_FIELDS = {'first_name': 'Имя', 'last_name': 'Фамилия', 'phone': '1',
+                'buying_type': Order.BUYING_TYPE_SELF}
+
+
+def last_unit_buyers(buyers=2):
+    """Альбом с одной единицей в остатке и корзины покупателей с ним"""
+    create_catalog(albums=1)
+    album = Album.objects.get()
+    Album.objects.filter(pk=album.pk).update(stock=1)
+    carts = []
+    for number in range(buyers):
+        user = get_user_model().objects.create_user(f'buyer-{number}')
+        service = CartService.for_customer(Customer.objects.create(user=user))
+        service.add(album)
+        carts.append(service.cart)
+    return album, carts
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class CheckoutTests(TestCase):
+
+    def test_confirmed_order_keeps_reservation(self):
+        album, (first, second) = last_unit_buyers()
+        order = checkout(first, **ORDER_FIELDS)
+        order.status = Order.STATUS_IN_PROGRESS
+        order.save()
+        StockReservation.objects.update(expires_at=timezone.now())
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(StockReservation.objects.get().status,
+                         StockReservation.STATUS_CONFIRMED)
+        with self.assertRaises(OutOfStock):
+            checkout(second, **ORDER_FIELDS)
+        album.refresh_from_db()
+        self.assertEqual(album.stock, 0)
+
+    def test_expired_new_order_is_released(self):
+        album, (first, second) = last_unit_buyers()
+        order = checkout(first, **ORDER_FIELDS)
+        StockReservation.objects.update(expires_at=timezone.now())
+        self.assertEqual(release_expired(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_CANCELLED)
+        checkout(second, **ORDER_FIELDS)
+        album.refresh_from_db()
+        self.assertEqual(album.stock, 0)
+
+    def test_cancelled_order_returns_stock(self):
+        album, (first, second) = last_unit_buyers()
+        order = checkout(first, **ORDER_FIELDS)
+        order.status = Order.STATUS_CANCELLED
+        order.save()
+        album.refresh_from_db()
+        self.assertEqual(album.stock, 1)
+        checkout(second, **ORDER_FIELDS)
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class OrderReportTests(TestCase):
+
+    def setUp(self):
+        self.album, self.carts = last_unit_buyers()
+        Album.objects.filter(pk=self.album.pk).update(stock=2)
+        self.today = timezone.localdate()
+
+    def place_order(self, cart):
+        with self.captureOnCommitCallbacks(execute=True):
+            return checkout(cart, **ORDER_FIELDS)
+
+    def rollup(self, dimension, key=''):
+        return OrderDailyRollup.objects.filter(
+            day=self.today, dimension=dimension, key=key).values_list(
+            'orders', 'units', 'revenue').first()
+
+    def test_rollup_recomputed_when_order_changes(self):
+        order = self.place_order(self.carts[0])
+        price = self.album.price
+        self.assertEqual(self.rollup(OrderDailyRollup.DIMENSION_TOTAL),
+                         (1, 1, price))
+        self.assertEqual(
+            self.rollup(OrderDailyRollup.DIMENSION_MEDIA_TYPE,
+                        str(self.album.media_type_id)),
+            (1, 1, Decimal(0)))
+        order.status = Order.STATUS_CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        # отменённый заказ не входит в итог, его резерв снят
+        self.assertEqual(self.rollup(OrderDailyRollup.DIMENSION_TOTAL),
+                         (0, 0, Decimal(0)))
+        self.assertEqual(
+            self.rollup(OrderDailyRollup.DIMENSION_STATUS,
+                        Order.STATUS_CANCELLED),
+            (1, 0, price))
+        self.assertIsNone(self.rollup(OrderDailyRollup.DIMENSION_GENRE,
+                                      str(self.album.artist.genre_id)))
+
+    def test_report_sums_days(self):
+        yesterday = self.today - timedelta(days=1)
+        first = self.place_order(self.carts[0])
+        self.place_order(self.carts[1])
+        Order.objects.filter(pk=first.pk).update(created_at=yesterday)
+        rollup_day(yesterday)
+        rollup_day(self.today)
+        with self.assertNumQueries(4):
+            report = order_report(yesterday, self.today)
+        self.assertEqual(
+            (report['total']['orders'], report['total']['units']), (2, 2))
+        self.assertEqual([day['day'] for day in report['days']],
+                         [self.today, yesterday])
+        sections = dict(report['sections'])
+        self.assertEqual(
+            [(row['label'], row['units']) for row in sections['Жанр']],
+            [('Индастриал', 2)])
+        self.assertEqual(order_report(self.today, self.today)['total'][
+            'orders'], 1)
+
+    def export(self, file_format):
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'staff', password='pw'))
+        response = self.client.get(
+            '/reports/orders/export/', {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        order = self.place_order(self.carts[0])
+        content = self.export('csv').decode('utf-8-sig')
+        header, row = csv.reader(io.StringIO(content))
+        self.assertEqual(header, [title for _, title in EXPORT_COLUMNS])
+        self.assertEqual(row[0], str(order.pk))
+        self.assertEqual(row[3], 'Новый заказ')
+        self.assertEqual(row[-1], '1')
+
+    def test_xlsx_round_trip(self):
+        order = self.place_order(self.carts[0])
+        with zipfile.ZipFile(io.BytesIO(self.export('xlsx'))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = ElementTree.fromstring(
+                archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'x': 'http://schemas.openxmlformats.org/'
+                          'spreadsheetml/2006/main'}
+        rows = [[''.join(cell.itertext())
+                 for cell in row.findall('x:c', namespace)]
+                for row in sheet.iterfind('x:sheetData/x:row', namespace)]
+        self.assertEqual(rows[0], [title for _, title in EXPORT_COLUMNS])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(order.pk))
+        self.assertEqual(rows[1][5], 'buyer-0')
+
+
+class FakeConnection:
+    """Соединение DB-API для пула: ping - SELECT 1 через курсор"""
+
+    def __init__(self, usable=True):
+        self.usable = usable
+        self.closed = False
+
+    def cursor(self):
+        if not self.usable:
+            raise OperationalError('server closed the connection')
+        return mock.Mock()
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_reuses_last_released(self):
+        pool = ConnectionPool(max_idle=2)
+        first = pool.acquire(FakeConnection, bool)
+        second = pool.acquire(FakeConnection, bool)
+        pool.release(first)
+        pool.release(second)
+        self.assertIs(pool.acquire(FakeConnection, bool), second)
+        self.assertEqual(pool.stats, {'created': 2, 'reused': 1, 'closed': 0})
+
+    def test_max_idle_closes_extra(self):
+        pool = ConnectionPool(max_idle=1)
+        first = pool.acquire(FakeConnection, bool)
+        second = pool.acquire(FakeConnection, bool)
+        pool.release(first)
+        pool.release(second)
+        self.assertFalse(first.closed)
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.stats['closed'], 1)
+
+    def test_expired_and_broken_are_replaced(self):
+        pool = ConnectionPool(max_lifetime=None)
+        wrapper = PooledDatabaseWrapperMixin()
+        broken = pool.acquire(FakeConnection, bool)
+        pool.release(broken)
+        broken.usable = False
+        fresh = pool.acquire(FakeConnection, wrapper.raw_connection_is_usable)
+        self.assertIsNot(fresh, broken)
+        self.assertTrue(broken.closed)
+        pool = ConnectionPool(max_lifetime=0)
+        old = pool.acquire(FakeConnection, bool)
+        pool.release(old)
+        self.assertTrue(old.closed)
+        self.assertIsNot(pool.acquire(FakeConnection, bool), old)
+
+
+class PooledBackendTests(TransactionTestCase):
+    """sqlite3_pooled: close() возвращает соединение в пул"""
+
+    def setUp(self):
+        path = Path(tempfile.mkdtemp()) / 'pool.sqlite3'
+        self.wrapper = PooledDatabaseWrapper(
+            dict(connection.settings_dict, NAME=str(path),
+                 ENGINE='utils.db_backends.sqlite3_pooled',
+                 POOL={'MAX_IDLE': 1}),
+            alias='pool-test')
+        self.addCleanup(self.wrapper.pool.close_all)
+
+    def raw(self):
+        self.wrapper.ensure_connection()
+        return self.wrapper.connection
+
+    def test_close_returns_connection_to_pool(self):
+        first = self.raw()
+        self.wrapper.close()
+        self.assertIs(self.raw(), first)
+        self.wrapper.close()
+
+    def test_closed_connection_is_not_reused(self):
+        first = self.raw()
+        self.wrapper.close()
+        first.close()
+        self.assertIsNot(self.raw(), first)
+        self.wrapper.close()
+
+    def test_connection_after_error_is_closed(self):
+        first = self.raw()
+        # ошибка БД в запросе - соединение в неизвестном состоянии
+        self.wrapper.errors_occurred = True
+        self.wrapper.close()
+        self.assertFalse(self.wrapper.pool._idle)
+        self.assertIsNot(self.raw(), first)
+        self.wrapper.close()
+
+
+class ProductionSettingsTests(SimpleTestCase):
+
+    def import_settings(self, **extra):
+        env = {key: value for key, value in os.environ.items()
+               if key != 'MUSICSHOP_SECRET_KEY'}
+        env.update(MUSICSHOP_PROFILE='production', **extra)
+        return subprocess.run(
+            [sys.executable, '-c', 'import application.settings'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+
+    def test_secret_key_required(self):
+        result = self.import_settings()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured', result.stderr)
+        result = self.import_settings(MUSICSHOP_SECRET_KEY='secret')
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+# фоновые задачи только ставятся в очередь: здесь on_commit срабатывает,
+# а файлов изображений у тестовых альбомов нет
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=False)
+class LastUnitRaceTests(TransactionTestCase):
+    """Оформление в параллельных потоках, у каждого своё соединение"""
+
+    def test_only_one_buyer_gets_last_unit(self):
+        album, carts = last_unit_buyers(buyers=4)
+        barrier = threading.Barrier(len(carts))
+        results = []
+
+        def buy(cart):
+            barrier.wait()
+            try:
+                # общая память SQLite не ждёт блокировку, а сразу
+                # отвечает ошибкой - повторяем с задержкой
+                for attempt in range(100):
+                    try:
+                        checkout(cart, **ORDER_FIELDS)
+                        results.append('order')
+                        return
+                    except OutOfStock:
+                        results.append('out_of_stock')
+                        return
+                    except OperationalError as error:
+                        if 'locked' not in str(error):
+                            results.append(repr(error))
+                            return
+                        time.sleep(0.01)
+                results.append('locked')
+            except Exception as error:
+                results.append(repr(error))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,))
+                   for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results),
+                         ['order'] + ['out_of_stock'] * (len(carts) - 1))
+        album.refresh_from_db()
+        self.assertEqual(album.stock, 0)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }},
+    PERF_SAMPLE_RATE=1.0, PERF_FLUSH_INTERVAL=0, JOBS_EAGER=True)
+class PerfReportTests(TestCase):
+    """Замеры сбрасываются в общий кэш, perfreport читает их оттуда"""
+
+    def test_report_lists_requests(self):
+        # замеры предыдущих тестов, ещё не сброшенные процессом
+        recorder.flush()
+        caches['default'].clear()
+        create_catalog()
+        for _ in range(3):
+            self.client.get('/')
+        output = io.StringIO()
+        call_command('perfreport', 'base', stdout=output)
+        self.assertRegex(output.getvalue(), r'\nbase +3 ')
+
+
+@override_settings(CACHES=TEST_CACHES, PERF_SAMPLE_RATE=1.0,
+                   PERF_SERVER_TIMING=True, PERF_FLUSH_INTERVAL=3600)
+class PerformanceMiddlewareTests(TestCase):
+
+    def test_not_adapted_under_asgi(self):
+        # синхронный middleware во главе цепочки Django обернул бы
+        # в sync_to_async(thread_sensitive=True)
+        chain = ASGIHandler()._middleware_chain
+        self.assertNotIsInstance(chain, SyncToAsync)
+        self.assertTrue(asyncio.iscoroutinefunction(chain))
+
+    def test_counts_queries_from_worker_threads(self):
+        def count_albums():
+            try:
+                return Album.objects.count()
+            finally:
+                connection.close()
+
+        async def view(request):
+            # соединение другого потока, как у sync_to_async под ASGI
+            await sync_to_async(count_albums, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = PerformanceMiddleware(view)
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class CatalogImportTests(TestCase):
+
+    def setUp(self):
+        create_catalog()
+        self.directory = Path(tempfile.mkdtemp())
+
+    def import_rows(self, kind, rows):
+        path = self.directory / f'{kind}.jsonl'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(row) + '\n' for row in rows)
+        return CatalogImporter().import_file(kind, path)
+
+    def artist_row(self, members):
+        return {'name': 'Nine Inch Nails', 'slug': 'nine-inch-nails',
+                'genre': 'industrial', 'members': members, 'image': ''}
+
+    def test_member_change_counts_as_update(self):
+        members = ['member-0', 'member-1']
+        self.assertEqual(
+            self.import_rows('artists', [self.artist_row(members)]),
+            (0, 0, 1))
+        self.assertEqual(
+            self.import_rows('artists', [self.artist_row(['member-1'])]),
+            (0, 1, 0))
+        self.assertEqual(
+            list(Artist.objects.get().members.values_list('slug', flat=True)),
+            ['member-1'])
+
+    def test_integrity_error_reports_line(self):
+        row = {'artist': 'nine-inch-nails', 'name': 'Альбом',
+               'media_type': 'CD', 'release_date': '2001-01-01',
+               'price': '10', 'stock': 1, 'image': ''}
+        with self.assertRaisesRegex(CatalogImportError,
+                                    r'albums\.jsonl:2: IntegrityError'):
+            self.import_rows('albums', [
+                {**row, 'slug': 'new-album'},
+                {**row, 'slug': 'broken-album', 'stock': -1},
+            ])
+        self.assertFalse(Album.objects.filter(slug='new-album').exists())
+
+
+@override_settings(CACHES=TEST_CACHES, JOBS_EAGER=True)
+class AdminQueryBudgetTests(TestCase):
+    """
+    Список и форма каждой админки магазина укладываются в query_budget,
+    и число запросов не растёт с числом строк на странице
+    """
+
+    def setUp(self):
+        create_catalog()
+        self.album = Album.objects.order_by('id').first()
+        Album.objects.update(stock=1000)
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'admin', password='pw'))
+
+    def add_rows(self, start, count):
+        """По count строк во всех моделях админки"""
+        content_type = ContentType.objects.get_for_model(Album)
+        for number in range(start, start + count):
+            customer = Customer.objects.create(
+                user=get_user_model().objects.create_user(f'user-{number}'),
+                phone='1')
+            customer.wishlist.add(self.album)
+            service = CartService.for_customer(customer)
+            service.add(self.album)
+            checkout(service.cart, **ORDER_FIELDS)
+            CartService.for_customer(customer).add(self.album)
+            Notification.objects.create(recipient=customer, text='Текст')
+            ImageGallery.objects.create(
+                content_type=content_type, object_id=self.album.id,
+                image=f'images/extra-{number}.jpg')
+            Member.objects.create(
+                name=f'Музыкант {number}', slug=f'extra-{number}')
+            Job.objects.create(name='storefront.rebuild')
+            MediaBlob.objects.create(name=f'blobs/{number}', size=1)
+            OrderDailyRollup.objects.create(
+                day=date(2020, 1, 1), dimension='genre', key=str(number))
+
+    def admin_pages(self):
+        for model, model_admin in admin.site._registry.items():
+            if not hasattr(model_admin, 'get_query_budget'):
+                continue
+            name = f'{model._meta.app_label}_{model._meta.model_name}'
+            pk = model._default_manager.order_by('pk').values_list(
+                'pk', flat=True).first()
+            yield (reverse(f'admin:{name}_changelist'),
+                   model_admin.get_query_budget())
+            yield (reverse(f'admin:{name}_change', args=[pk]),
+                   model_admin.get_query_budget())
+
+    def page_queries(self, url):
+        # первый запрос прогревает кэш ContentType, как в работающем
+        # процессе; кэш числа строк (CachedCountPaginator) сбрасывается
+        self.client.get(url)
+        caches['default'].clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_admin_pages(self):
+        self.add_rows(0, 1)
+        counts = {url: (self.page_queries(url), budget)
+                  for url, budget in self.admin_pages()}
+        self.add_rows(1, 10)
+        for url, (queries, budget) in counts.items():
+            with self.subTest(url=url):
+                self.assertLessEqual(queries, budget)
+                caches['default'].clear()
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
@@ -1,16 +1,57 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import (
-    LoginView, RegistrationView, BaseView, ArtistDetailView, AlbumDetailView,
-)
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        LoginView, RegistrationView, BaseView, ArtistDetailView,
+        AlbumDetailView, SearchView, CartView, AddToCartView,
+        DeleteFromCartView, ChangeQTYView, UnreadNotificationsView,
+        MarkNotificationsReadView, GenreAlbumsView, ArtistAlbumsView,
+        MediaTypeAlbumsView, CatalogFilterView, CheckoutView,
+        OrderReportView, OrderExportView,
+    )
+else:
+    from .views import (
+        LoginView, RegistrationView, BaseView, ArtistDetailView,
+        AlbumDetailView, SearchView, CartView, AddToCartView,
+        DeleteFromCartView, ChangeQTYView, UnreadNotificationsView,
+        MarkNotificationsReadView, GenreAlbumsView, ArtistAlbumsView,
+        MediaTypeAlbumsView, CatalogFilterView, CheckoutView,
+        OrderReportView, OrderExportView,
+    )
 
 urlpatterns = [
-    path('<str:artist_slug>/<str:album_slug>/', AlbumDetailView.as_view(),
-         name='album_detail'),
-    path('<str:artist_slug>/', ArtistDetailView.as_view(), name='artist_detail'),
-
+    # фиксированные пути - до слагов исполнителей, иначе они их перекроют
     path('registration/', RegistrationView.as_view(), name='registration'),
     path('login/', LoginView.as_view(), name='login'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('cart/', CartView.as_view(), name='cart'),
+    path('checkout/', CheckoutView.as_view(), name='checkout'),
+    path('cart/add/<str:album_slug>/', AddToCartView.as_view(),
+         name='add_to_cart'),
+    path('cart/remove/<str:album_slug>/', DeleteFromCartView.as_view(),
+         name='delete_from_cart'),
+    path('cart/change-qty/<str:album_slug>/', ChangeQTYView.as_view(),
+         name='change_qty'),
+    path('notifications/unread/', UnreadNotificationsView.as_view(),
+         name='unread_notifications'),
+    path('notifications/read/', MarkNotificationsReadView.as_view(),
+         name='mark_notifications_read'),
+    path('catalog/', CatalogFilterView.as_view(), name='catalog'),
+    path('reports/orders/', OrderReportView.as_view(), name='order_report'),
+    path('reports/orders/export/', OrderExportView.as_view(),
+         name='order_export'),
+    path('catalog/genre/<str:genre_slug>/', GenreAlbumsView.as_view(),
+         name='genre_albums'),
+    path('catalog/artist/<str:artist_slug>/', ArtistAlbumsView.as_view(),
+         name='artist_albums'),
+    path('catalog/media/<int:media_type_id>/', MediaTypeAlbumsView.as_view(),
+         name='media_type_albums'),
+
+    path('<str:artist_slug>/<str:album_slug>/', AlbumDetailView.as_view(),
+         name='album_detail'),
+    path('<str:artist_slug>/', ArtistDetailView.as_view(),
+         name='artist_detail'),
 
     path('', BaseView.as_view(), name='base')
 ]
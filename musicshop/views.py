@@ -1,10 +1,34 @@
-from django.contrib.auth import authenticate, login
-from django.http import HttpResponseRedirect
-from django.shortcuts import render
+import tempfile
+
+from django.contrib.auth import login
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.http import (
+    FileResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse,
+    StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
 from django.views.generic import View, DetailView
 
-from .forms import LoginForm, RegistrationsForm
-from .models import Artist, Album, Customer
+from utils.spreadsheets import (
+    CSV_CONTENT_TYPE, XLSX_CONTENT_TYPE, csv_stream, xlsx_stream)
+
+from .anonymous_cart import merge_anonymous_cart
+from .cart import clamp_qty
+from .checkout import CheckoutError, checkout
+from .facets import FacetResults, get_facet_index
+from .forms import LoginForm, OrderForm, OrderReportForm, RegistrationsForm
+from .mixins import CartMixin, CatalogPageCacheMixin, StaffRequiredMixin
+from .models import Artist, Album, Customer, Genre, MediaType
+from .notifications import mark_read, unread_count
+from .pagination import InvalidCursor, KeysetPaginator
+from .reports import default_period, export_orders, order_report
+from .search import SearchResults
+from .storefront import album_card, get_snapshot
+
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
 
 
 class LoginView(View):
@@ -20,12 +44,14 @@ class LoginView(View):
     def post(self, request, *args, **kwargs):
         form = LoginForm(request.POST or None)
         if form.is_valid():
-            username = form.cleaned_data['username']
-            password = form.cleaned_data['password']
-            user = authenticate(username=username, password=password)
-            if user:
-                login(request, user)
-                return HttpResponseRedirect('/')
+            # пароль уже проверен формой - authenticate() посчитал бы
+            # хэш ещё раз
+            with transaction.atomic():
+                login(request, form.user, backend=MODEL_BACKEND)
+                response = HttpResponseRedirect('/')
+                customer, _ = Customer.objects.get_or_create(user=form.user)
+                merge_anonymous_cart(request, response, customer)
+            return response
         context = {
             'form': form
         }
@@ -45,26 +71,23 @@ class RegistrationView(View):
     def post(self, request, *args, **kwargs):
         form = RegistrationsForm(request.POST or None)
         if form.is_valid():
-            new_user = form.save(commit=False)
-            new_user.username = form.cleaned_data['username']
-            new_user.email = form.cleaned_data['email']
-            new_user.first_name = form.cleaned_data['first_name']
-            new_user.last_name = form.cleaned_data['last_name']
-            new_user.save()
-
-            new_user.set_password(form.cleaned_data['password'])
-            new_user.save()
-            Customer.objects.create(
-                user=new_user,
-                phone=form.cleaned_data['phone'],
-                address=form.cleaned_data['address']
-            )
-            user = authenticate(
-                username=form.cleaned_data['username'],
-                password=form.cleaned_data['password']
-            )
-            login(request, user)
-            return HttpResponseRedirect('/')
+            try:
+                with transaction.atomic():
+                    new_user = form.save()
+                    customer = Customer.objects.create(
+                        user=new_user,
+                        phone=form.cleaned_data['phone'],
+                        address=form.cleaned_data['address']
+                    )
+                    login(request, new_user, backend=MODEL_BACKEND)
+                    response = HttpResponseRedirect('/')
+                    merge_anonymous_cart(request, response, customer)
+                return response
+            except IntegrityError:
+                # логин заняли параллельной регистрацией после проверки формы
+                form.add_error(
+                    'username', 'Данный логин - '
+                    f'{form.cleaned_data["username"]} уже занят')
         context = {
             'form': form
         }
@@ -72,20 +95,310 @@ class RegistrationView(View):
 
 
 class BaseView(View):
+    """Главная: витрина из готового снимка, без запросов к каталогу"""
 
     def get(self, request, *args, **kwargs):
-        return render(request, 'musicshop/base.html', {})
+        context = {
+            'storefront': get_snapshot()
+        }
+        return render(request, 'musicshop/index.html', context)
 
 
-class ArtistDetailView(DetailView):
+class ArtistDetailView(CatalogPageCacheMixin, DetailView):
     model = Artist
     template_name = 'musicshop/artist/artist_detail.html'
     slug_url_kwarg = 'artist_slug'
     context_object_name = 'artist'
+    cache_name = 'artist_detail'
+    cache_objects = (('artist', 'artist_slug'),)
 
+    def get_queryset(self):
+        return Artist.objects.for_detail()
 
-class AlbumDetailView(DetailView):
+
+class AlbumDetailView(CatalogPageCacheMixin, DetailView):
     model = Album
     template_name = 'musicshop/album/album_detail.html'
     slug_url_kwarg = 'album_slug'
     context_object_name = 'album'
+    cache_name = 'album_detail'
+    cache_objects = (('artist', 'artist_slug'), ('album', 'album_slug'))
+
+    def get_queryset(self):
+        """Альбом только в рамках исполнителя из url"""
+        return Album.objects.for_detail().filter(
+            artist__slug=self.kwargs['artist_slug'])
+
+
+class SearchView(View):
+    """Поиск по альбомам и исполнителям"""
+
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        page = None
+        if query:
+            paginator = Paginator(SearchResults(query), self.paginate_by)
+            page = paginator.get_page(request.GET.get('page'))
+        context = {
+            'query': query,
+            'page_obj': page
+        }
+        return render(request, 'musicshop/search.html', context)
+
+
+class CatalogFilterView(View):
+    """
+    Каталог с фасетным фильтром: ?genre=<slug>&media=<id>&price=<диапазон>
+    &in_stock=1, значения одного фасета можно повторять. ?format=json -
+    альбомы страницы и счётчики фасетов
+    """
+
+    paginate_by = 24
+
+    def get(self, request, *args, **kwargs):
+        index = get_facet_index()
+        filters = index.parse_filters(request.GET)
+        mask, facets = index.query(filters)
+        paginator = Paginator(FacetResults(mask), self.paginate_by)
+        page = paginator.get_page(request.GET.get('page'))
+        cards = [album_card(album) for album in page]
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'count': paginator.count,
+                'page': page.number,
+                'num_pages': paginator.num_pages,
+                'albums': cards,
+                'facets': facets
+            })
+        query = request.GET.copy()
+        query.pop('page', None)
+        context = {
+            'albums': cards,
+            'facets': facets,
+            'page_obj': page,
+            'query': query.urlencode()
+        }
+        return render(request, 'musicshop/catalog.html', context)
+
+
+class CartView(CartMixin, View):
+    """
+    Корзина: итоги берутся из строки корзины, без агрегации позиций;
+    без входа - из cookie
+    """
+
+    def get(self, request, *args, **kwargs):
+        context = {
+            'cart': self.cart_service.cart,
+            'lines': self.cart_service.lines()
+        }
+        return render(request, 'musicshop/cart.html', context)
+
+
+class AddToCartView(CartMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        album = get_object_or_404(
+            Album.objects.only('id'), slug=kwargs['album_slug'])
+        self.cart_service.add(album, _qty(request.POST.get('qty'), 1))
+        return HttpResponseRedirect(reverse('cart'))
+
+
+class DeleteFromCartView(CartMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        album = get_object_or_404(
+            Album.objects.only('id'), slug=kwargs['album_slug'])
+        self.cart_service.remove(album.id)
+        return HttpResponseRedirect(reverse('cart'))
+
+
+class ChangeQTYView(CartMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        album = get_object_or_404(
+            Album.objects.only('id'), slug=kwargs['album_slug'])
+        qty = _qty(request.POST.get('qty'), None)
+        if qty is not None:
+            self.cart_service.change_qty(album.id, qty)
+        return HttpResponseRedirect(reverse('cart'))
+
+
+def _qty(value, default):
+    """Количество из формы: целое от 0 до CART_MAX_QTY, иначе default"""
+    try:
+        qty = int(value)
+    except (TypeError, ValueError):
+        return default
+    return clamp_qty(qty) if qty >= 0 else default
+
+
+class CheckoutView(LoginRequiredMixin, CartMixin, View):
+    """Оформление заказа: товар резервируется до подтверждения заказа"""
+
+    def get(self, request, *args, **kwargs):
+        return self.render_form(OrderForm(initial={
+            'first_name': request.user.first_name,
+            'last_name': request.user.last_name
+        }))
+
+    def post(self, request, *args, **kwargs):
+        form = OrderForm(request.POST)
+        if form.is_valid():
+            try:
+                order = checkout(self.cart_service.cart, **form.cleaned_data)
+            except CheckoutError as error:
+                form.add_error(None, str(error))
+            else:
+                return render(request, 'musicshop/checkout_done.html', {
+                    'order': order,
+                    'reservations': order.reservations.select_related(
+                        'album__artist')
+                })
+        return self.render_form(form)
+
+    def render_form(self, form):
+        context = {
+            'form': form,
+            'cart': self.cart_service.cart
+        }
+        return render(self.request, 'musicshop/checkout.html', context)
+
+
+class UnreadNotificationsView(LoginRequiredMixin, View):
+    """Число непрочитанных уведомлений (значок в меню запрашивает его сам,
+    чтобы кэшируемые страницы не зависели от пользователя)"""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'unread': unread_count(request.user)})
+
+
+class MarkNotificationsReadView(LoginRequiredMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        customer = get_object_or_404(Customer, user=request.user)
+        ids = request.POST.getlist('id') or None
+        return JsonResponse({'marked': mark_read(customer, ids)})
+
+
+class AlbumListView(View):
+    """
+    Список альбомов с постраничным выводом по курсору.
+    ?order=new|old|price|price_desc, ?cursor=..., ?format=json - для
+    бесконечной прокрутки
+    """
+
+    template_name = 'musicshop/album_list.html'
+    per_page = 24
+    orderings = {
+        'new': ('release_date', True),
+        'old': ('release_date', False),
+        'price': ('price', False),
+        'price_desc': ('price', True),
+    }
+
+    def get_filter(self):
+        """(фильтр альбомов, заголовок страницы); по умолчанию - все"""
+        return {}, 'Все альбомы'
+
+    def get(self, request, *args, **kwargs):
+        album_filter, title = self.get_filter()
+        order = request.GET.get('order', 'new')
+        if order not in self.orderings:
+            order = 'new'
+        field, descending = self.orderings[order]
+        paginator = KeysetPaginator(
+            Album.objects.filter(**album_filter).select_related(
+                'artist', 'media_type'),
+            field, descending, self.per_page)
+        try:
+            albums, next_cursor = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return HttpResponseBadRequest('Некорректный курсор')
+        cards = [album_card(album) for album in albums]
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'albums': cards,
+                'next_cursor': next_cursor
+            })
+        context = {
+            'title': title,
+            'albums': cards,
+            'order': order,
+            'next_cursor': next_cursor
+        }
+        return render(request, self.template_name, context)
+
+
+class GenreAlbumsView(AlbumListView):
+
+    def get_filter(self):
+        genre = get_object_or_404(Genre, slug=self.kwargs['genre_slug'])
+        return {'artist__genre': genre}, genre.name
+
+
+class ArtistAlbumsView(AlbumListView):
+
+    def get_filter(self):
+        artist = get_object_or_404(Artist, slug=self.kwargs['artist_slug'])
+        return {'artist': artist}, artist.name
+
+
+class MediaTypeAlbumsView(AlbumListView):
+
+    def get_filter(self):
+        media_type = get_object_or_404(
+            MediaType, pk=self.kwargs['media_type_id'])
+        return {'media_type': media_type}, media_type.name
+
+
+class OrderReportView(StaffRequiredMixin, View):
+    """Отчёт по заказам за период - из итогов по дням (OrderDailyRollup)"""
+
+    def get(self, request, *args, **kwargs):
+        form = OrderReportForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        start, end = default_period()
+        start = form.cleaned_data['start'] or start
+        end = form.cleaned_data['end'] or end
+        context = order_report(start, end)
+        context['form'] = OrderReportForm(initial={'start': start, 'end': end})
+        return render(request, 'musicshop/order_report.html', context)
+
+
+class OrderExportView(StaffRequiredMixin, View):
+    """
+    Выгрузка заказов в CSV или XLSX (?format=xlsx) потоком. spool -
+    сначала записать во временный файл (для ASGI: итерацию потокового
+    ответа Django 3.2 выполняет в цикле событий, где ORM недоступен)
+    """
+
+    spool = False
+    formats = {
+        'csv': (csv_stream, CSV_CONTENT_TYPE),
+        'xlsx': (xlsx_stream, XLSX_CONTENT_TYPE),
+    }
+
+    def get(self, request, *args, **kwargs):
+        form = OrderReportForm(request.GET)
+        file_format = request.GET.get('format', 'csv')
+        if not form.is_valid() or file_format not in self.formats:
+            return HttpResponseBadRequest(form.errors.as_text()
+                                          or 'Неизвестный формат')
+        stream, content_type = self.formats[file_format]
+        header, rows = export_orders(**form.cleaned_data)
+        content = stream(header, rows)
+        filename = f'orders.{file_format}'
+        if self.spool:
+            file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+            for chunk in content:
+                file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+            file.seek(0)
+            return FileResponse(file, as_attachment=True, filename=filename,
+                                content_type=content_type)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -1 +1,8 @@
+from .generic import GenericRelationQuerySet, resolve_content_objects
 from .uploading import upload_function
+
+__all__ = [
+    'GenericRelationQuerySet',
+    'resolve_content_objects',
+    'upload_function',
+]
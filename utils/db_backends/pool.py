@@ -0,0 +1,148 @@
+"""
+Пул соединений с БД для backend'ов sqlite3_pooled и postgresql_pooled.
+
+Django закрывает соединение в конце запроса (CONN_MAX_AGE=0) или держит
+по одному на поток (CONN_MAX_AGE>0). С пулом закрытие возвращает
+соединение в общий для процесса пул, а следующий запрос в любом потоке
+берёт его оттуда без установки нового. Параметры - в DATABASES:
+
+    'POOL': {'MAX_IDLE': 10, 'MAX_LIFETIME': 3600}
+"""
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_IDLE = 10
+DEFAULT_MAX_LIFETIME = 60 * 60
+
+
+class ConnectionPool:
+    """Свободные соединения: последнее возвращённое выдаётся первым"""
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE,
+                 max_lifetime=DEFAULT_MAX_LIFETIME):
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._idle = deque()
+        self._created_at = {}  # id(соединения) -> время создания
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'reused': 0, 'closed': 0}
+
+    def _expired(self, connection):
+        created_at = self._created_at.get(id(connection), 0)
+        return (self.max_lifetime is not None
+                and time.monotonic() - created_at >= self.max_lifetime)
+
+    def _discard(self, connection):
+        self._created_at.pop(id(connection), None)
+        self.stats['closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self, connect, is_usable):
+        """Свободное рабочее соединение из пула или новое через connect()"""
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                break
+            if self._expired(connection) or not is_usable(connection):
+                self._discard(connection)
+                continue
+            self.stats['reused'] += 1
+            return connection
+        connection = connect()
+        with self._lock:
+            self._created_at[id(connection)] = time.monotonic()
+            self.stats['created'] += 1
+        return connection
+
+    def release(self, connection):
+        with self._lock:
+            keep = (len(self._idle) < self.max_idle
+                    and not self._expired(connection))
+            if keep:
+                self._idle.append(connection)
+        if not keep:
+            self._discard(connection)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """
+    Пул для alias. В ключе - и параметры подключения: после смены NAME
+    (например, тестовая БД) соединения к прежней БД не выдаются
+    """
+    key = (alias, str(settings_dict['NAME']), settings_dict['HOST'],
+           settings_dict['PORT'], settings_dict['USER'])
+    with _pools_lock:
+        if key not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[key] = ConnectionPool(
+                max_idle=options.get('MAX_IDLE', DEFAULT_MAX_IDLE),
+                max_lifetime=options.get(
+                    'MAX_LIFETIME', DEFAULT_MAX_LIFETIME))
+        return _pools[key]
+
+
+def pool_stats():
+    """{alias: {'created', 'reused', 'closed', 'idle'}} по всем пулам"""
+    stats = {}
+    with _pools_lock:
+        for (alias, *_), pool in _pools.items():
+            totals = stats.setdefault(
+                alias, {'created': 0, 'reused': 0, 'closed': 0, 'idle': 0})
+            for name, value in dict(pool.stats, idle=len(pool._idle)).items():
+                totals[name] += value
+    return stats
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Подмешивается к DatabaseWrapper backend'а: новое соединение берётся
+    из пула, закрытие возвращает его в пул. Соединение в транзакции
+    или после ошибки БД закрывается по-настоящему
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire(
+            lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(
+                conn_params),
+            self.raw_connection_is_usable)
+
+    def raw_connection_is_usable(self, connection):
+        """Соединение из пула живо: SELECT 1 через DB-API"""
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.in_atomic_block or self.errors_occurred:
+            return super()._close()
+        with self.wrap_database_errors:
+            # незавершённая транзакция не должна достаться другому запросу
+            self.connection.rollback()
+        self.pool.release(self.connection)
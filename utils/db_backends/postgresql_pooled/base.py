@@ -0,0 +1,22 @@
+"""PostgreSQL с пулом соединений (utils.db_backends.pool)"""
+from django.db.backends.postgresql import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def raw_connection_is_usable(self, connection):
+        # closed отмечает только закрытие, замеченное самим psycopg2,
+        # разрыв на стороне сервера виден лишь по запросу
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                # проверка не должна оставлять открытую транзакцию
+                connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
@@ -0,0 +1,21 @@
+"""
+SQLite с пулом соединений (utils.db_backends.pool).
+
+Для SQLite установка соединения дешёвая, поэтому backend в первую
+очередь - локальная замена postgresql_pooled: тот же пул можно
+проверить без сервера БД. Соединения SQLite в Django создаются
+с check_same_thread=False, поэтому их можно отдавать другим потокам.
+"""
+from django.db.backends.sqlite3 import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def raw_connection_is_usable(self, connection):
+        try:
+            connection.execute('SELECT 1')
+        except Exception:
+            return False
+        return True
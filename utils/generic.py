@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models.query import ModelIterable
+
+
+def resolve_content_objects(rows, field_name='content_object', related=None):
+    """
+    Заполнить GenericForeignKey у пачки строк: строки группируются по
+    content_type, объекты каждого типа загружаются одним in_bulk.
+    related - {Модель: поля для select_related}, чтобы __str__ объектов
+    не делал своих запросов. Возвращает список строк
+    """
+    rows = list(rows)
+    if not rows:
+        return rows
+    gfk = rows[0]._meta.get_field(field_name)
+    ct_attname = rows[0]._meta.get_field(gfk.ct_field).get_attname()
+    related = related or {}
+
+    ids_by_ct = defaultdict(set)
+    for row in rows:
+        ct_id = getattr(row, ct_attname)
+        if ct_id is not None:
+            ids_by_ct[ct_id].add(getattr(row, gfk.fk_field))
+
+    objects_by_ct = {}
+    for ct_id, ids in ids_by_ct.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        queryset = model._base_manager.all()
+        if related.get(model):
+            queryset = queryset.select_related(*related[model])
+        objects_by_ct[ct_id] = queryset.in_bulk(ids)
+
+    for row in rows:
+        objects = objects_by_ct.get(getattr(row, ct_attname), {})
+        gfk.set_cached_value(row, objects.get(getattr(row, gfk.fk_field)))
+    return rows
+
+
+class GenericRelationQuerySet(models.QuerySet):
+    """
+    QuerySet для моделей с content_type/object_id.
+    with_content_objects() - загрузить content_object всех строк пачкой
+    при вычислении queryset (в т.ч. после среза - в changelist админки)
+    """
+
+    _resolve_related = None
+
+    def with_content_objects(self, related=None):
+        clone = self._chain()
+        clone._resolve_related = related or {}
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._resolve_related = self._resolve_related
+        return clone
+
+    def _fetch_all(self):
+        resolve = (self._result_cache is None
+                   and self._resolve_related is not None
+                   and self._iterable_class is ModelIterable)
+        super()._fetch_all()
+        if resolve:
+            resolve_content_objects(
+                self._result_cache, related=self._resolve_related)
@@ -0,0 +1,124 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .media_storage import is_blob_name
+
+# Ширины вариантов (px) и форматы: расширение -> формат Pillow
+DEFAULT_WIDTHS = (200, 400, 800)
+DEFAULT_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+THUMBNAIL_WIDTH = 200
+
+# Оригиналы, у которых варианты уже найдены на диске (отсутствие не
+# запоминается - варианты создаёт фоновая задача после сохранения)
+_with_variants = set()
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS))
+
+
+def variant_formats():
+    return dict(getattr(settings, 'IMAGE_VARIANT_FORMATS', DEFAULT_FORMATS))
+
+
+def variant_name(name, width, extension):
+    """
+    Путь варианта рядом с оригиналом:
+    images/album_uploads/slug/slug.png -> .../slug/slug_400w.webp
+    """
+    directory, filename = posixpath.split(name)
+    stem = filename.rsplit('.', 1)[0]
+    return posixpath.join(directory, f'{stem}_{width}w.{extension}')
+
+
+def variant_names(name):
+    return [variant_name(name, width, extension)
+            for width in variant_widths() for extension in variant_formats()]
+
+
+def generate_variants(field_file):
+    """
+    Создать уменьшенные копии изображения во всех форматах.
+    Оригинал не увеличивается: если он уже меньше ширины варианта,
+    вариант сохраняется в исходном размере
+    """
+    if not field_file:
+        return []
+    storage = field_file.storage
+    # содержимое blob-а не меняется: готовые варианты не пересоздаются
+    if is_blob_name(field_file.name) and all(
+            storage.exists(name) for name in variant_names(field_file.name)):
+        return []
+    with field_file.open('rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              else 'RGB')
+
+    names = []
+    for width in variant_widths():
+        resized = image.copy()
+        resized.thumbnail((width, width * 10), Image.LANCZOS)
+        for extension, image_format in variant_formats().items():
+            output = resized
+            if image_format == 'JPEG' and output.mode != 'RGB':
+                output = output.convert('RGB')
+            buffer = BytesIO()
+            output.save(buffer, image_format, quality=82, optimize=True)
+            name = variant_name(field_file.name, width, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            names.append(storage.save(name, ContentFile(buffer.getvalue())))
+    return names
+
+
+def delete_variants(storage, name):
+    """Удалить варианты изображения (при замене или удалении оригинала)"""
+    if not name:
+        return
+    _with_variants.discard(name)
+    for variant in variant_names(name):
+        if storage.exists(variant):
+            storage.delete(variant)
+
+
+def has_variants(field_file):
+    """
+    Варианты изображения уже созданы: проверяется последний из них,
+    generate_variants пишет его последним
+    """
+    name = field_file.name
+    if name in _with_variants:
+        return True
+    if field_file.storage.exists(variant_names(name)[-1]):
+        _with_variants.add(name)
+        return True
+    return False
+
+
+def variant_url(field_file, width, extension='jpg'):
+    return field_file.storage.url(
+        variant_name(field_file.name, width, extension))
+
+
+def thumbnail_url(field_file):
+    """Миниатюра для списков и админки; пока вариантов нет - оригинал"""
+    if not field_file:
+        return ''
+    if not has_variants(field_file):
+        return field_file.url
+    return variant_url(field_file, THUMBNAIL_WIDTH)
+
+
+def srcset(field_file, extension='jpg'):
+    """Значение атрибута srcset по всем ширинам вариантов"""
+    if not field_file or not has_variants(field_file):
+        return ''
+    return ', '.join(
+        f'{variant_url(field_file, width, extension)} {width}w'
+        for width in variant_widths())
@@ -0,0 +1,112 @@
+"""
+Хранилище загруженных файлов с адресацией по содержимому.
+
+Загрузка (имя с префиксом UPLOAD_PREFIX - его выдаёт upload_function)
+пишется во временный файл с подсчётом sha256 по ходу записи и
+сохраняется под именем blobs/ab/cd/<sha256>.<ext>. Если файл с таким
+хэшем уже есть (расширение не важно), временный удаляется: одинаковые
+изображения альбомов, исполнителей и галереи лежат на диске один раз.
+Содержимое файла под таким именем не меняется, поэтому его и варианты
+(utils.images) можно кэшировать навсегда.
+
+Прочие имена - варианты изображений и файлы прежней раскладки по слагу -
+сохраняются как в FileSystemStorage. Ссылки на файлы из полей моделей
+считает musicshop.media, файлы без ссылок удаляет manage.py gc_media.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIR = 'blobs'
+UPLOAD_PREFIX = f'{BLOB_DIR}/incoming/'
+TMP_DIR = f'{BLOB_DIR}/tmp'
+
+BLOB_NAME = re.compile(
+    rf'^{BLOB_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.[a-z0-9]+)?$')
+# Файл blob-а или его вариант (..._400w.webp)
+BLOB_PATH = re.compile(
+    rf'^{BLOB_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}'
+    rf'(_\d+w)?(\.[a-z0-9]+)?$')
+
+_EXTENSION = re.compile(r'^[a-z0-9]{1,10}$')
+
+
+def upload_name(filename):
+    """Имя загрузки: от исходного имени остаётся только расширение"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if not _EXTENSION.match(extension):
+        return f'{UPLOAD_PREFIX}upload'
+    return f'{UPLOAD_PREFIX}upload.{extension}'
+
+
+def blob_name(digest, extension=''):
+    return (f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}'
+            f'{"." + extension if extension else ""}')
+
+
+def is_blob_name(name):
+    return bool(name) and BLOB_NAME.match(name) is not None
+
+
+def is_blob_path(name):
+    """Blob или его вариант: содержимое под этим именем не меняется"""
+    return bool(name) and BLOB_PATH.match(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который кладёт загрузки по хэшу содержимого"""
+
+    def get_available_name(self, name, max_length=None):
+        # итоговое имя загрузки известно только после записи
+        if name.startswith(UPLOAD_PREFIX):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not name.startswith(UPLOAD_PREFIX):
+            return super()._save(name, content)
+        extension = name.rsplit('.', 1)[-1] if '.' in name else ''
+        tmp_dir = self.path(TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        digest = digest.hexdigest()
+        existing = self._find_blob(digest)
+        if existing:
+            name, path = existing
+            os.unlink(tmp.name)
+            # свежее время - gc_media не удалит файл, на который
+            # ссылка вот-вот появится
+            os.utime(path)
+            return name
+        name = blob_name(digest, extension)
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp.name, self.file_permissions_mode)
+        os.replace(tmp.name, path)
+        return name
+
+    def _find_blob(self, digest):
+        """(имя, путь) уже сохранённого файла с этим хэшем или None"""
+        directory = posixpath.dirname(blob_name(digest))
+        try:
+            filenames = os.listdir(self.path(directory))
+        except FileNotFoundError:
+            return None
+        for filename in filenames:
+            if filename == digest or filename.startswith(digest + '.'):
+                name = f'{directory}/{filename}'
+                return name, self.path(name)
+        return None
@@ -0,0 +1,273 @@
+"""
+Статика и загруженные файлы без отдельного веб-сервера.
+
+collectstatic с CompressedManifestStaticFilesStorage пишет файлы с хэшем
+содержимого в имени (styles.3f2a….css) и рядом - сжатые заранее .gz
+и .br (brotli - если установлен пакет brotli): при запросе ничего
+не сжимается. Файлы с хэшем в имени не меняются, их можно кэшировать
+навсегда (Cache-Control: immutable).
+
+serve_static и serve_media отдают файлы через FileResponse: WSGI-сервер
+передаёт открытый файл в wsgi.file_wrapper, и gunicorn и ему подобные
+шлют его через sendfile без копирования в Python. Поддерживаются
+условные запросы (ETag, Last-Modified) и один диапазон Range - перемотка
+аудио и докачка. Диапазон до конца файла тоже идёт через sendfile,
+диапазон из середины читается блоками.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage)
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .media_storage import is_blob_path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Что имеет смысл сжимать: текстовые форматы, картинки и шрифты уже сжаты
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico',
+    '.ttf', '.otf', '.eot')
+COMPRESS_MIN_SIZE = 256
+# Сжатый вариант хранится, только если он заметно меньше оригинала
+COMPRESS_MAX_RATIO = 0.95
+
+# Предпочтение при выборе варианта: лучшее сжатие - первым
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest-хэши в именах файлов и сжатые .gz/.br варианты рядом"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # итоговые имена из манифеста: промежуточные имена проходов
+        # обработки css к этому моменту уже заменены
+        for name in sorted(set(self.hashed_files.values())):
+            yield from self.compress(name)
+
+    def url_converter(self, name, hashed_files, template=None):
+        convert = super().url_converter(name, hashed_files, template)
+
+        def converter(matchobj):
+            try:
+                return convert(matchobj)
+            except ValueError:
+                # ссылка на файл, которого нет в статике (шрифты из
+                # fontawesome.css не положены в static_dev) - остаётся
+                # как есть, а не срывает collectstatic
+                return matchobj.group(0)
+
+        return converter
+
+    def compress(self, name):
+        """Записать сжатые варианты файла; (имя, имя варианта, True)"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        with self.open(name) as file:
+            data = file.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+        variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) > len(data) * COMPRESS_MAX_RATIO:
+                continue
+            path = self.path(name + suffix)
+            with open(path, 'wb') as file:
+                file.write(compressed)
+            yield name, name + suffix, True
+
+
+@lru_cache(maxsize=1)
+def _hashed_names():
+    """Имена файлов с хэшем из манифеста collectstatic"""
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def parse_range(header, size):
+    """
+    Один диапазон из заголовка Range: (первый, последний байт).
+    None - отдать файл целиком (несколько диапазонов, другая единица
+    или синтаксическая ошибка), ValueError - диапазон вне файла (416)
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+class _RangeFile:
+    """Файл, читаемый только до конца диапазона (без fileno - без sendfile)"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _if_range_matches(request, etag, mtime):
+    """If-Range: диапазон действует, только если файл не изменился"""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == int(mtime)
+
+
+def serve_file(request, root, path, cache_control, encodings=()):
+    """
+    Отдать файл root/path. encodings - суффиксы сжатых вариантов, которые
+    можно искать рядом (для статики), Range действует только без сжатия
+    """
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    if not os.path.isfile(full_path):
+        raise Http404(path)
+    content_type, _ = mimetypes.guess_type(full_path)
+    range_header = request.META.get('HTTP_RANGE')
+
+    encoding = None
+    if encodings:
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        for name, suffix in ENCODINGS:
+            if (suffix in encodings and not range_header
+                    and name in accepted
+                    and os.path.isfile(full_path + suffix)):
+                encoding, full_path = name, full_path + suffix
+                break
+
+    stat = os.stat(full_path)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}'
+    etag += f'-{encoding}"' if encoding else '"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        size = stat.st_size
+        byte_range = None
+        if range_header and _if_range_matches(request, etag, stat.st_mtime):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file)
+        else:
+            start, end = byte_range
+            file.seek(start)
+            length = end - start + 1
+            if end < size - 1:
+                file = _RangeFile(file, length)
+            response = FileResponse(file, status=206)
+            response['Content-Length'] = length
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.block_size = 64 * 1024
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        del response['Content-Disposition']
+        if encoding:
+            response['Content-Encoding'] = encoding
+        else:
+            response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    if encodings:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def serve_static(request, path):
+    """Файл из STATIC_ROOT: с хэшем в имени - кэшируется навсегда"""
+    if path in _hashed_names():
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = (
+            f'public, max-age={getattr(settings, "STATIC_MAX_AGE", 3600)}')
+    return serve_file(request, settings.STATIC_ROOT, path, cache_control,
+                      encodings=tuple(suffix for _, suffix in ENCODINGS))
+
+
+def serve_media(request, path):
+    """Загруженный файл из MEDIA_ROOT: blob по хэшу - навсегда"""
+    if is_blob_path(path):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = (
+            f'public, max-age={getattr(settings, "MEDIA_MAX_AGE", 86400)}')
+    return serve_file(request, settings.MEDIA_ROOT, path, cache_control)
+
+
+def _url_prefix(url):
+    """Префикс пути из STATIC_URL/MEDIA_URL; None для внешнего адреса"""
+    if not url or '://' in url or url.startswith('//'):
+        return None
+    return re.escape(url.lstrip('/'))
+
+
+def file_urlpatterns():
+    """
+    url для раздачи файлов самим приложением (SERVE_FILES). В DEBUG
+    статику отдаёт staticfiles прямо из исходников, без collectstatic
+    """
+    if not getattr(settings, 'SERVE_FILES', False):
+        return []
+    patterns = []
+    static_prefix = _url_prefix(settings.STATIC_URL)
+    if static_prefix and not settings.DEBUG:
+        patterns.append(re_path(
+            rf'^{static_prefix}(?P<path>.+)$', serve_static))
+    media_prefix = _url_prefix(settings.MEDIA_URL)
+    if media_prefix:
+        patterns.append(re_path(
+            rf'^{media_prefix}(?P<path>.+)$', serve_media))
+    return patterns
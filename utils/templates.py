@@ -0,0 +1,49 @@
+"""
+Прогрев шаблонов Django: все шаблоны из каталогов загрузчиков
+компилируются заранее. С cached loader скомпилированные шаблоны остаются
+в памяти процесса, и первые запросы после запуска не разбирают шаблоны;
+без него прогрев только проверяет, что шаблоны компилируются.
+"""
+from pathlib import Path
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+TEMPLATE_SUFFIXES = ('.html', '.txt', '.xml')
+
+
+def template_names(engine):
+    """Имена всех шаблонов в каталогах загрузчиков движка"""
+    names = set()
+    for loader in engine.template_loaders:
+        # cached loader оборачивает настоящие загрузчики
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in inner.get_dirs():
+                directory = Path(directory)
+                if not directory.is_dir():
+                    continue
+                names.update(
+                    path.relative_to(directory).as_posix()
+                    for path in directory.rglob('*')
+                    if path.suffix in TEMPLATE_SUFFIXES and path.is_file())
+    return sorted(names)
+
+
+def warm_templates():
+    """
+    Скомпилировать шаблоны всех движков DjangoTemplates;
+    возвращает (число шаблонов, {имя: ошибка})
+    """
+    compiled, errors = 0, {}
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in template_names(backend.engine):
+            try:
+                backend.engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError,
+                    UnicodeDecodeError) as error:
+                errors[name] = error
+            else:
+                compiled += 1
+    return compiled, errors
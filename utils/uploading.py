@@ -1,3 +1,8 @@
+from django.conf import settings
+
+from .media_storage import upload_name
+
+
 class ImageUploadHelper:
     """
     Построение путей сохранения изображений для моделей:
@@ -55,11 +60,15 @@ class ImageUploadHelper:
 
 
 def upload_function(instance, filename):
+    # по содержимому (utils.media_storage); иначе - прежние пути по слагу
+    if getattr(settings, 'MEDIA_CONTENT_ADDRESSED', False):
+        return upload_name(filename)
     if hasattr(instance, 'content_object'):
         instance = instance.content_object
     # Получить имя поля и постфикс из FILED_TO_COMBINE_MAP
     field_to_combine, upload_postfix = ImageUploadHelper. \
         get_field_to_combine_and_upload_postfix(instance.__class__.__name__)
     # Сама инстанция
-    image = ImageUploadHelper(field_to_combine, instance, filename, upload_postfix)
+    image = ImageUploadHelper(
+        field_to_combine, instance, filename, upload_postfix)
     return image.path  # построить путь сохранения